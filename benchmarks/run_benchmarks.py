@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+"""
+Benchmark each stage of the diagnostics (finding files, opening datasets, reducing,
+rendering, reading logs, and reading the plot catalog) against synthetic cases
+written by tests/case_tree_ex.py at several scales.
+
+Each (scale, stage) pair runs in a fresh process, and reports
+* wall_time: seconds spent in the stage (setup, e.g. opening the dataset that
+             the render stage plots, is not included)
+* peak_rss_mb: peak resident memory of the process (including setup)
+* files_opened: number of times files in the synthetic case (or images and
+                catalogs written by the benchmarks) were opened
+
+Results can be saved (--save) and compared to an earlier run (--baseline); the
+script exits with status 1 if any stage regressed. Baselines depend on the machine,
+so generate one locally (e.g. on the branch you are comparing to) rather than
+committing one.
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import warnings
+
+_repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(_repo_root, "notebooks"))
+sys.path.append(os.path.join(_repo_root, "tests"))
+
+# arguments to case_tree_ex.write_case_tree() for each scale
+SCALES = dict()
+SCALES["tiny_1yr"] = dict(grid="tiny", nyears=1)
+SCALES["tiny_10yr"] = dict(grid="tiny", nyears=10)
+SCALES["g17_1yr"] = dict(grid="g17", nyears=1)
+SCALES["g17_10yr"] = dict(grid="g17", nyears=10)
+SCALES["g17_60yr"] = dict(grid="g17", nyears=60, nvars=2, nvars_3d=0)
+SCALES["t13_1yr"] = dict(grid="t13", nyears=1, nvars=2, nvars_3d=0)
+
+STAGES = ["discovery", "open", "reduce", "render", "logs", "catalog"]
+
+casename = "bench_case"
+
+# a stage regressed if it is this much (fractionally) slower / bigger than baseline
+_TOLERANCES = dict(wall_time=0.25, peak_rss_mb=0.25, files_opened=0.0)
+# ignore differences in wall time smaller than this (seconds)
+_MIN_TIME_DIFF = 0.05
+
+################################################################################
+
+
+def get_case_root(data_dir, scale):
+    """Write the synthetic case for scale (unless it was already written)"""
+    from case_tree_ex import write_case_tree
+
+    case_root = os.path.join(data_dir, scale)
+    done_path = os.path.join(case_root, ".complete")
+    kwargs = dict(SCALES[scale], ts_years=SCALES[scale]["nyears"] // 2)
+    if os.path.isfile(done_path):
+        with open(done_path) as fp:
+            if json.load(fp) == kwargs:
+                return case_root
+    print(f"Writing synthetic case for {scale}...")
+    write_case_tree(case_root, casename, **kwargs)
+    with open(done_path, "w") as fp:
+        json.dump(kwargs, fp)
+    return case_root
+
+
+################################################################################
+
+
+def _open_dataset(case, scale):
+    from case_tree_ex import gen_varnames
+
+    nyears = SCALES[scale]["nyears"]
+    varnames = gen_varnames(SCALES[scale].get("nvars", 4))
+    ds = case.gen_dataset(varnames, "pop.h", start_year=1, end_year=nyears)
+    return ds, varnames
+
+
+def _setup_stage(stage, case_root, work_dir, scale):
+    """
+    Do everything stage needs that should not be timed, and return a function
+    that runs the stage itself
+    """
+    from utils import CaseClass, generate_plot_catalog
+    from utils.Plotting import summary_plot_global_ts, summary_plot_maps, trend_plot
+
+    if stage == "discovery":
+        return lambda: CaseClass(casename, case_root)
+
+    case = CaseClass(casename, case_root)
+    if stage == "open":
+        return lambda: _open_dataset(case, scale)
+    if stage == "logs":
+        return case.get_co2calc_warning_cnt
+    if stage == "catalog":
+        return lambda: generate_plot_catalog(work_dir)
+
+    ds, varnames = _open_dataset(case, scale)
+    if stage == "reduce":
+
+        def run():
+            weights = ds["TAREA"].fillna(0)
+            for varname in varnames:
+                da = ds[varname]
+                da.weighted(weights).mean(dim=da.dims[-2:]).compute()
+
+        return run
+
+    if stage == "render":
+        plot_options = dict(save_pngs=True, root_dir=os.path.join(work_dir, "images"))
+        # 2D variables, so maps do not depend on the number of levels
+        varname = varnames[-1]
+        diag_metadata = dict(varname=varname)
+
+        def run():
+            da = ds[varname]
+            summary_plot_global_ts(ds, da, diag_metadata, **plot_options)
+            summary_plot_maps(
+                ds, da.isel(time=slice(-12, None)), diag_metadata, **plot_options
+            )
+            trend_plot(ds, da, **plot_options)
+
+        return run
+
+    raise ValueError(f"Unknown stage {stage}")
+
+
+def _count_file_opens(roots, opened):
+    """
+    Append the name of every file under any of roots that is opened to opened: Python
+    opens trigger an audit event, and netCDF4 (which opens files in C) is wrapped
+    """
+    import netCDF4
+
+    roots = tuple(os.path.join(os.path.abspath(root), "") for root in roots)
+
+    def audit_hook(event, args):
+        if event == "open" and isinstance(args[0], (str, bytes, os.PathLike)):
+            filename = os.path.abspath(os.fsdecode(args[0]))
+            if filename.startswith(roots):
+                opened.append(filename)
+
+    class _CountingDataset(netCDF4.Dataset):
+        def __init__(self, filename, *args, **kwargs):
+            audit_hook("open", (filename,))
+            super().__init__(filename, *args, **kwargs)
+
+    sys.addaudithook(audit_hook)
+    netCDF4.Dataset = _CountingDataset
+
+
+def _run_stage(stage, case_root, work_dir, scale):
+    """Runs in a fresh process: return measurements of a single stage"""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    warnings.simplefilter("ignore", FutureWarning)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        run = _setup_stage(stage, case_root, work_dir, scale)
+        opened = []
+        _count_file_opens([case_root, work_dir], opened)
+        time_beg = time.perf_counter()
+        run()
+        wall_time = time.perf_counter() - time_beg
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return dict(wall_time=wall_time, peak_rss_mb=peak_rss, files_opened=len(opened))
+
+
+def run_benchmarks(scales, stages, data_dir, repeat=1):
+    """
+    Return dict mapping scale to dict mapping stage to measurements; with repeat > 1,
+    each stage is run repeat times, and the minimum of each measurement is kept
+    """
+    results = dict()
+    mp_context = multiprocessing.get_context("spawn")
+    for scale in scales:
+        case_root = get_case_root(data_dir, scale)
+        results[scale] = dict()
+        with tempfile.TemporaryDirectory() as work_dir:
+            render_dir = None
+            for stage in stages:
+                runs = []
+                for _ in range(repeat):
+                    # render writes images, so every run needs a clean directory
+                    run_dir = tempfile.mkdtemp(dir=work_dir)
+                    if stage == "catalog" and render_dir is not None:
+                        run_dir = render_dir
+                    with mp_context.Pool(1) as pool:
+                        runs.append(
+                            pool.apply(_run_stage, (stage, case_root, run_dir, scale))
+                        )
+                    if stage == "render":
+                        render_dir = run_dir
+                results[scale][stage] = {
+                    key: min(run[key] for run in runs) for key in runs[0]
+                }
+                print(f"{scale:>10} {stage:>10}: {_format(results[scale][stage])}")
+    return results
+
+
+################################################################################
+
+
+def _format(measurements):
+    return (
+        f"{measurements['wall_time']:8.3f} s, "
+        f"{measurements['peak_rss_mb']:8.1f} MB, "
+        f"{measurements['files_opened']:6d} files"
+    )
+
+
+def compare_results(results, baseline, tolerances=_TOLERANCES):
+    """
+    Return list of (scale, stage, measurement, baseline value, new value) for every
+    measurement that is worse than baseline by more than its tolerance
+    """
+    regressions = []
+    for scale, stages in results.items():
+        for stage, measurements in stages.items():
+            base = baseline.get(scale, {}).get(stage)
+            if base is None:
+                continue
+            for key, tolerance in tolerances.items():
+                if key not in base:
+                    continue
+                if measurements[key] <= base[key] * (1.0 + tolerance):
+                    continue
+                if (
+                    key == "wall_time"
+                    and measurements[key] - base[key] < _MIN_TIME_DIFF
+                ):
+                    continue
+                regressions.append((scale, stage, key, base[key], measurements[key]))
+    return regressions
+
+
+################################################################################
+
+
+def _parse_args():
+    """ Parse command line arguments """
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the diagnostics against synthetic cases",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "--scales",
+        action="store",
+        dest="scales",
+        type=str,
+        nargs="+",
+        choices=list(SCALES),
+        default=["tiny_1yr", "tiny_10yr", "g17_1yr"],
+        help="Sizes of synthetic case to benchmark against",
+    )
+
+    parser.add_argument(
+        "--stages",
+        action="store",
+        dest="stages",
+        type=str,
+        nargs="+",
+        choices=STAGES,
+        default=STAGES,
+        help="Stages to benchmark (catalog reads the images written by render)",
+    )
+
+    parser.add_argument(
+        "--data-dir",
+        action="store",
+        dest="data_dir",
+        type=str,
+        default=os.path.join(tempfile.gettempdir(), "cesm_diag_benchmarks"),
+        help="Where synthetic cases are written (and reused by later runs)",
+    )
+
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        action="store",
+        dest="repeat",
+        type=int,
+        default=1,
+        help="Run each stage this many times and keep the best measurements",
+    )
+
+    parser.add_argument(
+        "--save",
+        action="store",
+        dest="save",
+        type=str,
+        default=None,
+        help="Write results to this JSON file",
+    )
+
+    parser.add_argument(
+        "--baseline",
+        action="store",
+        dest="baseline",
+        type=str,
+        default=None,
+        help="Compare results to this JSON file (written by --save)",
+    )
+
+    return parser.parse_args()
+
+
+###################
+
+if __name__ == "__main__":
+    args = _parse_args()
+    results = run_benchmarks(args.scales, args.stages, args.data_dir, args.repeat)
+
+    if args.save:
+        with open(args.save, "w") as fp:
+            json.dump(
+                dict(
+                    date=datetime.datetime.now().isoformat(),
+                    platform=platform.platform(),
+                    python=platform.python_version(),
+                    results=results,
+                ),
+                fp,
+                indent=2,
+            )
+
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)["results"]
+        regressions = compare_results(results, baseline)
+        for scale, stage, key, base, new in regressions:
+            print(
+                f"REGRESSION in {scale} {stage}: {key} went from {base:.3f} to {new:.3f}"
+            )
+        if regressions:
+            sys.exit(1)
+        print("No regressions")
@@ -0,0 +1,335 @@
+"""
+    Classes that run reshaping jobs on a batch system (SLURM, PBS) or locally
+
+    A job is a dict with the arguments of reshaper.reshape_year(): case, archive_root,
+    output_root, stream, year, and (optionally) varnames. Batch schedulers submit the
+    {stream}_t13.sh scripts; the local scheduler runs reshaper.reshape_year() in a
+    pool of processes. All schedulers use the .DONE.{case}.{stream}.{year} markers
+    to tell which jobs have already finished.
+"""
+
+import hashlib
+import multiprocessing
+import os
+import shutil
+import subprocess
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import reshaper
+
+################################################################################
+
+
+def get_job_name(job):
+    """e.g. pop.h.0001, or pop.h.0001.{hash} for a subset of variables"""
+    name = f"{job['stream']}.{job['year']:04}"
+    if job.get("varnames"):
+        name += "." + hashlib.sha1(",".join(job["varnames"]).encode()).hexdigest()[:8]
+    return name
+
+
+################################################################################
+
+
+class _SchedulerBaseClass(object):
+    def __init__(self, dryrun=False):
+        self.dryrun = dryrun
+        self._jobs = dict()
+
+    def get_done_path(self, job):
+        """Path of the marker file written when job is complete"""
+        return reshaper.get_done_path(
+            job["output_root"], job["case"], job["stream"], job["year"]
+        )
+
+    def get_timeseries_path(self, job, varname):
+        """Path of the time series file job writes for varname"""
+        return reshaper.get_timeseries_path(
+            job["output_root"], job["case"], job["stream"], job["year"], varname
+        )
+
+    def is_done(self, job):
+        """
+            A job is done if its .DONE marker exists; a job converting a subset of
+            variables is done if all of its time series files exist
+        """
+        if os.path.isfile(self.get_done_path(job)):
+            return True
+        if job.get("varnames"):
+            return all(
+                os.path.isfile(self.get_timeseries_path(job, varname))
+                for varname in job["varnames"]
+            )
+        return False
+
+    def submit(self, job, force=False):
+        """
+            Submit job, unless it is already done; returns job name
+
+            force: submit job even if it is marked as done (e.g. jobs from the
+                   planner, which found time series files missing); the stale
+                   .DONE marker is removed, because the job (and the *_t13.sh
+                   scripts) would otherwise skip the year
+        """
+        name = get_job_name(job)
+        self._jobs[name] = dict(job=job, status=None, attempts=0, error=None)
+        done_path = self.get_done_path(job)
+        if force and os.path.isfile(done_path):
+            if self.dryrun:
+                print(f"Would remove {done_path}")
+            else:
+                print(f"Removing {done_path}")
+                os.remove(done_path)
+        elif self.is_done(job):
+            self._jobs[name]["status"] = "done"
+            print(f"{job['case']}.{name} is already done")
+            return name
+        self._submit(name, job)
+        return name
+
+    def _submit(self, name, job):
+        raise NotImplementedError("This must be implemented in child class")
+
+    def wait(self):
+        """
+            Return a dict mapping job name to its status ("done", "submitted",
+            "incomplete", "failed"), number of attempts, and last error (if any)
+        """
+        return {
+            name: {key: value for key, value in entry.items() if key != "job"}
+            for name, entry in self._jobs.items()
+        }
+
+
+################################################################################
+
+
+class _BatchSchedulerBaseClass(_SchedulerBaseClass):
+    def __init__(self, proc_base=None, script_dir=None, dryrun=False):
+        """
+            proc_base: directory the *_t13.sh scripts write to; their .DONE markers
+                       are in {proc_base}/{case}/{stream}/proc, and time series
+                       in {proc_base}/{case}/{stream}/proc/COMPLETED
+                       (default: /glade/scratch/{USER}/T13)
+            script_dir: directory containing the *_t13.sh scripts
+                        (default: directory containing this file)
+        """
+        super().__init__(dryrun)
+        if proc_base is None:
+            proc_base = os.path.join(
+                os.sep, "glade", "scratch", os.environ.get("USER", ""), "T13"
+            )
+        if script_dir is None:
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+        self.proc_base = proc_base
+        self.script_dir = script_dir
+
+    def get_proc_dir(self, job):
+        """Working directory of the *_t13.sh script for the stream of job"""
+        return os.path.join(self.proc_base, job["case"], job["stream"], "proc")
+
+    def get_done_path(self, job):
+        return os.path.join(
+            self.get_proc_dir(job),
+            f".DONE.{job['case']}.{job['stream']}.{job['year']:04}",
+        )
+
+    def get_timeseries_path(self, job, varname):
+        # the scripts write time series to proc/COMPLETED, with the same file
+        # names as reshaper.py
+        return os.path.join(
+            self.get_proc_dir(job),
+            "COMPLETED",
+            os.path.basename(super().get_timeseries_path(job, varname)),
+        )
+
+    def get_script(self, job):
+        if job.get("varnames"):
+            raise ValueError("The *_t13.sh scripts can only convert every variable")
+        return os.path.join(self.script_dir, f"{job['stream']}_t13.sh")
+
+    def get_command(self, name, job):
+        raise NotImplementedError("This must be implemented in child class")
+
+    def _submit(self, name, job):
+        cmd = self.get_command(name, job)
+        self._jobs[name]["attempts"] += 1
+        if self.dryrun:
+            print(f"Command to run: {' '.join(cmd)}")
+            self._jobs[name]["status"] = "dry-run"
+            return
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            self._jobs[name]["status"] = "failed"
+            self._jobs[name]["error"] = proc.stderr
+            print(f"Could not submit {name}: {proc.stderr}")
+        else:
+            self._jobs[name]["status"] = "submitted"
+            print(proc.stdout.strip())
+            self._submitted(job, proc.stdout.strip())
+
+    def _submitted(self, job, stdout):
+        """Called with the output of the submit command of each submitted job"""
+        pass
+
+
+################################################################################
+
+
+class SlurmSchedulerClass(_BatchSchedulerBaseClass):
+    def __init__(self, send_mail=True, **kwargs):
+        super().__init__(**kwargs)
+        self.send_mail = send_mail
+
+    def get_command(self, name, job):
+        mail_opt = (
+            ["--mail-type=ALL", f"--mail-user={os.environ['USER']}@ucar.edu"]
+            if self.send_mail
+            else ["--mail-type=NONE"]
+        )
+        # note: the --dependency=singleton option means only one job per job name
+        #       The *_t13.sh scripts share a working directory per stream, so
+        #       running two years of the same stream at once clobbers temporary files
+        return (
+            ["sbatch"]
+            + mail_opt
+            + ["--dependency=singleton", self.get_script(job)]
+            + [job["case"], job["archive_root"], f"{job['year']:04}"]
+        )
+
+
+################################################################################
+
+
+class PBSSchedulerClass(_BatchSchedulerBaseClass):
+    def __init__(
+        self,
+        account=None,
+        queue=None,
+        select="4:ncpus=16:mpiprocs=16:mem=100GB",
+        walltime="24:00:00",
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.account = account
+        self.queue = queue
+        self.select = select
+        self.walltime = walltime
+        # id of the last job submitted for each (case, stream)
+        self._last_job_id = dict()
+
+    def get_command(self, name, job):
+        cmd = ["qsub", "-N", name, "-j", "oe"]
+        # note: PBS has no singleton dependency, so each job waits for the previous
+        #       job of its stream instead. The *_t13.sh scripts share a working
+        #       directory per stream, so running two years of the same stream at
+        #       once clobbers temporary files
+        last_job_id = self._last_job_id.get((job["case"], job["stream"]))
+        if last_job_id is not None:
+            cmd += ["-W", f"depend=afterany:{last_job_id}"]
+        cmd += ["-l", f"select={self.select}", "-l", f"walltime={self.walltime}"]
+        if self.account is not None:
+            cmd += ["-A", self.account]
+        if self.queue is not None:
+            cmd += ["-q", self.queue]
+        return cmd + [
+            "--",
+            self.get_script(job),
+            job["case"],
+            job["archive_root"],
+            f"{job['year']:04}",
+        ]
+
+    def _submitted(self, job, stdout):
+        # qsub prints the id of the job it submitted
+        self._last_job_id[(job["case"], job["stream"])] = stdout.split()[-1]
+
+
+################################################################################
+
+
+def _run_local_job(job, scratch_dir, nprocs):
+    """Runs in a worker process: convert one year of one stream"""
+    files_written = reshaper.reshape_year(
+        job["case"],
+        job["archive_root"],
+        job["output_root"],
+        job["stream"],
+        job["year"],
+        varnames=job.get("varnames"),
+        nprocs=nprocs,
+        scratch_dir=scratch_dir,
+    )
+    shutil.rmtree(scratch_dir, ignore_errors=True)
+    return len(files_written)
+
+
+class LocalSchedulerClass(_SchedulerBaseClass):
+    def __init__(
+        self, scratch_root, max_jobs=None, nprocs_per_job=1, retries=2, dryrun=False
+    ):
+        """
+            scratch_root: each job writes its files in its own {scratch_root}/{job name}
+                          directory, and moves them into place when they are complete
+            max_jobs: maximum number of jobs running at once (default: number of cores)
+            nprocs_per_job: number of processes each job uses to write variables
+            retries: number of times a job that raises an exception is run again
+        """
+        super().__init__(dryrun)
+        if max_jobs is None:
+            max_jobs = os.cpu_count()
+        self.scratch_root = scratch_root
+        self.max_jobs = max_jobs
+        self.nprocs_per_job = nprocs_per_job
+        self.retries = retries
+        self._executor = None
+        self._futures = dict()
+
+    def _submit(self, name, job):
+        if self.dryrun:
+            print(f"Would run {job['case']}.{name} locally")
+            self._jobs[name]["status"] = "dry-run"
+            return
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_jobs,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        self._jobs[name]["attempts"] += 1
+        self._jobs[name]["status"] = "submitted"
+        scratch_dir = os.path.join(
+            self.scratch_root, f"{name}.{self._jobs[name]['attempts']}"
+        )
+        future = self._executor.submit(
+            _run_local_job, job, scratch_dir, self.nprocs_per_job
+        )
+        self._futures[future] = name
+
+    def wait(self):
+        """
+            Wait for all submitted jobs (running failed jobs again, up to retries
+            times), then return the status of each job (see _SchedulerBaseClass.wait())
+        """
+        while self._futures:
+            finished, _ = wait(list(self._futures), return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = self._futures.pop(future)
+                entry = self._jobs[name]
+                err = future.exception()
+                if err is not None:
+                    entry["error"] = "".join(
+                        traceback.format_exception(type(err), err, err.__traceback__)
+                    )
+                    if entry["attempts"] <= self.retries:
+                        print(f"{name} failed (attempt {entry['attempts']}), retrying")
+                        self._submit(name, entry["job"])
+                    else:
+                        entry["status"] = "failed"
+                    continue
+                # e.g. a year without the expected number of history files
+                entry["status"] = "done" if self.is_done(entry["job"]) else "incomplete"
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        return super().wait()
@@ -0,0 +1,176 @@
+"""
+Plan the reshaping jobs needed to bring time series up to date with history files
+
+The *_t13.sh scripts (and reshaper.reshape_year) convert an entire year at a time,
+and skip a year once its .DONE marker exists. The planner instead compares the
+variables in the history files of each (stream, year) to the time series files
+that already exist, so a year that is missing a few variables is only converted
+for those variables, a year whose .DONE marker is stale (time series files are
+missing) is converted again, and years without the expected number of history
+files (e.g. a run that is still going, or a daily stream with a missing day) are
+reported rather than submitted.
+
+Time series files and .DONE markers are looked for where the scheduler that runs
+the jobs writes them (see SchedulerClass.py); reshaper.py's layout by default.
+"""
+
+import glob
+import os
+
+from reshaper import (
+    _STREAMS,
+    classify_variables,
+    get_done_path,
+    get_history_files,
+    get_timeseries_path,
+)
+
+################################################################################
+
+
+def get_timeseries_varnames(output_root, case, stream, year):
+    """Return sorted list of variables with a time series file for one year of stream"""
+    return _glob_varnames(get_timeseries_path(output_root, case, stream, year, "*"))
+
+
+def _glob_varnames(pattern):
+    """Return sorted list of variables matching pattern, a time series path with *"""
+    prefix, suffix = os.path.basename(pattern).split("*")
+    varnames = []
+    for filename in glob.glob(pattern):
+        varname = os.path.basename(filename)[len(prefix) : -len(suffix)]
+        # e.g. {case}.pop.h.nday1.* files in a directory with {case}.pop.h.* files
+        if "." not in varname:
+            varnames.append(varname)
+    return sorted(varnames)
+
+
+################################################################################
+
+
+def plan_year(
+    case, archive_root, output_root, stream, year, allow_subsets=True, scheduler=None
+):
+    """
+    Compare history and time series inventories for one year of stream.
+
+    allow_subsets: if False, years missing some variables are converted in full
+                   (the *_t13.sh scripts can not convert a subset of variables)
+    scheduler: SchedulerClass object the jobs are submitted to, which determines
+               where time series files and .DONE markers are (default: the
+               reshaper.py layout under output_root)
+
+    Returns a dict with keys case, stream, year, status, marked_done, history_files,
+    expected_files, missing_vars, and job (arguments for reshape_year, or None if
+    nothing needs to be done). status is one of
+    * "done": the year is marked as done, and no time series are missing (or
+              there are no history files to check against)
+    * "no history": there are no history files for this year
+    * "partial year": there are fewer history files than the stream expects
+    * "extra files": there are more history files than the stream expects
+    * "complete": every variable has a time series (but the year is not marked done)
+    * "missing variables": some variables do not have time series
+    * "not started": no variables have time series
+    A year can be marked done and still be missing variables, e.g. if time series
+    files were removed; submit its job with force=True to clear the marker.
+    """
+    job = dict(
+        case=case,
+        archive_root=archive_root,
+        output_root=output_root,
+        stream=stream,
+        year=year,
+    )
+    if scheduler is None:
+        done_path = get_done_path(output_root, case, stream, year)
+        ts_pattern = get_timeseries_path(output_root, case, stream, year, "*")
+    else:
+        done_path = scheduler.get_done_path(job)
+        ts_pattern = scheduler.get_timeseries_path(job, "*")
+
+    history_filenames = get_history_files(case, archive_root, stream, year)
+    record = dict(
+        case=case,
+        stream=stream,
+        year=year,
+        status=None,
+        marked_done=os.path.isfile(done_path),
+        history_files=len(history_filenames),
+        expected_files=_STREAMS[stream]["nfiles"],
+        missing_vars=[],
+        job=None,
+    )
+    # without a full year of history files, there is nothing to compare to
+    if record["history_files"] != record["expected_files"] and record["marked_done"]:
+        record["status"] = "done"
+        return record
+    if not history_filenames:
+        record["status"] = "no history"
+        return record
+    if record["history_files"] < record["expected_files"]:
+        record["status"] = "partial year"
+        return record
+    if record["history_files"] > record["expected_files"]:
+        record["status"] = "extra files"
+        return record
+
+    time_vars, _, _ = classify_variables(history_filenames[0])
+    ts_varnames = _glob_varnames(ts_pattern)
+    record["missing_vars"] = [
+        varname for varname in time_vars if varname not in ts_varnames
+    ]
+    if not record["missing_vars"]:
+        record["status"] = "done" if record["marked_done"] else "complete"
+        return record
+
+    record["job"] = job
+    if len(record["missing_vars"]) == len(time_vars):
+        record["status"] = "not started"
+    else:
+        record["status"] = "missing variables"
+        if allow_subsets:
+            record["job"]["varnames"] = record["missing_vars"]
+    return record
+
+
+def plan(
+    case,
+    archive_root,
+    output_root,
+    years,
+    streams=None,
+    allow_subsets=True,
+    scheduler=None,
+):
+    """
+    Run plan_year() for every (year, stream) pair
+
+    Returns (jobs, records): the list of jobs that need to run (to pass to a
+    SchedulerClass object) and the list of dicts returned by plan_year()
+    """
+    if streams is None:
+        streams = list(_STREAMS)
+    records = [
+        plan_year(
+            case, archive_root, output_root, stream, year, allow_subsets, scheduler
+        )
+        for year in years
+        for stream in streams
+    ]
+    jobs = [record["job"] for record in records if record["job"] is not None]
+    return jobs, records
+
+
+def print_plan(records):
+    """Print one line per (year, stream) pair that is not done"""
+    for record in records:
+        if record["status"] == "done":
+            continue
+        msg = f"{record['case']}.{record['stream']}.{record['year']:04}: {record['status']}"
+        if record["status"] in ["partial year", "extra files"]:
+            msg += f" ({record['history_files']} of {record['expected_files']} history files)"
+        elif record["status"] == "missing variables":
+            msg += f" ({', '.join(record['missing_vars'])})"
+        if record["job"] is not None and record["marked_done"]:
+            msg += " [stale .DONE marker]"
+        print(msg)
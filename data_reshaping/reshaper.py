@@ -0,0 +1,411 @@
+#!/usr/bin/env python
+"""
+Convert a year of CESM history files to single-variable time series files
+
+Replaces the Transpose_Data step of the *_t13.sh scripts: time series are written to
+{output_root}/{comp}/proc/tseries/{freq}/{case}.{stream}.{varname}.{dates}.nc
+(the layout CaseClass expects), in compressed netCDF-4 classic format (NCFORMAT=netcdf4c).
+Each output file contains one time-varying variable, time, its bounds, and every
+time-invariant variable from the history files.
+
+Variables are split into groups, and each group is written by its own process.
+Every process opens each history file once (in time order) and copies its variables
+one 2D slab at a time, so memory use does not depend on the length of the run or
+on the number of vertical levels.
+"""
+
+import glob
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import netCDF4
+import numpy as np
+
+# Expected number of history files per year, and the date string in time series names
+_STREAMS = dict()
+_STREAMS["pop.h"] = dict(
+    comp="ocn", freq="month_1", nfiles=12, dates="{year}01-{year}12"
+)
+_STREAMS["pop.h.nday1"] = dict(
+    comp="ocn", freq="day_1", nfiles=12, dates="{year}0101-{year}1231"
+)
+_STREAMS["pop.h.nyear1"] = dict(
+    comp="ocn", freq="year_1", nfiles=1, dates="{year}-{year}"
+)
+_STREAMS["cice.h"] = dict(
+    comp="ice", freq="month_1", nfiles=12, dates="{year}01-{year}12"
+)
+_STREAMS["cice.h1"] = dict(
+    comp="ice", freq="day_1", nfiles=365, dates="{year}0101-{year}1231"
+)
+
+################################################################################
+
+
+def get_history_files(case, archive_root, stream, year):
+    """Return sorted list of history files for one year of stream"""
+    hist_dir = os.path.join(archive_root, case, _STREAMS[stream]["comp"], "hist")
+    return sorted(glob.glob(os.path.join(hist_dir, f"{case}.{stream}.{year:04}*nc")))
+
+
+def get_timeseries_dir(output_root, stream):
+    """Return directory CaseClass looks in for time series files from stream"""
+    return os.path.join(
+        output_root,
+        _STREAMS[stream]["comp"],
+        "proc",
+        "tseries",
+        _STREAMS[stream]["freq"],
+    )
+
+
+def get_timeseries_path(output_root, case, stream, year, varname):
+    dates = _STREAMS[stream]["dates"].format(year=f"{year:04}")
+    return os.path.join(
+        get_timeseries_dir(output_root, stream), f"{case}.{stream}.{varname}.{dates}.nc"
+    )
+
+
+def get_done_path(output_root, case, stream, year):
+    """Same marker the *_t13.sh scripts use to note a completed year"""
+    return os.path.join(
+        get_timeseries_dir(output_root, stream), f".DONE.{case}.{stream}.{year:04}"
+    )
+
+
+################################################################################
+
+
+def classify_variables(history_filename):
+    """
+    Return (time_vars, invariant_vars, bounds_name) from a history file header:
+    variables with a time dimension (other than time and its bounds), variables
+    without one, and the name of the time bounds variable (or None)
+    """
+    with netCDF4.Dataset(history_filename) as ds:
+        bounds_name = getattr(ds.variables["time"], "bounds", None)
+        time_vars = []
+        invariant_vars = []
+        for varname, var in ds.variables.items():
+            if varname in ["time", bounds_name]:
+                continue
+            if "time" not in var.dimensions:
+                invariant_vars.append(varname)
+            elif var.dimensions[0] == "time":
+                time_vars.append(varname)
+            else:
+                raise ValueError(f"time is not the first dimension of {varname}")
+    return time_vars, invariant_vars, bounds_name
+
+
+def _copy_var_def(ds_in, ds_out, varname, complevel):
+    """Define varname in ds_out (creating any missing dimensions) and copy attributes"""
+    var_in = ds_in.variables[varname]
+    for dim in var_in.dimensions:
+        if dim not in ds_out.dimensions:
+            ds_out.createDimension(
+                dim, None if dim == "time" else len(ds_in.dimensions[dim])
+            )
+    chunksizes = None
+    if len(var_in.dimensions) > 2 and var_in.dimensions[0] == "time":
+        # one chunk per 2D slab, which is how the data is written
+        chunksizes = [1] * (len(var_in.dimensions) - 2) + list(var_in.shape[-2:])
+    var_out = ds_out.createVariable(
+        varname,
+        var_in.datatype,
+        var_in.dimensions,
+        zlib=complevel > 0,
+        complevel=complevel,
+        shuffle=complevel > 0,
+        chunksizes=chunksizes,
+        fill_value=getattr(var_in, "_FillValue", None),
+    )
+    var_out.setncatts(
+        {att: var_in.getncattr(att) for att in var_in.ncattrs() if att != "_FillValue"}
+    )
+    return var_out
+
+
+def _set_raw(ds):
+    """copy values as stored in the file: no masking, scaling, or char conversion"""
+    ds.set_auto_maskandscale(False)
+    ds.set_auto_chartostring(False)
+
+
+def _copy_time_slices(var_in, var_out, t_out):
+    """Copy var_in into var_out starting at time index t_out, one 2D slab at a time"""
+    for t_in in range(var_in.shape[0]):
+        if var_in.ndim <= 2:
+            var_out[t_out + t_in] = var_in[t_in]
+            continue
+        for ind in np.ndindex(*var_in.shape[1:-2]):
+            var_out[(t_out + t_in,) + ind] = var_in[(t_in,) + ind]
+
+
+def _get_tmp_path(path, scratch_dir):
+    """files are written to scratch_dir (or next to path) and moved when complete"""
+    if scratch_dir is None:
+        return f"{path}.tmp"
+    return os.path.join(scratch_dir, os.path.basename(path))
+
+
+def _write_timeseries_group(
+    history_filenames, paths, invariant_vars, bounds_name, complevel, scratch_dir
+):
+    """
+    Runs in a worker process: write one time series file for each varname in paths
+    (a dict mapping varname to output path), reading each history file once
+    """
+    ds_outs = dict()
+    try:
+        with netCDF4.Dataset(history_filenames[0]) as ds_in:
+            _set_raw(ds_in)
+            invariant_values = {
+                name: ds_in.variables[name][...] for name in invariant_vars
+            }
+            for varname, path in paths.items():
+                ds_out = netCDF4.Dataset(
+                    _get_tmp_path(path, scratch_dir), "w", format="NETCDF4_CLASSIC"
+                )
+                ds_outs[varname] = ds_out
+                ds_out.setncatts({att: ds_in.getncattr(att) for att in ds_in.ncattrs()})
+                for name in ["time", bounds_name, varname] + invariant_vars:
+                    if name is not None:
+                        _copy_var_def(ds_in, ds_out, name, complevel)
+                _set_raw(ds_out)
+                for name, values in invariant_values.items():
+                    ds_out.variables[name][...] = values
+
+        t_out = 0
+        for history_filename in history_filenames:
+            with netCDF4.Dataset(history_filename) as ds_in:
+                _set_raw(ds_in)
+                nt = len(ds_in.dimensions["time"])
+                for varname, ds_out in ds_outs.items():
+                    for name in ["time", bounds_name, varname]:
+                        if name is not None:
+                            _copy_time_slices(
+                                ds_in.variables[name], ds_out.variables[name], t_out
+                            )
+            t_out += nt
+    finally:
+        for ds_out in ds_outs.values():
+            ds_out.close()
+
+    # only move files into place once every file is complete
+    for path in paths.values():
+        shutil.move(_get_tmp_path(path, scratch_dir), path)
+    return list(paths.values())
+
+
+################################################################################
+
+
+def reshape_year(
+    case,
+    archive_root,
+    output_root,
+    stream,
+    year,
+    varnames=None,
+    nprocs=None,
+    complevel=1,
+    overwrite=False,
+    scratch_dir=None,
+):
+    """
+    Convert one year of history files from stream to time series files,
+    writing variables in parallel with nprocs processes (default: number of cores).
+    varnames: only write time series for these variables (default: all of them)
+    scratch_dir: directory for files that are being written (default: write
+                 {filename}.tmp in the output directory)
+
+    Returns list of files written; nothing is done (and an empty list is returned)
+    if the year is already marked as done, or if the year does not have the
+    expected number of history files.
+    """
+    done_path = get_done_path(output_root, case, stream, year)
+    if os.path.isfile(done_path) and not overwrite:
+        print(f"{case}.{stream}.{year:04} has already been converted")
+        return []
+
+    history_filenames = get_history_files(case, archive_root, stream, year)
+    nfiles = _STREAMS[stream]["nfiles"]
+    if len(history_filenames) != nfiles:
+        print(
+            f"File count mismatch on {case}.{stream}.{year:04}: {len(history_filenames)} instead of {nfiles}"
+        )
+        return []
+
+    time_vars, invariant_vars, bounds_name = classify_variables(history_filenames[0])
+    if varnames is not None:
+        unknown_vars = [varname for varname in varnames if varname not in time_vars]
+        if unknown_vars:
+            raise ValueError(
+                f"{unknown_vars} are not time-varying variables in {stream}"
+            )
+        time_vars = [varname for varname in time_vars if varname in varnames]
+
+    os.makedirs(get_timeseries_dir(output_root, stream), exist_ok=True)
+    if nprocs is None:
+        nprocs = os.cpu_count()
+    nprocs = max(1, min(nprocs, len(time_vars)))
+    groups = [dict() for _ in range(nprocs)]
+    for ind, varname in enumerate(time_vars):
+        groups[ind % nprocs][varname] = get_timeseries_path(
+            output_root, case, stream, year, varname
+        )
+
+    if scratch_dir is not None:
+        os.makedirs(scratch_dir, exist_ok=True)
+    args = (history_filenames, invariant_vars, bounds_name, complevel, scratch_dir)
+    files_written = []
+    if nprocs == 1:
+        for paths in groups:
+            files_written.extend(_write_timeseries_group(args[0], paths, *args[1:]))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=nprocs, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = [
+                executor.submit(_write_timeseries_group, args[0], paths, *args[1:])
+                for paths in groups
+            ]
+            for future in futures:
+                files_written.extend(future.result())
+
+    # A subset of variables does not complete the year
+    if varnames is None:
+        with open(done_path, "w"):
+            pass
+    return files_written
+
+
+################################################################################
+
+
+def _parse_args():
+    """ Parse command line arguments """
+
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Convert history files to single-variable time series files",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    # Required: specify case and year
+    parser.add_argument(
+        "-c",
+        "--case",
+        action="store",
+        dest="case",
+        type=str,
+        required=True,
+        help="Case to convert to time series",
+    )
+    parser.add_argument(
+        "-y",
+        "--years",
+        action="store",
+        dest="years",
+        type=int,
+        required=True,
+        nargs="+",
+        help="Year(s) of run to convert to time series",
+    )
+
+    # Required: location of DOUT_S_ROOT
+    parser.add_argument(
+        "-a",
+        "--archive-root",
+        action="store",
+        dest="archive_root",
+        type=str,
+        required=True,
+        help="base of DOUT_S_ROOT (history files are in {archive_root}/{case}/{comp}/hist)",
+    )
+
+    # Optional: where to write time series (default: {archive_root}/{case})
+    parser.add_argument(
+        "-o",
+        "--output-root",
+        action="store",
+        dest="output_root",
+        type=str,
+        default=None,
+        help="time series are written to {output_root}/{comp}/proc/tseries/{freq}",
+    )
+
+    # Optional: which streams to convert
+    parser.add_argument(
+        "-s",
+        "--streams",
+        action="store",
+        dest="streams",
+        type=str,
+        nargs="+",
+        default=list(_STREAMS),
+        choices=list(_STREAMS),
+        help="History streams to convert",
+    )
+
+    # Optional: only convert some variables
+    parser.add_argument(
+        "-v",
+        "--varnames",
+        action="store",
+        dest="varnames",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Only convert these variables (default: all variables)",
+    )
+
+    # Optional: number of processes
+    parser.add_argument(
+        "-n",
+        "--nprocs",
+        action="store",
+        dest="nprocs",
+        type=int,
+        default=None,
+        help="Number of processes writing time series (default: number of cores)",
+    )
+
+    # Optional: compression level
+    parser.add_argument(
+        "--complevel",
+        action="store",
+        dest="complevel",
+        type=int,
+        default=1,
+        help="zlib compression level (0 to disable compression)",
+    )
+
+    return parser.parse_args()
+
+
+###################
+
+if __name__ == "__main__":
+    args = _parse_args()
+    output_root = args.output_root
+    if output_root is None:
+        output_root = os.path.join(args.archive_root, args.case)
+    for year in args.years:
+        for stream in args.streams:
+            print(f"Reshaping {stream} for year {year:04} of {args.case}...")
+            files_written = reshape_year(
+                args.case,
+                args.archive_root,
+                output_root,
+                stream,
+                year,
+                varnames=args.varnames,
+                nprocs=args.nprocs,
+                complevel=args.complevel,
+            )
+            print(f"Wrote {len(files_written)} time series files")
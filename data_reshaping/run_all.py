@@ -1,6 +1,9 @@
 #!/usr/bin/env python
 import os
 
+import planner
+import SchedulerClass
+
 
 def _parse_args():
     """ Parse command line arguments """
@@ -65,7 +68,7 @@ def _parse_args():
             "pop.h.nyear1_t13.sh",
             "cice.h1_t13.sh",
         ],
-        help="Scripts to submit to slurm",
+        help="Scripts to submit (the stream converted by {stream}_t13.sh)",
     )
 
     # Optional: is this a dry-run? If so, don't submit anything
@@ -77,6 +80,75 @@ def _parse_args():
         help="If true, do not actually submit job",
     )
 
+    # Optional: only submit what is missing from the existing time series
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        dest="plan",
+        help="If true, compare history files to existing time series and only convert missing variables",
+    )
+
+    # Optional: which batch system (or local processes) runs the jobs
+    parser.add_argument(
+        "--scheduler",
+        action="store",
+        dest="scheduler",
+        choices=["slurm", "pbs", "local"],
+        default="slurm",
+        help="Submit scripts to slurm or PBS, or run reshaper.py locally",
+    )
+
+    # Optional: PBS project to charge
+    parser.add_argument(
+        "--account",
+        action="store",
+        dest="account",
+        type=str,
+        default=None,
+        help="Project code for PBS jobs",
+    )
+
+    # Optional: where local jobs write time series
+    parser.add_argument(
+        "-o",
+        "--output-root",
+        action="store",
+        dest="output_root",
+        type=str,
+        default=None,
+        help="Directory local jobs write {comp}/proc/tseries to (default: {archive_root}/{case})",
+    )
+
+    # Optional: where local jobs write files before they are complete
+    parser.add_argument(
+        "--scratch-root",
+        action="store",
+        dest="scratch_root",
+        type=str,
+        default=None,
+        help="Base of per-job scratch directories for local jobs (default: {output_root}/scratch)",
+    )
+
+    # Optional: how many local jobs can run at once
+    parser.add_argument(
+        "--max-jobs",
+        action="store",
+        dest="max_jobs",
+        type=int,
+        default=None,
+        help="Maximum number of local jobs running at once (default: number of cores)",
+    )
+
+    # Optional: how many times to run a local job that crashed
+    parser.add_argument(
+        "--retries",
+        action="store",
+        dest="retries",
+        type=int,
+        default=2,
+        help="Number of times to run a failed local job again",
+    )
+
     # Optional: By default, slurm will email users when jobs start and finish
     parser.add_argument(
         "--no-mail",
@@ -94,22 +166,62 @@ if __name__ == "__main__":
     args = _parse_args()
     case = args.case
     archive_root = args.archive_root
-    mail_opt = (
-        f"--mail-type=ALL --mail-user={os.environ['USER']}@ucar.edu"
-        if args.send_mail
-        else "--mail-type=NONE"
-    )
+    output_root = args.output_root
+    if output_root is None:
+        output_root = os.path.join(archive_root, case)
+
+    if args.scheduler == "slurm":
+        scheduler = SchedulerClass.SlurmSchedulerClass(
+            send_mail=args.send_mail, dryrun=args.dryrun
+        )
+    elif args.scheduler == "pbs":
+        scheduler = SchedulerClass.PBSSchedulerClass(
+            account=args.account, dryrun=args.dryrun
+        )
+    else:
+        scratch_root = args.scratch_root
+        if scratch_root is None:
+            scratch_root = os.path.join(output_root, "scratch")
+        scheduler = SchedulerClass.LocalSchedulerClass(
+            scratch_root,
+            max_jobs=args.max_jobs,
+            retries=args.retries,
+            dryrun=args.dryrun,
+        )
+
+    streams = [
+        os.path.basename(script).replace("_t13.sh", "") for script in args.scripts
+    ]
+    if args.plan:
+        # the *_t13.sh scripts can only convert entire years
+        jobs, records = planner.plan(
+            case,
+            archive_root,
+            output_root,
+            args.years,
+            streams,
+            allow_subsets=args.scheduler == "local",
+            scheduler=scheduler,
+        )
+        planner.print_plan(records)
+    else:
+        jobs = [
+            dict(
+                case=case,
+                archive_root=archive_root,
+                output_root=output_root,
+                stream=stream,
+                year=yr,
+            )
+            for yr in args.years
+            for stream in streams
+        ]
+
+    for job in jobs:
+        print(f"Submitting {job['stream']} for year {job['year']:04} of {case}...")
+        # the planner already checked the time series files of planned jobs;
+        # force removes a stale .DONE marker, so the year is converted again
+        scheduler.submit(job, force=args.plan)
 
-    for yr in args.years:
-        year = f"{yr:04}"
-        for script in args.scripts:
-            print(f"Submitting {script} for year {year} of {case}...")
-            cmd = f"sbatch {mail_opt} --dependency=singleton {script} {case} {archive_root} {year}"
-            if not args.dryrun:
-                # note: the --dependency=singleton option means only one job per job name
-                #       Some jobs had been crashing, and I think it was due to temporary
-                #       files clobbering each other? But only having one pop.h_t13.sh job
-                #       at a time seems to have prevented these issues.
-                os.system(cmd)
-            else:
-                print(f"Command to run: {cmd}")
+    for name, status in scheduler.wait().items():
+        print(f"{name}: {status['status']} after {status['attempts']} attempt(s)")
@@ -3,9 +3,12 @@
 """
 
 import glob
+import multiprocessing
 import os
 import gzip as gz
+from concurrent.futures import ProcessPoolExecutor
 import cftime
+import netCDF4
 import numpy as np
 import xarray as xr
 
@@ -13,6 +16,62 @@ import xarray as xr
 from .config import add_first_date_and_reformat
 
 from .utils import time_set_mid, dict_copy_vals, print_key_metadata
+from .utils_grid import find_nearest_cells
+from .utils_trace import span, traced
+
+# read the bounding box of the requested points (rather than one column per point)
+# if it has at most this many cells per point
+_MAX_BOX_CELLS_PER_POINT = 64
+
+################################################################################
+
+
+def _read_points_from_file(filename, varname, nlat, nlon):
+    """
+    Runs in a worker process: return dict with the values of varname at each
+    (nlat[n], nlon[n]) point in filename (points are the last dimension, missing
+    values are NaN), the time axis, and the attributes needed to label the result
+    """
+    with netCDF4.Dataset(filename) as ds:
+        var = ds.variables[varname]
+        lat_beg, lat_end = nlat.min(), nlat.max() + 1
+        lon_beg, lon_end = nlon.min(), nlon.max() + 1
+        box_cells = (lat_end - lat_beg) * (lon_end - lon_beg)
+        if box_cells <= _MAX_BOX_CELLS_PER_POINT * len(nlat):
+            box = var[..., lat_beg:lat_end, lon_beg:lon_end]
+            values = box[..., nlat - lat_beg, nlon - lon_beg]
+        else:
+            values = np.ma.stack([var[..., j, i] for j, i in zip(nlat, nlon)], axis=-1)
+        out = dict(
+            values=np.ma.filled(values.astype(np.float64), np.nan),
+            dims=var.dimensions[:-2],
+            attrs={att: var.getncattr(att) for att in var.ncattrs()},
+            coords=dict(),
+        )
+        for coord in var.dimensions[:-2]:
+            if coord in ds.variables:
+                out["coords"][coord] = (
+                    ds.variables[coord][:],
+                    {
+                        att: ds.variables[coord].getncattr(att)
+                        for att in ds.variables[coord].ncattrs()
+                    },
+                )
+        time = ds.variables["time"]
+        out["time_units"] = time.units
+        out["time_calendar"] = getattr(time, "calendar", "standard")
+        out["time"] = time[:]
+        bounds_name = getattr(time, "bounds", None)
+        if bounds_name in ds.variables:
+            out["time_bound"] = ds.variables[bounds_name][:]
+        for latlon in ["TLAT", "TLONG"]:
+            if latlon in ds.variables:
+                # netCDF4 indexes each dimension independently, so read one point at a time
+                out[latlon] = np.array(
+                    [ds.variables[latlon][j, i] for j, i in zip(nlat, nlon)]
+                )
+    return out
+
 
 ################################################################################
 
@@ -146,6 +205,7 @@ class CaseClass(object):
 
     ############################################################################
 
+    @traced()
     def _find_log_files(self):
         """
         Look in each _output_roots dir (and /logs) for cesm.log, ocn.log, and cpl.log files
@@ -167,6 +227,7 @@ class CaseClass(object):
 
     ############################################################################
 
+    @traced()
     def _find_nc_files(self):
         """
         Look for netcdf files in each output_root directory, as well as
@@ -215,6 +276,7 @@ class CaseClass(object):
 
     ############################################################################
 
+    @traced()
     def _read_log(self, component):
         """
         Read all log files from specified component. Returns a dict where keys
@@ -321,6 +383,7 @@ class CaseClass(object):
 
     ############################################################################
 
+    @traced()
     def gen_dataset(
         self,
         varnames,
@@ -379,6 +442,7 @@ class CaseClass(object):
 
         # Pare down time series file list (only contains years and variables we are interested in)
         ds_timeseries_per_var = []
+        source_files = []
         for varname in varnames:
             timeseries_filenames = []
             for year in range(start_year, end_year + 1):
@@ -394,9 +458,13 @@ class CaseClass(object):
                         self._dataset_files[stream][year][varname]
                     )
             if timeseries_filenames:
-                dsmf = xr.open_mfdataset(timeseries_filenames, **open_mfdataset_kwargs)[
-                    [varname] + _vars_to_keep
-                ]
+                source_files.extend(timeseries_filenames)
+                with span(
+                    "open_mfdataset", varname=varname, nfiles=len(timeseries_filenames)
+                ):
+                    dsmf = xr.open_mfdataset(
+                        timeseries_filenames, **open_mfdataset_kwargs
+                    )[[varname] + _vars_to_keep]
                 with xr.open_dataset(timeseries_filenames[0])[
                     [varname] + _vars_to_keep
                 ] as ds0:
@@ -455,9 +523,11 @@ class CaseClass(object):
                 history_filenames.extend(self._dataset_files[stream][year][varname])
 
         if history_filenames:
-            ds_history = xr.open_mfdataset(history_filenames, **open_mfdataset_kwargs)[
-                varnames + _vars_to_keep
-            ]
+            source_files.extend(history_filenames)
+            with span("open_mfdataset", nfiles=len(history_filenames)):
+                ds_history = xr.open_mfdataset(
+                    history_filenames, **open_mfdataset_kwargs
+                )[varnames + _vars_to_keep]
             with xr.open_dataset(history_filenames[0])[varnames + _vars_to_keep] as ds0:
                 if debug:
                     print_key_metadata(
@@ -499,6 +569,8 @@ class CaseClass(object):
                 )
 
         ds = time_set_mid(ds, "time")
+        # Keep track of files ds was read from (used to fingerprint saved images)
+        ds.encoding["source_files"] = source_files
 
         if not quiet:
             print(f'Datasets contain a total of {ds.sizes["time"]} time samples')
@@ -506,3 +578,136 @@ class CaseClass(object):
         if not quiet:
             print(f"Last average written at {ds[tb_name].values[-1, 1]}")
         return ds
+
+    ############################################################################
+
+    def get_dataset_files(self, varname, stream, start_year=1, end_year=61):
+        """
+        Return list of files containing varname from start_year through end_year,
+        using time series files for each year that has them and history files otherwise
+        """
+        filenames = []
+        for year in range(start_year, end_year + 1):
+            year_files = self.get_timeseries_files(year, stream, varname)
+            if not year_files:
+                year_files = self.get_history_files(year, stream)
+            filenames.extend(year_files)
+        return filenames
+
+    @traced()
+    def extract_points(
+        self,
+        varname,
+        stream,
+        nlat,
+        nlon,
+        start_year=1,
+        end_year=61,
+        max_workers=None,
+        executor=None,
+    ):
+        """
+        Return values of varname at (nlat[n], nlon[n]) for every point n, from
+        start_year through end_year, as an in-memory DataArray with dims
+        (time, [z_t, ...,] point). Only the requested columns (or their bounding
+        box, if the points are close together) are read from each file, and files
+        are read by a pool of max_workers processes (default: number of cores),
+        or by executor if one is passed (e.g. to share it between cases).
+
+        nlat, nlon: integer indices of the points (scalars or equal-length lists)
+        """
+        nlat = np.atleast_1d(np.asarray(nlat, dtype=int))
+        nlon = np.atleast_1d(np.asarray(nlon, dtype=int))
+        if nlat.shape != nlon.shape or nlat.ndim != 1:
+            raise ValueError(
+                "nlat and nlon must be scalars or lists of the same length"
+            )
+
+        filenames = self.get_dataset_files(varname, stream, start_year, end_year)
+        if not filenames:
+            raise ValueError(
+                f"Can not find {varname} between {start_year:04} and {end_year:04}"
+            )
+
+        if executor is not None:
+            futures = [
+                executor.submit(_read_points_from_file, filename, varname, nlat, nlon)
+                for filename in filenames
+            ]
+            results = [future.result() for future in futures]
+        elif max_workers == 1:
+            results = [
+                _read_points_from_file(filename, varname, nlat, nlon)
+                for filename in filenames
+            ]
+        else:
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as executor:
+                results = list(
+                    executor.map(
+                        _read_points_from_file,
+                        filenames,
+                        [varname] * len(filenames),
+                        [nlat] * len(filenames),
+                        [nlon] * len(filenames),
+                    )
+                )
+
+        # time is the midpoint of time_bound (like gen_dataset), decoded with cftime
+        times = []
+        for result in results:
+            if "time_bound" in result:
+                time_vals = result["time_bound"].mean(axis=1)
+            else:
+                time_vals = result["time"]
+            times.append(
+                cftime.num2date(
+                    time_vals, result["time_units"], calendar=result["time_calendar"]
+                )
+            )
+        first = results[0]
+        coords = {
+            "time": np.concatenate(times),
+            "nlat": ("point", nlat),
+            "nlon": ("point", nlon),
+        }
+        for coord, (values, attrs) in first["coords"].items():
+            if coord != "time":
+                coords[coord] = (coord, values, attrs)
+        for latlon in ["TLAT", "TLONG"]:
+            if latlon in first:
+                coords[latlon] = ("point", first[latlon])
+        da = xr.DataArray(
+            np.concatenate([result["values"] for result in results], axis=0),
+            dims=first["dims"] + ("point",),
+            coords=coords,
+            attrs={
+                att: value
+                for att, value in first["attrs"].items()
+                if att not in ["_FillValue", "missing_value"]
+            },
+            name=varname,
+        )
+        return da.sortby("time")
+
+    ############################################################################
+
+    def find_nearest_cells(self, lat, lon, stream="pop.h", ocean_only=True):
+        """
+        Return (nlat, nlon, dist_km) for the grid cell of stream nearest to each
+        (lat, lon) pair (see utils_grid.find_nearest_cells); the grid is read from
+        the first file of stream, and its KD-tree is shared with other cases on the
+        same grid. ocean_only=True skips cells with KMT == 0.
+        """
+        filenames = self._history_filenames[stream] + self._timeseries_filenames[stream]
+        if not filenames:
+            raise ValueError(f"Can not find any {stream} files")
+        with netCDF4.Dataset(sorted(filenames)[0]) as ds:
+            TLAT = ds.variables["TLAT"][:]
+            TLONG = ds.variables["TLONG"][:]
+            mask = None
+            if ocean_only and "KMT" in ds.variables:
+                mask = ds.variables["KMT"][:] > 0
+        return find_nearest_cells(TLAT, TLONG, lat, lon, mask=mask)
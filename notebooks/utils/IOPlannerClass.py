@@ -0,0 +1,209 @@
+"""
+    Class that plans the reads of a whole list of diagnostics (e.g. read from
+    diag_metadata.yaml): entries whose variables come from the same files share one
+    combined read, instead of every entry reopening those files
+"""
+
+import threading
+
+import netCDF4
+import pandas as pd
+
+# local modules, not available through __init__
+from .utils_regions import REGION_VARS
+
+################################################################################
+
+
+class IOPlannerClass(object):
+    def __init__(
+        self,
+        case,
+        diag_metadata_list,
+        stream="pop.h",
+        start_year=1,
+        end_year=61,
+        vars_to_keep=None,
+        max_cache_bytes=2 ** 30,
+        **kwargs,
+    ):
+        """
+            case: CaseClass object to read data from
+            diag_metadata_list: list of dicts, each with at least a varname key
+            max_cache_bytes: variables used by more than one entry (e.g. with
+                             different isel_dict) are kept in memory, up to this
+                             many bytes per read, so they are only read once
+            start_year, end_year, vars_to_keep, kwargs: passed to case.gen_dataset()
+
+            Entries are grouped by the files their variable is read from (history
+            files hold every variable, time series files only one), and each group
+            is opened with a single case.gen_dataset() call for all its variables.
+        """
+        self.case = case
+        self.diag_metadata_list = diag_metadata_list
+        self.stream = stream
+        if type(vars_to_keep) == str:
+            vars_to_keep = [vars_to_keep]
+        self.gen_dataset_kwargs = dict(
+            kwargs,
+            start_year=start_year,
+            end_year=end_year,
+            vars_to_keep=list(vars_to_keep or []),
+        )
+        self.max_cache_bytes = max_cache_bytes
+
+        self._lock = threading.Lock()
+        self._file_bytes = dict()
+        self.groups = self._plan()
+        self.reset()
+
+    def reset(self):
+        """Release open groups, e.g. before the entries are plotted again"""
+        self._datasets = dict()
+        self._remaining = [len(group["entries"]) for group in self.groups]
+
+    ############################################################################
+
+    def _plan(self):
+        """list of groups: entries (indices) and varnames read from the same files"""
+        groups = dict()
+        self._entry_group = []
+        for index, diag_metadata in enumerate(self.diag_metadata_list):
+            varname = diag_metadata["varname"]
+            files = tuple(
+                self.case.get_dataset_files(
+                    varname,
+                    self.stream,
+                    self.gen_dataset_kwargs["start_year"],
+                    self.gen_dataset_kwargs["end_year"],
+                )
+            )
+            if files not in groups:
+                groups[files] = dict(
+                    files=list(files),
+                    varnames=[],
+                    entries=[],
+                    uses=dict(),
+                    vars_to_keep=list(self.gen_dataset_kwargs["vars_to_keep"]),
+                )
+            group = groups[files]
+            if varname not in group["varnames"]:
+                group["varnames"].append(varname)
+            group["entries"].append(index)
+            group["uses"][varname] = group["uses"].get(varname, 0) + 1
+            if "regions" in diag_metadata:
+                # grid variables that region masks are built from
+                group["vars_to_keep"].extend(
+                    var for var in REGION_VARS if var not in group["vars_to_keep"]
+                )
+            self._entry_group.append(list(groups).index(files))
+
+        groups = list(groups.values())
+        for group in groups:
+            # keep the variables that are used more than once, largest ones first
+            group["cached"] = []
+            cache_bytes = 0
+            shared = [var for var, uses in group["uses"].items() if uses > 1]
+            for varname in sorted(shared, key=lambda var: -self._var_bytes(group, var)):
+                var_bytes = self._var_bytes(group, varname)
+                if cache_bytes + var_bytes <= self.max_cache_bytes:
+                    group["cached"].append(varname)
+                    cache_bytes += var_bytes
+        return groups
+
+    def _get_file_bytes(self, filename):
+        """
+            dict mapping each variable in filename to its size in bytes (from the
+            file's metadata, without reading data), and the total size of its
+            coordinate variables under the key None
+        """
+        if filename not in self._file_bytes:
+            file_bytes = {None: 0}
+            with netCDF4.Dataset(filename) as fptr:
+                for varname, var in fptr.variables.items():
+                    nbytes = var.size * getattr(var.dtype, "itemsize", 0)
+                    file_bytes[varname] = nbytes
+                    if varname in fptr.dimensions:
+                        file_bytes[None] += nbytes
+            self._file_bytes[filename] = file_bytes
+        return self._file_bytes[filename]
+
+    def _var_bytes(self, group, varname):
+        """bytes of varname in all files of group"""
+        return sum(
+            self._get_file_bytes(filename).get(varname, 0)
+            for filename in group["files"]
+        )
+
+    def _overhead_bytes(self, group):
+        """bytes every read of the files of group needs: coordinates and kept vars"""
+        kept = ["time_bound", "TAREA"] + group["vars_to_keep"]
+        return sum(
+            self._get_file_bytes(filename)[None]
+            + sum(self._get_file_bytes(filename).get(var, 0) for var in kept)
+            for filename in group["files"]
+        )
+
+    ############################################################################
+
+    def get_report(self):
+        """
+            Return a DataFrame with one row per group of entries: varnames,
+            entries (indices into diag_metadata_list), nfiles, and the bytes read and
+            files opened by the planned reads (bytes_planned, opens_planned) and by
+            reading each entry separately (bytes_naive, opens_naive)
+        """
+        records = []
+        for group in self.groups:
+            overhead = self._overhead_bytes(group)
+            nfiles = len(group["files"])
+            nentries = len(group["entries"])
+            bytes_naive = nentries * overhead + sum(
+                uses * self._var_bytes(group, varname)
+                for varname, uses in group["uses"].items()
+            )
+            bytes_planned = overhead + sum(
+                (1 if varname in group["cached"] else uses)
+                * self._var_bytes(group, varname)
+                for varname, uses in group["uses"].items()
+            )
+            records.append(
+                dict(
+                    varnames=group["varnames"],
+                    entries=group["entries"],
+                    nfiles=nfiles,
+                    bytes_planned=bytes_planned,
+                    bytes_naive=bytes_naive,
+                    opens_planned=nfiles,
+                    opens_naive=nentries * nfiles,
+                )
+            )
+        return pd.DataFrame(records)
+
+    ############################################################################
+
+    def _open_group(self, group):
+        ds = self.case.gen_dataset(
+            group["varnames"],
+            self.stream,
+            **dict(self.gen_dataset_kwargs, vars_to_keep=group["vars_to_keep"]),
+        )
+        for varname in group["cached"]:
+            ds[varname] = ds[varname].persist()
+        return ds
+
+    def get_dataset(self, index):
+        """
+            Return the dataset of entry index of diag_metadata_list, which it shares
+            with the other entries of its group; the group is opened when its first
+            entry asks for it, and released after its last entry has it
+        """
+        group_ind = self._entry_group[index]
+        with self._lock:
+            if group_ind not in self._datasets:
+                self._datasets[group_ind] = self._open_group(self.groups[group_ind])
+            ds = self._datasets[group_ind]
+            self._remaining[group_ind] -= 1
+            if self._remaining[group_ind] == 0:
+                del self._datasets[group_ind]
+        return ds
@@ -0,0 +1,222 @@
+"""
+    Class to maintain a catalog of saved images in a single SQLite file
+
+    savefig() appends one row per image (the same metadata that is written to the
+    JSON file next to it), so building png_catalog.csv is a single indexed query
+    instead of opening every JSON file. Catalogs that predate this class are filled
+    in from the existing JSON files the first time they are read (see migrate_json()).
+"""
+
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+
+import pandas as pd
+
+CATALOG_FILENAME = "plot_catalog.sqlite"
+
+# Columns every catalog has (in the same order as the columns of png_catalog.csv);
+# any other metadata keys are added as columns the first time they are seen
+_COLUMNS = [
+    ("plot_type", "TEXT NOT NULL"),
+    ("varname", "TEXT"),
+    ("casename", "TEXT NOT NULL"),
+    ("apply_log10", "INTEGER"),
+    ("time_period", "TEXT"),
+    ("sel_dict", "TEXT"),
+    ("filepath", "TEXT NOT NULL"),
+    ("date", "TEXT"),
+    ("fingerprint", "TEXT"),
+]
+
+# Open catalogs, keyed by path, used by get_catalog()
+_catalogs = dict()
+
+################################################################################
+
+
+def get_catalog(root_dir="images"):
+    """Return the PlotCatalogClass object for {root_dir}/plot_catalog.sqlite"""
+    path = os.path.abspath(os.path.join(root_dir, CATALOG_FILENAME))
+    if path not in _catalogs:
+        _catalogs[path] = PlotCatalogClass(root_dir)
+    return _catalogs[path]
+
+
+################################################################################
+
+
+class PlotCatalogClass(object):
+    def __init__(self, root_dir="images", timeout=60.0):
+        """
+            root_dir: directory containing {casename}/{plot_type}/... images,
+                      the catalog is {root_dir}/plot_catalog.sqlite
+            timeout: seconds to wait for another process to finish writing
+        """
+        self.root_dir = str(root_dir)
+        self.path = os.path.join(self.root_dir, CATALOG_FILENAME)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._columns = None
+
+    def __getstate__(self):
+        # connections (and locks) can not be shared between processes
+        state = self.__dict__.copy()
+        state["_lock"] = None
+        state["_conn"] = None
+        state["_pid"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    ############################################################################
+
+    def _connect(self):
+        """Return a connection for this process, creating the catalog if necessary"""
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        pathlib.Path(self.root_dir).mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        columns = ", ".join(f"{name} {decl}" for name, decl in _COLUMNS)
+        with conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS plots ({columns}, PRIMARY KEY (casename, filepath))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS plots_by_type ON plots (casename, plot_type)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS catalog_info (key TEXT PRIMARY KEY, value TEXT)"
+            )
+        self._columns = [row[1] for row in conn.execute("PRAGMA table_info(plots)")]
+        self._conn = conn
+        self._pid = os.getpid()
+        return conn
+
+    def _add_columns(self, conn, keys):
+        """Add a column for each key that is not already in the table"""
+        for key in keys:
+            if key in self._columns:
+                continue
+            if not key.isidentifier():
+                raise ValueError(f"Can not add metadata key '{key}' to the catalog")
+            try:
+                conn.execute(f"ALTER TABLE plots ADD COLUMN {key}")
+            except sqlite3.OperationalError:
+                # another process added the column first
+                pass
+            self._columns.append(key)
+
+    @staticmethod
+    def _encode(value):
+        """SQLite stores bools as integers; dicts (e.g. sel_dict) are stored as JSON"""
+        if isinstance(value, (dict, list)):
+            return json.dumps(value)
+        return value
+
+    def _get_info(self, key):
+        row = (
+            self._connect()
+            .execute("SELECT value FROM catalog_info WHERE key = ?", (key,))
+            .fetchone()
+        )
+        return row[0] if row is not None else None
+
+    def _set_info(self, key, value):
+        conn = self._connect()
+        with self._lock, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO catalog_info (key, value) VALUES (?, ?)",
+                (key, value),
+            )
+
+    ############################################################################
+
+    def add(self, metadata):
+        """Add (or replace) the record for a single image"""
+        self.add_many([metadata])
+
+    def add_many(self, list_of_metadata, replace=True):
+        """
+            Add records for many images in a single transaction; if replace is False,
+            images that are already in the catalog keep their existing record
+        """
+        list_of_metadata = list(list_of_metadata)
+        if not list_of_metadata:
+            return
+        conn = self._connect()
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        with self._lock, conn:
+            keys = []
+            for metadata in list_of_metadata:
+                keys.extend(key for key in metadata if key not in keys)
+            self._add_columns(conn, keys)
+            for metadata in list_of_metadata:
+                names = list(metadata)
+                conn.execute(
+                    f"{verb} INTO plots ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                    [self._encode(metadata[name]) for name in names],
+                )
+
+    def query(self, casename=None, plot_type=None, **filters):
+        """
+            Return a DataFrame with one row per image, optionally only for images
+            matching casename, plot_type, and any other column=value filters.
+            Columns that are empty for every returned image are dropped.
+        """
+        filters = dict(casename=casename, plot_type=plot_type, **filters)
+        filters = {key: value for key, value in filters.items() if value is not None}
+        conn = self._connect()
+        for key in filters:
+            if key not in self._columns:
+                raise ValueError(f"'{key}' is not a column in {self.path}")
+        sql = "SELECT * FROM plots"
+        if filters:
+            sql += " WHERE " + " AND ".join(f"{key} = ?" for key in filters)
+        sql += " ORDER BY casename, plot_type, filepath"
+        with self._lock:
+            df = pd.read_sql_query(
+                sql, conn, params=[self._encode(value) for value in filters.values()]
+            )
+        df = df.dropna(axis=1, how="all")
+        if "apply_log10" in df:
+            df["apply_log10"] = df["apply_log10"].map({0: False, 1: True})
+        if "sel_dict" in df:
+            df["sel_dict"] = df["sel_dict"].map(
+                lambda value: json.loads(value) if isinstance(value, str) else value
+            )
+        return df
+
+    def migrate_json(self, image_dir=None, extension=".json", force=False):
+        """
+            Add records from the JSON files written next to each image (every file in
+            image_dir, which defaults to root_dir, with the given extension). This only
+            happens once per catalog unless force is True; records already in the
+            catalog are not replaced.
+
+            Returns the number of JSON files read
+        """
+        if not force and self._get_info("json_migrated") is not None:
+            return 0
+        if image_dir is None:
+            image_dir = self.root_dir
+        list_of_metadata = []
+        for file in sorted(pathlib.Path(image_dir).rglob(f"**/*{extension}")):
+            with open(file) as fp:
+                list_of_metadata.append(json.load(fp))
+        self.add_many(list_of_metadata, replace=False)
+        self._set_info("json_migrated", str(len(list_of_metadata)))
+        return len(list_of_metadata)
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+        self._pid = None
@@ -0,0 +1,373 @@
+"""
+    Class that runs a plot function for every entry of diag_metadata.yaml, and
+    optionally measures how much time and memory each entry needs
+"""
+
+import concurrent.futures
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+import xarray as xr
+
+# local modules, not available through __init__
+from .IOPlannerClass import IOPlannerClass
+from .utils_regions import REGION_VARS
+
+################################################################################
+
+
+class _MemorySamplerClass(object):
+    def __init__(self, client=None, interval=0.5):
+        """
+            Sample resident memory of this process (and, if client is a
+            dask.distributed Client, memory of each worker as reported to the
+            scheduler) every interval seconds in a background thread
+        """
+        import psutil
+
+        self._process = psutil.Process()
+        self._client = client
+        self._interval = interval
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.reset()
+
+    def reset(self):
+        """Forget the peaks sampled so far (and take a new sample)"""
+        with self._lock:
+            self.client_peak = 0
+            self.worker_peak = 0
+            self.workers_total_peak = 0
+            self.nworkers = 0
+        self.sample()
+
+    def sample(self):
+        client_rss = self._process.memory_info().rss
+        worker_memory = []
+        if self._client is not None:
+            workers = self._client.scheduler_info()["workers"].values()
+            worker_memory = [worker["metrics"]["memory"] for worker in workers]
+        with self._lock:
+            self.client_peak = max(self.client_peak, client_rss)
+            if worker_memory:
+                self.worker_peak = max(self.worker_peak, max(worker_memory))
+                self.workers_total_peak = max(
+                    self.workers_total_peak, sum(worker_memory)
+                )
+                self.nworkers = max(self.nworkers, len(worker_memory))
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self.sample()
+
+    def __enter__(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        return False
+
+
+################################################################################
+
+
+def _insert_block(da, isel_dict, block):
+    """
+        Return da with the values at isel_dict (a dict of dim: integer index)
+        replaced by block, which is da.isel(isel_dict) with each dim of isel_dict
+        kept (length 1); da.isel(isel_dict) of the result only reads block
+    """
+    if not isel_dict:
+        return block
+    dim, ind = list(isel_dict.items())[0]
+    rest = {key: value for key, value in isel_dict.items() if key != dim}
+    ind = ind % da.sizes[dim]
+    pieces = [
+        da.isel({dim: slice(None, ind)}),
+        _insert_block(da.isel({dim: [ind]}), rest, block),
+        da.isel({dim: slice(ind + 1, None)}),
+    ]
+    return xr.concat(
+        [piece for piece in pieces if piece.sizes[dim] > 0],
+        dim,
+        coords="minimal",
+        compat="override",
+        join="override",
+    )
+
+
+################################################################################
+
+
+class PlotSuiteClass(object):
+    def __init__(
+        self,
+        case,
+        diag_metadata_list,
+        plot_func,
+        stream="pop.h",
+        combine_reads=False,
+        **kwargs,
+    ):
+        """
+            case: CaseClass object to read data from
+            diag_metadata_list: list of dicts (e.g. read from diag_metadata.yaml),
+                                each with at least a varname key
+            plot_func: function called as plot_func(ds, diag_metadata, **plot_kwargs)
+                       for each entry of diag_metadata_list
+            combine_reads: if True, entries whose variables come from the same files
+                           share one dataset (see IOPlannerClass, available as
+                           self.planner, e.g. for self.planner.get_report())
+            kwargs: passed to case.gen_dataset() (e.g. start_year, end_year)
+        """
+        self.case = case
+        self.diag_metadata_list = diag_metadata_list
+        self.plot_func = plot_func
+        self.stream = stream
+        self.gen_dataset_kwargs = kwargs
+        self.planner = (
+            IOPlannerClass(case, diag_metadata_list, stream, **kwargs)
+            if combine_reads
+            else None
+        )
+
+    def get_dataset(self, diag_metadata, index=None):
+        if self.planner is not None and index is not None:
+            return self.planner.get_dataset(index)
+        kwargs = dict(self.gen_dataset_kwargs)
+        if "regions" in diag_metadata:
+            # grid variables that region masks are built from
+            vars_to_keep = kwargs.get("vars_to_keep") or []
+            if type(vars_to_keep) == str:
+                vars_to_keep = [vars_to_keep]
+            kwargs["vars_to_keep"] = vars_to_keep + [
+                varname for varname in REGION_VARS if varname not in vars_to_keep
+            ]
+        return self.case.gen_dataset(diag_metadata["varname"], self.stream, **kwargs)
+
+    def _get_prefetch_budget(self, client, max_prefetch_bytes):
+        """
+            Bytes that prefetched selections may occupy on the dask workers:
+            max_prefetch_bytes, or half of the workers' memory limit less the memory
+            they already use (0 without a client, i.e. nothing is persisted)
+        """
+        if client is None:
+            return 0
+        if max_prefetch_bytes is not None:
+            return max_prefetch_bytes
+        workers = client.scheduler_info()["workers"].values()
+        memory_limit = sum(worker["memory_limit"] for worker in workers)
+        memory_used = sum(worker["metrics"]["memory"] for worker in workers)
+        return max(0.5 * memory_limit - memory_used, 0)
+
+    def _prefetch(self, diag_metadata, index, client, max_prefetch_bytes):
+        """
+            Open the dataset of diag_metadata and, if the part of its variable that
+            is plotted (the isel_dict selection) fits in the memory left for
+            prefetching, start loading that part on the dask workers
+
+            Returns a dict with the dataset (ds), the persisted selection (persisted,
+            None if nothing was persisted) and its size (nbytes), which counts
+            against the prefetch budget until _release() is called
+        """
+        ds = self.get_dataset(diag_metadata, index)
+        prefetched = dict(ds=ds, persisted=None, nbytes=0)
+        varname = diag_metadata["varname"]
+        isel_dict = diag_metadata.get("isel_dict") or {}
+        # only integer indices can be put back into the variable, see _insert_block()
+        if ds[varname].chunks is None or not all(
+            isinstance(ind, int) for ind in isel_dict.values()
+        ):
+            return prefetched
+        block = ds[varname].isel({dim: [ind] for dim, ind in isel_dict.items()})
+        nbytes = block.nbytes
+        with self._prefetch_lock:
+            budget = self._get_prefetch_budget(client, max_prefetch_bytes)
+            if self._prefetch_bytes + nbytes > budget:
+                return prefetched
+            self._prefetch_bytes += nbytes
+        # returns immediately, the workers load the selection in the background
+        # (ds may be shared with other entries, so it is not modified)
+        prefetched["persisted"] = client.persist(block)
+        prefetched["nbytes"] = nbytes
+        prefetched["ds"] = ds.copy()
+        prefetched["ds"][varname] = _insert_block(
+            ds[varname], isel_dict, prefetched["persisted"]
+        )
+        return prefetched
+
+    def _release(self, prefetched):
+        """drop the persisted selection of an entry, and free its share of the budget"""
+        prefetched["ds"] = None
+        prefetched["persisted"] = None
+        with self._prefetch_lock:
+            self._prefetch_bytes -= prefetched["nbytes"]
+        prefetched["nbytes"] = 0
+
+    def _run_entry(
+        self, diag_metadata, index, plot_kwargs, performance_report_path, ds_future
+    ):
+        if performance_report_path is None:
+            self._plot_entry(diag_metadata, index, plot_kwargs, ds_future)
+            return
+
+        from dask.distributed import performance_report
+
+        with performance_report(filename=performance_report_path):
+            self._plot_entry(diag_metadata, index, plot_kwargs, ds_future)
+
+    def _plot_entry(self, diag_metadata, index, plot_kwargs, ds_future):
+        if ds_future is None:
+            ds = self.get_dataset(diag_metadata, index)
+            self.plot_func(ds, diag_metadata, **plot_kwargs)
+            return
+        prefetched = ds_future.result()
+        try:
+            self.plot_func(prefetched["ds"], diag_metadata, **plot_kwargs)
+        finally:
+            # the persisted data stays in worker memory until it is dropped,
+            # so it counts against the budget until the plot returns
+            self._release(prefetched)
+
+    def run(
+        self,
+        client=None,
+        report_file=None,
+        performance_report_dir=None,
+        sample_memory=True,
+        sample_interval=0.5,
+        lookahead=0,
+        max_prefetch_bytes=None,
+        **plot_kwargs,
+    ):
+        """
+            Run plot_func for every entry of diag_metadata_list (plot_kwargs, e.g.
+            save_pngs=True, are passed to plot_func)
+
+            client: dask.distributed Client, used to sample worker memory
+            report_file: JSON file to write the report to (one record per entry)
+            performance_report_dir: if set (and client is not None), save a dask
+                                    performance report for each entry in
+                                    {performance_report_dir}/{index:03}.{varname}.html
+            sample_memory: if True, record peak memory of this process (and of the
+                           dask workers) while each entry runs, sampled every
+                           sample_interval seconds
+            lookahead: number of entries whose datasets are opened in a background
+                       thread while the current entry is plotted; with a client,
+                       the part of their variables that is plotted (the isel_dict
+                       selection) is also persisted on the workers
+            max_prefetch_bytes: memory guard, the most bytes that persisted
+                                selections may use on the workers, until the
+                                entry they were persisted for has been plotted
+                                (default: half of the workers' free memory);
+                                selections that do not fit are read when plotted
+
+            Returns a DataFrame with one row per entry: index, varname, isel_dict,
+            wall_time (seconds), client_peak_mb, worker_peak_mb (largest worker),
+            workers_total_peak_mb (all workers), nworkers, performance_report,
+            prefetched (True if the selection was persisted ahead of time)
+        """
+        if performance_report_dir is not None and client is not None:
+            os.makedirs(performance_report_dir, exist_ok=True)
+        sampler = (
+            _MemorySamplerClass(client, sample_interval) if sample_memory else None
+        )
+
+        if self.planner is not None:
+            self.planner.reset()
+
+        # one thread opens datasets in order, at most lookahead entries ahead
+        self._prefetch_lock = threading.Lock()
+        self._prefetch_bytes = 0
+        ds_futures = dict()
+        prefetcher = (
+            concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            if lookahead > 0
+            else None
+        )
+
+        records = []
+        try:
+            for index, diag_metadata in enumerate(self.diag_metadata_list):
+                for ind in range(index, index + lookahead + 1):
+                    if prefetcher is None or ind >= len(self.diag_metadata_list):
+                        break
+                    if ind not in ds_futures:
+                        ds_futures[ind] = prefetcher.submit(
+                            self._prefetch,
+                            self.diag_metadata_list[ind],
+                            ind,
+                            client,
+                            max_prefetch_bytes,
+                        )
+                ds_future = ds_futures.pop(index, None)
+                varname = diag_metadata["varname"]
+                record = dict(
+                    index=index,
+                    varname=varname,
+                    isel_dict=diag_metadata.get("isel_dict"),
+                    wall_time=None,
+                    client_peak_mb=None,
+                    worker_peak_mb=None,
+                    workers_total_peak_mb=None,
+                    nworkers=None,
+                    performance_report=None,
+                    prefetched=False,
+                )
+                if performance_report_dir is not None and client is not None:
+                    record["performance_report"] = os.path.join(
+                        performance_report_dir, f"{index:03}.{varname}.html"
+                    )
+
+                time_beg = time.perf_counter()
+                if ds_future is not None:
+                    # the dataset of this entry has usually been opened by now
+                    record["prefetched"] = ds_future.result()["nbytes"] > 0
+                if sampler is None:
+                    self._run_entry(
+                        diag_metadata,
+                        index,
+                        plot_kwargs,
+                        record["performance_report"],
+                        ds_future,
+                    )
+                else:
+                    sampler.reset()
+                    with sampler:
+                        self._run_entry(
+                            diag_metadata,
+                            index,
+                            plot_kwargs,
+                            record["performance_report"],
+                            ds_future,
+                        )
+                    record["client_peak_mb"] = sampler.client_peak / 2 ** 20
+                    if client is not None:
+                        record["worker_peak_mb"] = sampler.worker_peak / 2 ** 20
+                        record["workers_total_peak_mb"] = (
+                            sampler.workers_total_peak / 2 ** 20
+                        )
+                        record["nworkers"] = sampler.nworkers
+                record["wall_time"] = time.perf_counter() - time_beg
+                records.append(record)
+
+                # write after every entry, so a job that runs out of time still reports
+                if report_file is not None:
+                    with open(report_file, "w") as fp:
+                        json.dump(records, fp, indent=1)
+        finally:
+            if prefetcher is not None:
+                for ds_future in ds_futures.values():
+                    ds_future.cancel()
+                prefetcher.shutdown(wait=True)
+
+        return pd.DataFrame(records)
@@ -2,8 +2,21 @@ import json
 import os
 import pathlib
 
+# local modules, not available through __init__
+from .fingerprint import gen_fingerprint
+from .PlotCatalogClass import get_catalog
+from .PlotWriterClass import PlotWriterClass
+from .utils_trace import traced
+
+# Downsampled copies of each image savefig() can write (see previews argument),
+# mapping name to maximum width / height in pixels
+PREVIEW_SIZES = {"thumbnail": 160, "preview": 480}
+
 
 class _PlotTypeBaseClass(object):
+    # fingerprint of the inputs to this image, set by set_fingerprint()
+    fingerprint = None
+
     def __init__(self, *args, **kwargs):
         raise NotImplementedError("This must be implemented in child class")
 
@@ -34,43 +47,163 @@ class _PlotTypeBaseClass(object):
             isel_str = "." + isel_str
         return isel_str
 
-    def savefig(self, fig, root_dir="images", **kwargs):
+    def get_output_paths(self, root_dir="images"):
         """
-            Saves fig as a PNG, with the file name determined by the other parameters.
-
-            Also writes metadata about image file to a JSON file
+            Returns the path of the PNG relative to {root_dir}/{casename},
+            as well as the full paths of the PNG and JSON files
         """
 
-        # Always use tight_layout
-        fig.tight_layout()
-
         # Remove trailing slash from root_dir
         if root_dir[-1] == "/":
             root_dir = root_dir[:-1]
 
-        # Set up dictionary for metadata
-        metadata = self.metadata
         filepath, jsonpath = self.get_filepaths()
-        metadata["filepath"] = os.path.join(
-            self.metadata["plot_type"], f"{filepath}.png"
-        )
-        filepath = os.path.join(
-            root_dir, self.metadata["casename"], metadata["filepath"]
-        )
+        relpath = os.path.join(self.metadata["plot_type"], f"{filepath}.png")
+        filepath = os.path.join(root_dir, self.metadata["casename"], relpath)
         jsonpath = os.path.join(
             root_dir,
             self.metadata["casename"],
             self.metadata["plot_type"],
             f"{jsonpath}.json",
         )
+        return relpath, filepath, jsonpath
+
+    def get_preview_paths(self, root_dir="images", previews=True):
+        """
+            Returns a dict mapping the name of each requested preview ("thumbnail",
+            "preview") to its path relative to {root_dir}/{casename}, its full path,
+            and its maximum size in pixels
+        """
+        if previews is True:
+            previews = PREVIEW_SIZES
+        elif not previews:
+            previews = dict()
+
+        relpath, filepath, _ = self.get_output_paths(root_dir)
+        case_dir = filepath[: -len(relpath)]
+        plot_type_dir, basename = os.path.split(relpath)
+        preview_paths = dict()
+        for name, max_size in previews.items():
+            preview_relpath = os.path.join(plot_type_dir, name, basename)
+            preview_paths[name] = (
+                preview_relpath,
+                os.path.join(case_dir, preview_relpath),
+                max_size,
+            )
+        return preview_paths
+
+    def set_fingerprint(self, input_files, time_window, **render_opts):
+        """
+            Fingerprint everything that goes into this image: the input files (and their
+            modification times), the time window, the image metadata, options that affect
+            rendering (passed as render_opts), and the version of the plotting code.
+
+            The fingerprint is written to the JSON file by savefig()
+        """
+        self.fingerprint = gen_fingerprint(
+            input_files, time_window, self.metadata, render_opts
+        )
+
+    def is_up_to_date(self, root_dir="images", previews=False):
+        """
+            Returns True if the PNG and JSON files (and any requested previews)
+            already exist and the fingerprint saved in the JSON file matches the
+            fingerprint of this object
+        """
+        if self.fingerprint is None:
+            return False
+
+        _, filepath, jsonpath = self.get_output_paths(root_dir)
+        if not (os.path.isfile(filepath) and os.path.isfile(jsonpath)):
+            return False
+        try:
+            with open(jsonpath) as fp:
+                saved_metadata = json.load(fp)
+        except (OSError, ValueError):
+            return False
+        for _, preview_filepath, _ in self.get_preview_paths(
+            root_dir, previews
+        ).values():
+            if not os.path.isfile(preview_filepath):
+                return False
+        return saved_metadata.get("fingerprint") == self.fingerprint
+
+    @traced()
+    def savefig(
+        self,
+        fig,
+        root_dir="images",
+        writer=None,
+        catalog=True,
+        previews=False,
+        **kwargs,
+    ):
+        """
+            Saves fig as a PNG, with the file name determined by the other parameters.
+
+            Also writes metadata about image file to a JSON file
 
-        for path in [filepath, jsonpath]:
+            If writer (a PlotWriterClass object) is provided, fig is only rasterized here;
+            encoding and writing the files happens in the writer's background threads
+
+            catalog: if True, metadata is also added to {root_dir}/plot_catalog.sqlite;
+                     a PlotCatalogClass object can be passed instead (or False to skip)
+
+            previews: if True, also write the downsampled copies in PREVIEW_SIZES
+                      to {plot_type}/{name}/ (a dict of name: size can be passed
+                      instead); they are made from the same rendered image as the PNG,
+                      and their paths are saved in metadata as {name}_filepath
+        """
+
+        # Always use tight_layout
+        fig.tight_layout()
+
+        # Set up dictionary for metadata
+        metadata = self.metadata
+        metadata["filepath"], filepath, jsonpath = self.get_output_paths(root_dir)
+        if self.fingerprint is not None:
+            metadata["fingerprint"] = self.fingerprint
+        preview_files = dict()
+        for name, preview_paths in self.get_preview_paths(root_dir, previews).items():
+            metadata[f"{name}_filepath"], preview_filepath, max_size = preview_paths
+            preview_files[preview_filepath] = max_size
+
+        # only catalog images that were written successfully
+        if catalog is True:
+            catalog = get_catalog(root_dir)
+        catalog_metadata = dict(metadata)
+        on_written = (lambda: catalog.add(catalog_metadata)) if catalog else None
+
+        if writer is not None:
+            writer.write_figure(
+                fig,
+                filepath,
+                jsonpath,
+                metadata,
+                previews=preview_files,
+                on_written=on_written,
+                **kwargs,
+            )
+            return
+
+        for path in [filepath, jsonpath, *preview_files]:
             parent_dir = pathlib.Path(path).parent
             parent_dir.mkdir(parents=True, exist_ok=True)
 
-        fig.savefig(filepath, **kwargs)
+        if preview_files:
+            # render once, then downsample the rendered image
+            rgba, png_bytes = PlotWriterClass.render(fig, **kwargs)
+            for path, contents in PlotWriterClass.iter_pngs(
+                filepath, kwargs.get("dpi", fig.dpi), rgba, png_bytes, preview_files,
+            ):
+                with open(path, "wb") as fp:
+                    fp.write(contents)
+        else:
+            fig.savefig(filepath, **kwargs)
         with open(jsonpath, "w") as fp:
             json.dump(metadata, fp)
+        if on_written is not None:
+            on_written()
 
 
 ################################################################################
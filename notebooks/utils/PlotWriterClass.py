@@ -0,0 +1,248 @@
+"""
+    Class to write PNG and JSON files in background threads
+
+    The calling thread only rasterizes the figure (so the figure can be modified or
+    reused as soon as write_figure() returns); PNG encoding and all file system
+    operations happen in a small pool of writer threads. Files are written to a
+    temporary file in the destination directory and then renamed, so a partially
+    written file is never visible under its final name.
+"""
+
+import io
+import json
+import os
+import pathlib
+import queue
+import tempfile
+import threading
+import time
+
+import matplotlib.image
+import numpy as np
+from PIL import Image
+
+# savefig kwargs that can be applied when rasterizing to an RGBA buffer;
+# anything else (e.g. bbox_inches) falls back to encoding PNG in the calling thread
+_RGBA_KWARGS = ["dpi", "facecolor", "edgecolor"]
+
+################################################################################
+
+
+class PlotWriterClass(object):
+    def __init__(self, nthreads=4, maxsize=16):
+        """
+            nthreads: number of writer threads
+            maxsize: maximum number of queued images; write_figure() blocks
+                     when the queue is full, which bounds memory use
+        """
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._created_dirs = set()
+        self._bytes_written = 0
+        self._files_written = 0
+        self._write_time = 0.0
+        self._errors = []
+        self._threads = []
+        for _ in range(nthreads):
+            thread = threading.Thread(target=self._worker, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    ############################################################################
+
+    def _worker(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                self._queue.task_done()
+                return
+            try:
+                start_time = time.time()
+                nbytes = 0
+                for path, contents in task():
+                    nbytes += self._write_atomic(path, contents)
+                with self._lock:
+                    self._bytes_written += nbytes
+                    self._write_time += time.time() - start_time
+            except Exception as err:
+                with self._lock:
+                    self._errors.append(err)
+            finally:
+                self._queue.task_done()
+
+    def _makedirs(self, parent_dir):
+        """create parent_dir, unless this object already created it"""
+        with self._lock:
+            if parent_dir in self._created_dirs:
+                return
+        pathlib.Path(parent_dir).mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._created_dirs.add(parent_dir)
+
+    def _write_atomic(self, path, contents):
+        """write contents (bytes) to path via a temporary file; return bytes written"""
+        parent_dir = os.path.dirname(path)
+        self._makedirs(parent_dir)
+        fd, tmp_path = tempfile.mkstemp(dir=parent_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(contents)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._files_written += 1
+        return len(contents)
+
+    ############################################################################
+
+    @staticmethod
+    def rasterize(fig, dpi=None, facecolor=None, edgecolor=None):
+        """
+            Return the figure as an (height, width, 4) uint8 numpy array of RGBA values,
+            rendered the same way fig.savefig() would render it
+        """
+        if dpi is None:
+            dpi = fig.dpi
+        savefig_kwargs = dict(format="rgba", dpi=dpi)
+        if facecolor is not None:
+            savefig_kwargs["facecolor"] = facecolor
+        if edgecolor is not None:
+            savefig_kwargs["edgecolor"] = edgecolor
+        with io.BytesIO() as buf:
+            fig.savefig(buf, **savefig_kwargs)
+            rgba_bytes = buf.getvalue()
+        # Agg truncates the figure size (in pixels) to integers
+        width, height = fig.get_size_inches() * dpi
+        shape = (int(height), int(width), 4)
+        return np.frombuffer(rgba_bytes, dtype=np.uint8).reshape(shape)
+
+    @staticmethod
+    def encode_png(rgba, dpi):
+        """return the RGBA array encoded as PNG bytes"""
+        with io.BytesIO() as buf:
+            matplotlib.image.imsave(buf, rgba, format="png", dpi=dpi)
+            return buf.getvalue()
+
+    @staticmethod
+    def downsample(rgba, max_size):
+        """
+            Return a copy of the RGBA array, resampled (preserving its aspect ratio)
+            so that neither dimension exceeds max_size pixels
+        """
+        image = Image.fromarray(rgba)
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+        return np.asarray(image)
+
+    @classmethod
+    def render(cls, fig, **kwargs):
+        """
+            Render fig once; return (rgba, png_bytes), where exactly one of them is None.
+            kwargs are the savefig() kwargs; if they can not be applied when rasterizing
+            to an RGBA buffer, fig is rendered directly to PNG.
+        """
+        if all(key in _RGBA_KWARGS for key in kwargs):
+            return cls.rasterize(fig, **kwargs), None
+        with io.BytesIO() as buf:
+            fig.savefig(buf, format="png", **kwargs)
+            return None, buf.getvalue()
+
+    @classmethod
+    def iter_pngs(cls, filepath, dpi, rgba=None, png_bytes=None, previews=None):
+        """
+            Yield (path, PNG bytes) for the image rendered by render(), and for each
+            downsampled copy in previews (a dict mapping path to the maximum size,
+            in pixels, of the copy); copies are made from the rendered image
+        """
+        if png_bytes is None:
+            png_bytes = cls.encode_png(rgba, dpi)
+        yield filepath, png_bytes
+        if not previews:
+            return
+        if rgba is None:
+            with io.BytesIO(png_bytes) as buf:
+                rgba = np.asarray(Image.open(buf).convert("RGBA"))
+        for path, max_size in previews.items():
+            yield path, cls.encode_png(cls.downsample(rgba, max_size), dpi)
+
+    def write_figure(
+        self,
+        fig,
+        filepath,
+        jsonpath,
+        metadata,
+        previews=None,
+        on_written=None,
+        **kwargs,
+    ):
+        """
+            Queue fig to be written as a PNG to filepath, and metadata to jsonpath.
+            previews: optional dict mapping path to maximum size (in pixels) of
+                      downsampled copies of the PNG to also write
+            on_written: optional function called (in a writer thread) once every
+                        file has been written, e.g. to add metadata to a catalog
+            kwargs are the savefig() kwargs.
+
+            fig is rasterized before this returns, so it is safe to modify it afterwards
+        """
+        metadata = dict(metadata)
+        previews = dict(previews) if previews else None
+        dpi = kwargs.get("dpi", fig.dpi)
+        rgba, png_bytes = self.render(fig, **kwargs)
+
+        def task():
+            yield from self.iter_pngs(filepath, dpi, rgba, png_bytes, previews)
+            yield jsonpath, json.dumps(metadata).encode()
+            # the worker resumes the generator after writing the last file
+            if on_written is not None:
+                on_written()
+
+        self._queue.put(task)
+
+    def flush(self):
+        """
+            Block until every queued file has been written, then return report().
+            Raises RuntimeError if any file could not be written since the previous
+            flush(); those errors are then cleared, so the writer can be used again.
+        """
+        self._queue.join()
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise RuntimeError(
+                f"{len(errors)} error(s) writing files, first error: {errors[0]}"
+            ) from errors[0]
+        return self.report()
+
+    def report(self):
+        """
+            Return a dict with the number of files and bytes written so far, the total
+            time spent by writer threads encoding and writing, and any errors
+            that have not been raised by flush() yet
+        """
+        with self._lock:
+            return dict(
+                files_written=self._files_written,
+                bytes_written=self._bytes_written,
+                write_time=self._write_time,
+                queued=self._queue.qsize(),
+                errors=list(self._errors),
+            )
+
+    def close(self):
+        """flush the queue and stop the writer threads; returns report()"""
+        try:
+            return self.flush()
+        finally:
+            for _ in self._threads:
+                self._queue.put(None)
+            for thread in self._threads:
+                thread.join()
+            self._threads = []
@@ -11,6 +11,14 @@ import datetime
 # local modules, not available through __init__
 from .utils import time_year_plus_frac, round_sig
 from .utils_units import conv_units
+from .fingerprint import files_in_time_window, get_source_files
+from .RendererClass import MapRendererClass, HistRendererClass, get_map_args
+from .ReducedStoreClass import is_reduced_dataset
+from .utils_grid import find_nearest_cells, format_lat_lon
+from .utils_lod import coarsen_for_display
+from .utils_regions import get_regions, reduce_regions
+from .utils_time import get_time_weights, temporal_mean
+from .utils_trace import span, traced
 from .PlotTypeClass import (
     SummaryMapClass,
     SummaryTSClass,
@@ -23,8 +31,26 @@ from .PlotTypeClass import (
 
 
 def compare_fields_at_lat_lon(
-    list_of_das_in, nlat, nlon, individual_plots=False, filename=None
+    list_of_das_in,
+    nlat=None,
+    nlon=None,
+    individual_plots=False,
+    filename=None,
+    lat=None,
+    lon=None,
 ):
+    """
+    Plot time series of each DataArray in list_of_das_in at grid cell (nlat, nlon),
+    or at the cell nearest to (lat, lon) in degrees if those are provided instead
+    (this requires TLAT and TLONG coordinates). DataArrays returned by
+    CaseClass.extract_points() are plotted at their first point.
+    """
+    if lat is not None and lon is not None:
+        da = list_of_das_in[0]
+        nlat, nlon, _ = find_nearest_cells(da["TLAT"], da["TLONG"], lat, lon)
+        nlat, nlon = int(nlat), int(nlon)
+    if nlat is None or nlon is None:
+        raise ValueError("Either nlat and nlon or lat and lon must be provided")
 
     # This shouldn't be hard-coded... but how else to get?
     xticks = 365 + np.array([0, 31, 59, 90, 120, 151])
@@ -33,11 +59,13 @@ def compare_fields_at_lat_lon(
 
     list_of_das = []
     for da in list_of_das_in:
-        list_of_das.append(da.isel(nlat=nlat, nlon=nlon).compute())
+        if "point" in da.dims:
+            # already extracted by CaseClass.extract_points()
+            list_of_das.append(da.isel(point=0))
+        else:
+            list_of_das.append(da.isel(nlat=nlat, nlon=nlon).compute())
 
-    # Get longitude and latitude (hard-coded to assume we want W and S)
-    long_west = 360 - list_of_das[0]["TLONG"].data
-    lat_south = -list_of_das[0]["TLAT"].data
+    location = format_lat_lon(list_of_das[0]["TLAT"].data, list_of_das[0]["TLONG"].data)
 
     if individual_plots:
         nrows = int(np.ceil(len(list_of_das) / 2))
@@ -46,7 +74,7 @@ def compare_fields_at_lat_lon(
         )
 
         # Hard-coded title is also a bad idea
-        fig.suptitle(f"Mix Layer Depth at ({long_west:.2f} W, {lat_south:.2f} S)")
+        fig.suptitle(f"Mix Layer Depth at ({location})")
 
         for n, da in enumerate(list_of_das):
             plt.subplot(nrows, 2, n + 1)
@@ -69,7 +97,7 @@ def compare_fields_at_lat_lon(
                 plt.xlabel("")
     else:
         fig = plt.figure(figsize=(9.0, 5.25), clear=True)
-        fig.suptitle(f"Mix Layer Depth at ({long_west:.2f} W, {lat_south:.2f} S)")
+        fig.suptitle(f"Mix Layer Depth at ({location})")
 
         for da in list_of_das:
             da.plot()
@@ -133,6 +161,7 @@ def _extract_field_from_file(ds, varname, nlat, nlon):
 ################################################################################
 
 
+@traced()
 def summary_plot_global_ts(
     ds, da, diag_metadata, time_coarsen_len=None, **plot_options
 ):
@@ -140,59 +169,97 @@ def summary_plot_global_ts(
     save_pngs = plot_options.get("save_pngs", False)
     if save_pngs:
         root_dir = plot_options.get("root_dir", "images")
-        kwargs = plot_options.get("savefig_kwargs", {})
+        kwargs = _get_savefig_kwargs(plot_options)
         isel_dict = diag_metadata.get("isel_dict", {})
+        time_bound = _get_time_bound(ds, da).load().data
+        str_datestamp = f"{time_bound[0,0]}"
+        first_datestamp = str_datestamp.split(" ")[0]
+        str_datestamp = f"{time_bound[-1,-1]-datetime.timedelta(days=1)}"
+        last_datestamp = str_datestamp.split(" ")[0]
+        summary_ts = SummaryTSClass(
+            da, casename, first_datestamp, last_datestamp, isel_dict
+        )
+        if _is_up_to_date(
+            summary_ts,
+            ds,
+            da,
+            0,
+            -1,
+            plot_options,
+            diag_metadata=diag_metadata,
+            time_coarsen_len=time_coarsen_len,
+        ):
+            return
 
-    reduce_dims = da.dims[-2:]
-    weights = ds["TAREA"].fillna(0)
-    da_weighted = da.weighted(weights)
     spatial_op = diag_metadata.get("spatial_op", "average")
+    regions = diag_metadata.get("regions")
+    if is_reduced_dataset(ds):
+        # means and integrals were computed when the store was updated
+        to_plot = ds["mean" if spatial_op == "average" else "integral"]
+        names = list(get_regions(regions)) if regions is not None else ["Global"]
+        missing = [name for name in names if name not in to_plot["region"].values]
+        if missing:
+            raise ValueError(f"regions {missing} are not in the reduced store")
+        if regions is None:
+            to_plot = to_plot.sel(region="Global", drop=True)
+        else:
+            to_plot = to_plot.sel(region=names)
+        to_plot.attrs = dict(da.attrs, units=to_plot.attrs["units"])
+        to_plot.name = da.name
+    elif regions is not None:
+        # every region is reduced in the same pass over da
+        mean, integral = reduce_regions(da, ds, regions)
+        to_plot = mean if spatial_op == "average" else integral
+    else:
+        reduce_dims = da.dims[-2:]
+        weights = ds["TAREA"].fillna(0)
+        da_weighted = da.weighted(weights)
+        if spatial_op == "average":
+            to_plot = da_weighted.mean(dim=reduce_dims)
+            to_plot.attrs = da.attrs
+        if spatial_op == "integrate":
+            to_plot = da_weighted.sum(dim=reduce_dims)
+            to_plot.attrs = da.attrs
+            to_plot.attrs["units"] += f" {weights.attrs['units']}"
     if spatial_op == "average":
-        to_plot = da_weighted.mean(dim=reduce_dims)
-        to_plot.attrs = da.attrs
         if "display_units" in diag_metadata:
             to_plot = conv_units(to_plot, diag_metadata["display_units"])
     if spatial_op == "integrate":
-        to_plot = da_weighted.sum(dim=reduce_dims)
-        to_plot.attrs = da.attrs
-        to_plot.attrs["units"] += f" {weights.attrs['units']}"
         if "integral_display_units" in diag_metadata:
             to_plot = conv_units(
                 to_plot,
                 diag_metadata["integral_display_units"],
                 units_scalef=diag_metadata.get("integral_unit_conv"),
             )
+    with span("summary_plot_global_ts.compute"):
+        to_plot = to_plot.compute()
     # do not use to_plot.plot.line("-o") because of incorrect time axis values
     # https://github.com/pydata/xarray/issues/4401
+    if "region" in to_plot.dims:
+        to_plot = to_plot.transpose("time", "region")
     fig, ax = plt.subplots()
-    ax.plot(time_year_plus_frac(to_plot, "time"), to_plot.values, "-o")
+    lines = ax.plot(time_year_plus_frac(to_plot, "time"), to_plot.values, "-o")
     ax.set_xlabel(xr.plot.utils.label_from_attrs(to_plot["time"]))
     ax.set_ylabel(xr.plot.utils.label_from_attrs(to_plot))
     ax.set_title(to_plot._title_for_slice())
+    if "region" in to_plot.dims:
+        ax.legend(lines, list(to_plot["region"].values))
     if time_coarsen_len is not None:
-        tlen = len(to_plot.time)
-        tlen_trunc = (tlen // time_coarsen_len) * time_coarsen_len
-        to_plot_trunc = to_plot.isel(time=slice(0, tlen_trunc))
-        to_plot_coarse = to_plot_trunc.coarsen({"time": time_coarsen_len}).mean()
+        to_plot_coarse = _coarsen_time(ds, to_plot, time_coarsen_len)
         ax.plot(
             time_year_plus_frac(to_plot_coarse, "time"), to_plot_coarse.values, "-o"
         )
-        title = ax.get_title()
-        if title != "":
-            title += ", "
-        title += f"last mean value={round_sig(to_plot_coarse.values[-1],4)}"
-        ax.set_title(title)
+        # with several regions, the legend identifies the lines instead
+        if "region" not in to_plot.dims and to_plot_coarse.sizes["time"] > 0:
+            title = ax.get_title()
+            if title != "":
+                title += ", "
+            title += f"last mean value={round_sig(to_plot_coarse.values[-1],4)}"
+            ax.set_title(title)
     if save_pngs:
-        str_datestamp = f'{ds[ds["time"].attrs["bounds"]].load().data[0,0]}'
-        first_datestamp = str_datestamp.split(" ")[0]
-        str_datestamp = (
-            f'{ds[ds["time"].attrs["bounds"]].data[-1,-1]-datetime.timedelta(days=1)}'
-        )
-        last_datestamp = str_datestamp.split(" ")[0]
-        summary_ts = SummaryTSClass(
-            da, casename, first_datestamp, last_datestamp, isel_dict
+        summary_ts.savefig(
+            fig, root_dir=root_dir, writer=plot_options.get("writer"), **kwargs
         )
-        summary_ts.savefig(fig, root_dir=root_dir, **kwargs)
     else:
         plt.show()
     plt.close(fig)
@@ -201,87 +268,150 @@ def summary_plot_global_ts(
 ################################################################################
 
 
+def _get_hist_xlabel(da, diag_metadata, apply_log10):
+    """x axis label of histograms of da, the way summary_plot_histogram labels it"""
+    attrs = dict(da.attrs)
+    if "display_units" in diag_metadata:
+        attrs["units"] = diag_metadata["display_units"]
+    name = f"log10({da.name})" if apply_log10 else da.name
+    return xr.plot.utils.label_from_attrs(xr.DataArray(np.nan, attrs=attrs, name=name))
+
+
+def _get_reduced_hist(ds, da, diag_metadata, apply_log10, t_ind_beg, t_ind_end):
+    """
+    list of (counts, edges) tuples from a reduced store Dataset, with edges converted
+    to display units (log10 edges are shifted by the log10 of the conversion factor)
+    """
+    hist = ds[["hist_counts", "hist_edges"]].isel(
+        time=slice(t_ind_beg, t_ind_end + 1), log10=int(apply_log10)
+    )
+    edges = hist["hist_edges"]
+    if "display_units" in diag_metadata:
+        if apply_log10:
+            edges = 10.0 ** edges
+        edges.attrs["units"] = da.attrs["units"]
+        edges = conv_units(edges, diag_metadata["display_units"])
+        if apply_log10:
+            edges = np.log10(edges)
+    return list(zip(hist["hist_counts"].values, edges.values))
+
+
+@traced()
 def summary_plot_histogram(ds, da, diag_metadata, lines_per_plot=12, **plot_options):
     save_pngs = plot_options.get("save_pngs", False)
     casename = ds.attrs["title"]
     if save_pngs:
         root_dir = plot_options.get("root_dir", "images")
-        kwargs = plot_options.get("savefig_kwargs", {})
+        kwargs = _get_savefig_kwargs(plot_options)
         isel_dict = diag_metadata.get("isel_dict", {})
 
     # histogram, all time levels in one plot
     hist_bins = 20
     hist_log = True
+    render_pool = plot_options.get("render_pool") if save_pngs else None
 
-    # Loop length
-    t_cnt = len(da["time"])
+    # Loop length (da has no time dim if ds is from a ReducedStoreClass)
+    time_bound = _get_time_bound(ds, da).values
+    t_cnt = len(time_bound)
     for apply_log10 in _apply_log10_vals(diag_metadata):
-        t_ind_beg = 0
-        fig, ax = plt.subplots()
-        # fig.tight_layout()
-        for t_ind in range(t_cnt):
-            to_plot = da.isel(time=t_ind)
-            if "display_units" in diag_metadata:
-                to_plot = conv_units(to_plot, diag_metadata["display_units"])
-            if apply_log10:
-                to_plot = np.log10(xr.where(to_plot > 0, to_plot, np.nan))
-                to_plot.name = f"log10({to_plot.name})"
-            # to_plot.plot.hist(bins=hist_bins, log=hist_log, histtype="step")
-            to_plot.plot.hist(ax=ax, bins=hist_bins, log=hist_log, histtype="step")
-            if t_ind % lines_per_plot == lines_per_plot - 1:
-                t_beg = ds[ds["time"].attrs["bounds"]].values[t_ind_beg, 0]
-                t_str_beg = f"{t_beg.year:04}-{t_beg.month:02}-{t_beg.day:02}"
-                t_ind_end = t_ind
-                t_end = ds[ds["time"].attrs["bounds"]].values[
-                    t_ind_end, -1
-                ] - datetime.timedelta(days=1)
-                t_str_end = f"{t_end.year:04}-{t_end.month:02}-{t_end.day:02}"
-                plt.title(f"Histogram: {t_str_beg} : {t_str_end}")
-                t_ind_beg = t_ind_end + 1
-                if save_pngs:
-                    summary_hist = SummaryHistClass(
-                        da, casename, apply_log10, t_str_beg, t_str_end, isel_dict
-                    )
-                    summary_hist.savefig(fig, root_dir=root_dir, **kwargs)
-                else:
-                    plt.show()
-                plt.close(fig)
-                if t_ind != t_cnt - 1:
-                    fig, ax = plt.subplots()
-
-        if t_ind % lines_per_plot != lines_per_plot - 1:
-            t_beg = ds[ds["time"].attrs["bounds"]].values[t_ind_beg, 0]
+        # Reuse a single figure (and its step lines) for all plots
+        hist_renderer = HistRendererClass(bins=hist_bins, log=hist_log)
+        for t_ind_beg in range(0, t_cnt, lines_per_plot):
+            t_ind_end = min(t_ind_beg + lines_per_plot, t_cnt) - 1
+            t_beg = time_bound[t_ind_beg, 0]
             t_str_beg = f"{t_beg.year:04}-{t_beg.month:02}-{t_beg.day:02}"
-            t_ind_end = t_ind
-            t_end = ds[ds["time"].attrs["bounds"]].values[
-                t_ind_end, -1
-            ] - datetime.timedelta(days=1)
+            t_end = time_bound[t_ind_end, -1] - datetime.timedelta(days=1)
             t_str_end = f"{t_end.year:04}-{t_end.month:02}-{t_end.day:02}"
-            plt.title(f"Histogram: {t_str_beg} : {t_str_end}")
             if save_pngs:
                 summary_hist = SummaryHistClass(
-                    da, casename, t_str_beg, t_str_end, isel_dict
+                    da, casename, apply_log10, t_str_beg, t_str_end, isel_dict
+                )
+                if _is_up_to_date(
+                    summary_hist,
+                    ds,
+                    da,
+                    t_ind_beg,
+                    t_ind_end,
+                    plot_options,
+                    diag_metadata=diag_metadata,
+                    lines_per_plot=lines_per_plot,
+                ):
+                    continue
+
+            title = f"Histogram: {t_str_beg} : {t_str_end}"
+            if is_reduced_dataset(ds):
+                # counts were computed when the store was updated
+                list_of_counts = _get_reduced_hist(
+                    ds, da, diag_metadata, apply_log10, t_ind_beg, t_ind_end
+                )
+                xlabel = _get_hist_xlabel(da, diag_metadata, apply_log10)
+            else:
+                # one line per time level
+                to_plot = da.isel(time=slice(t_ind_beg, t_ind_end + 1))
+                if "display_units" in diag_metadata:
+                    to_plot = conv_units(to_plot, diag_metadata["display_units"])
+                if apply_log10:
+                    to_plot = np.log10(xr.where(to_plot > 0, to_plot, np.nan))
+                    to_plot.name = f"log10({to_plot.name})"
+                xlabel = xr.plot.utils.label_from_attrs(to_plot)
+                with span("summary_plot_histogram.compute"):
+                    # load one time level at a time, so only one field is in memory
+                    list_of_counts = hist_renderer.compute_histograms(
+                        to_plot.isel(time=t_ind).values
+                        for t_ind in range(to_plot.sizes["time"])
+                    )
+            if render_pool is not None:
+                # only ship histogram counts to the worker processes
+                render_pool.submit_hist(
+                    summary_hist,
+                    list_of_counts,
+                    title=title,
+                    xlabel=xlabel,
+                    root_dir=root_dir,
+                    savefig_kwargs=kwargs,
+                    bins=hist_bins,
+                    log=hist_log,
+                )
+                continue
+            fig = hist_renderer.render_counts(
+                list_of_counts, title=title, xlabel=xlabel
+            )
+            if save_pngs:
+                summary_hist.savefig(
+                    fig, root_dir=root_dir, writer=plot_options.get("writer"), **kwargs
                 )
-                summary_hist.savefig(fig, root_dir=root_dir, **kwargs)
             else:
-                plt.show()
-            plt.close(fig)
+                hist_renderer.show()
 
 
 ################################################################################
 
 
+@traced()
 def summary_plot_maps(ds, da, diag_metadata, **plot_options):
 
     save_pngs = plot_options.get("save_pngs", False)
     casename = ds.attrs["title"]
     if save_pngs:
         root_dir = plot_options.get("root_dir", "images")
-        kwargs = plot_options.get("savefig_kwargs", {})
+        kwargs = _get_savefig_kwargs(plot_options)
         isel_dict = diag_metadata.get("isel_dict", {})
 
     # maps, 1 plots for time level
     cmap = "plasma"
+    render_pool = plot_options.get("render_pool") if save_pngs else None
+
+    # Optionally reduce maps to the resolution of the image (in dask, before plotting)
+    map_lod = plot_options.get("map_lod")
+    if map_lod is not None:
+        da_map = coarsen_for_display(
+            da,
+            _get_lod_weights(ds, da),
+            method=map_lod,
+            dpi=plot_options.get("savefig_kwargs", {}).get("dpi"),
+        )
+    else:
+        da_map = da
 
     for apply_log10 in _apply_log10_vals(diag_metadata):
         vmin = diag_metadata.get("map_vmin")
@@ -291,44 +421,91 @@ def summary_plot_maps(ds, da, diag_metadata, **plot_options):
                 vmin = np.log10(vmin) if vmin > 0.0 else None
             if vmax is not None:
                 vmax = np.log10(vmax) if vmax > 0.0 else None
+        # Reuse a single figure (and its mesh and colorbar) for all time levels
+        map_renderer = MapRendererClass(cmap=cmap, vmin=vmin, vmax=vmax)
         for t_ind in range(len(da["time"])):
-            to_plot = da.isel(time=t_ind)
+            if save_pngs:
+                datestamp = f"{da.time[t_ind].data.item()}".split(" ")[0]
+                summary_map = SummaryMapClass(
+                    da, casename, datestamp, apply_log10, isel_dict
+                )
+                if _is_up_to_date(
+                    summary_map,
+                    ds,
+                    da,
+                    t_ind,
+                    t_ind,
+                    plot_options,
+                    diag_metadata=diag_metadata,
+                    map_lod=map_lod,
+                ):
+                    continue
+
+            to_plot = da_map.isel(time=t_ind)
             if "display_units" in diag_metadata:
                 to_plot = conv_units(to_plot, diag_metadata["display_units"])
             if apply_log10:
                 to_plot = np.log10(xr.where(to_plot > 0.0, to_plot, np.nan))
                 to_plot.name = f"log10({to_plot.name})"
 
-            ax = to_plot.plot(cmap=cmap, vmin=vmin, vmax=vmax)
-            fig = ax.get_figure()
+            with span("summary_plot_maps.compute"):
+                map_args = get_map_args(to_plot)
+            if render_pool is not None:
+                render_pool.submit_map(
+                    summary_map,
+                    map_args,
+                    root_dir=root_dir,
+                    savefig_kwargs=kwargs,
+                    cmap=cmap,
+                    vmin=vmin,
+                    vmax=vmax,
+                )
+                continue
+            fig = map_renderer.render(**map_args)
             if save_pngs:
-                datestamp = f"{da.time[t_ind].data.item()}".split(" ")[0]
-                summary_map = SummaryMapClass(
-                    da, casename, datestamp, apply_log10, isel_dict
+                summary_map.savefig(
+                    fig, root_dir=root_dir, writer=plot_options.get("writer"), **kwargs
                 )
-                summary_map.savefig(fig, root_dir=root_dir, **kwargs)
             else:
-                plt.show()
-            plt.close(fig)
+                map_renderer.show()
 
 
 ################################################################################
 
 
+@traced()
 def trend_plot(ds, da, vmin=None, vmax=None, invert_yaxis=False, **plot_options):
 
     save_pngs = plot_options.get("save_pngs", False)
     casename = ds.attrs["title"]
     if save_pngs:
         root_dir = plot_options.get("root_dir", "images")
-        kwargs = plot_options.get("savefig_kwargs", {})
+        kwargs = _get_savefig_kwargs(plot_options)
         isel_dict = plot_options.get("isel_dict", {})
-        t_beg = ds[ds["time"].attrs["bounds"]].values[0, 0]
+        time_bound = _get_time_bound(ds, da).values
+        t_beg = time_bound[0, 0]
         t_str_beg = f"{t_beg.year:04}-{t_beg.month:02}-{t_beg.day:02}"
-        t_end = ds[ds["time"].attrs["bounds"]].values[-1, -1] - datetime.timedelta(
-            days=1
-        )
+        t_end = time_bound[-1, -1] - datetime.timedelta(days=1)
         t_str_end = f"{t_end.year:04}-{t_end.month:02}-{t_end.day:02}"
+        trend_hist = TrendHistClass(da, casename, t_str_beg, t_str_end, isel_dict)
+        trend_map = TrendMapClass(da, casename, t_str_beg, t_str_end, isel_dict)
+        render_opts = dict(
+            vmin=vmin,
+            vmax=vmax,
+            invert_yaxis=invert_yaxis,
+            map_lod=plot_options.get("map_lod"),
+        )
+        hist_up_to_date = _is_up_to_date(
+            trend_hist, ds, da, 0, -1, plot_options, **render_opts
+        )
+        map_up_to_date = _is_up_to_date(
+            trend_map, ds, da, 0, -1, plot_options, **render_opts
+        )
+        if hist_up_to_date and map_up_to_date:
+            return
+    else:
+        hist_up_to_date = False
+        map_up_to_date = False
 
     trend = da.polyfit("time", 1).polyfit_coefficients.sel(degree=1)
     trend.name = da.name + " Trend"
@@ -336,29 +513,137 @@ def trend_plot(ds, da, vmin=None, vmax=None, invert_yaxis=False, **plot_options)
     nsec_per_yr = 1.0e9 * 86400 * 365
     trend = nsec_per_yr * trend
     trend.attrs["units"] = da.attrs["units"] + "/yr"
-    trend.load()
+    with span("trend_plot.compute"):
+        trend.load()
 
-    fig, ax = plt.subplots()
-    trend.plot.hist(bins=20, log=True, ax=ax)
-    plt.title(da._title_for_slice())
-    if save_pngs:
-        trend_hist = TrendHistClass(da, casename, t_str_beg, t_str_end, isel_dict)
-        trend_hist.savefig(fig, root_dir=root_dir, **kwargs)
-    else:
-        plt.show()
-    plt.close(fig)
+    if not hist_up_to_date:
+        fig, ax = plt.subplots()
+        trend.plot.hist(bins=20, log=True, ax=ax)
+        plt.title(da._title_for_slice())
+        if save_pngs:
+            trend_hist.savefig(
+                fig, root_dir=root_dir, writer=plot_options.get("writer"), **kwargs
+            )
+        else:
+            plt.show()
+        plt.close(fig)
+
+    if not map_up_to_date:
+        # Optionally reduce map to the resolution of the image
+        # (the histogram above uses the full resolution trend)
+        map_lod = plot_options.get("map_lod")
+        if map_lod is not None:
+            trend = coarsen_for_display(
+                trend,
+                _get_lod_weights(ds, trend),
+                method=map_lod,
+                dpi=plot_options.get("savefig_kwargs", {}).get("dpi"),
+            )
+        fig, ax = plt.subplots()
+        trend.plot.pcolormesh(cmap="plasma", vmin=vmin, vmax=vmax, ax=ax)
+        plt.title(da._title_for_slice())
+        if invert_yaxis:
+            ax.invert_yaxis()
+        if save_pngs:
+            trend_map.savefig(
+                fig, root_dir=root_dir, writer=plot_options.get("writer"), **kwargs
+            )
+        else:
+            plt.show()
+        plt.close(fig)
 
-    fig, ax = plt.subplots()
-    trend.plot.pcolormesh(cmap="plasma", vmin=vmin, vmax=vmax, ax=ax)
-    plt.title(da._title_for_slice())
-    if invert_yaxis:
-        ax.invert_yaxis()
-    if save_pngs:
-        trend_map = TrendMapClass(da, casename, t_str_beg, t_str_end, isel_dict)
-        trend_map.savefig(fig, root_dir=root_dir, **kwargs)
-    else:
-        plt.show()
-    plt.close(fig)
+
+################################################################################
+
+
+def _get_time_bound(ds, da):
+    """time_bound of ds at the time levels of da (which may be a time slice of ds)"""
+    time_bound = ds[ds["time"].attrs["bounds"]]
+    if "time" in da.dims:
+        time_bound = time_bound.sel(time=da["time"])
+    return time_bound
+
+
+def _is_monthly(ds, da):
+    """True if ds has time bounds, and each time level of da spans a month"""
+    if "bounds" not in ds["time"].attrs or "time" not in da.dims:
+        return False
+    days = get_time_weights(_get_time_bound(ds, da)).values
+    return bool(((days >= 28) & (days <= 31)).all())
+
+
+def _coarsen_time(ds, da, time_coarsen_len):
+    """
+    Means of da over consecutive blocks of time_coarsen_len time levels (a partial
+    block at the end is dropped); 12 monthly levels are averaged into annual means
+    weighted by the length of each month instead, of complete years only
+    """
+    if time_coarsen_len == 12 and _is_monthly(ds, da):
+        time_bound = _get_time_bound(ds, da).load()
+        return temporal_mean(da, time_bound, "annual")
+    tlen = len(da.time)
+    tlen_trunc = (tlen // time_coarsen_len) * time_coarsen_len
+    da_trunc = da.isel(time=slice(0, tlen_trunc))
+    return da_trunc.coarsen({"time": time_coarsen_len}).mean()
+
+
+def _is_up_to_date(plot_obj, ds, da, t_ind_beg, t_ind_end, plot_options, **render_opts):
+    """
+    Fingerprint the inputs to the image described by plot_obj: the files ds was read
+    from that overlap time levels t_ind_beg through t_ind_end of da, plus render_opts
+    and the savefig kwargs (e.g. dpi).
+    Return True if the image on disk was generated from identical inputs, in which
+    case it does not need to be computed or rendered again.
+
+    Set plot_options["incremental"] = False to regenerate images regardless.
+    """
+    source_files = get_source_files(ds)
+    if not source_files:
+        # Without knowing where the data came from, there is no way to tell if it changed
+        return False
+
+    time_bound = _get_time_bound(ds, da).values
+    time_window = (time_bound[t_ind_beg, 0], time_bound[t_ind_end, -1])
+    input_files = files_in_time_window(source_files, *time_window)
+    plot_obj.set_fingerprint(
+        input_files,
+        time_window,
+        savefig_kwargs=plot_options.get("savefig_kwargs", {}),
+        **render_opts,
+    )
+
+    if not plot_options.get("incremental", True):
+        return False
+    return plot_obj.is_up_to_date(
+        plot_options.get("root_dir", "images"),
+        previews=plot_options.get("previews", False),
+    )
+
+
+################################################################################
+
+
+def _get_savefig_kwargs(plot_options):
+    """
+    kwargs for plot_obj.savefig(): plot_options["savefig_kwargs"], plus the
+    thumbnails / previews requested by plot_options["previews"]
+    """
+    kwargs = dict(plot_options.get("savefig_kwargs", {}))
+    kwargs["previews"] = plot_options.get("previews", False)
+    return kwargs
+
+
+################################################################################
+
+
+def _get_lod_weights(ds, da):
+    """
+    Return TAREA (to weight block means when coarsening maps) if it is defined on the
+    same horizontal grid as da, otherwise None
+    """
+    if "TAREA" in ds and ds["TAREA"].dims == da.dims[-2:]:
+        return ds["TAREA"]
+    return None
 
 
 ################################################################################
@@ -0,0 +1,341 @@
+"""
+    Class that persists reduced diagnostics (global / regional means and integrals,
+    histogram counts, and annual-mean maps) of each case and variable, one small
+    netCDF file per year, so plots can be re-rendered without reading model output
+"""
+
+import glob
+import json
+import os
+
+import numpy as np
+import xarray as xr
+
+# local modules, not available through __init__
+from .utils_regions import REGION_VARS, reduce_regions
+from .utils_time import temporal_mean
+
+# bump when the contents of the year files change, so they are rewritten
+STORE_VERSION = 1
+
+# number of bins in each stored histogram (same as summary_plot_histogram)
+HIST_BINS = 20
+
+_time_units = "days since 0001-01-01 00:00:00"
+
+################################################################################
+
+
+def is_reduced_dataset(ds):
+    """True if ds was returned by ReducedStoreClass.open()"""
+    return "reduced_store_version" in ds.attrs
+
+
+def get_reduced_da(ds):
+    """
+    Placeholder DataArray for a Dataset returned by ReducedStoreClass.open(), with the
+    name, attributes, and (scalar) selection coordinates of the original variable;
+    pass it to the summary_plot_* functions as da
+    """
+    da = xr.DataArray(
+        np.nan,
+        coords={coord: ds[coord] for coord in ds.coords if ds[coord].dims == tuple()},
+        attrs={key: ds.attrs[key] for key in ["units", "long_name"] if key in ds.attrs},
+        name=ds.attrs["varname"],
+    )
+    return da
+
+
+def _histograms(values, apply_log10):
+    """(counts, edges) arrays of one histogram per time level (NaNs are ignored)"""
+    if apply_log10:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values = np.log10(np.where(values > 0, values, np.nan))
+    counts = []
+    edges = []
+    # same bins as HistRendererClass.compute_histograms(), per time level
+    for values_t in values.reshape(values.shape[0], -1):
+        counts_t, edges_t = np.histogram(
+            values_t[np.isfinite(values_t)], bins=HIST_BINS
+        )
+        counts.append(counts_t)
+        edges.append(edges_t)
+    return np.array(counts), np.array(edges)
+
+
+################################################################################
+
+
+class ReducedStoreClass(object):
+    def __init__(self, store_root, casename):
+        """
+            store_root: directory containing the store of every case
+            casename: name of the case (title of datasets it writes)
+
+            Reduced diagnostics of varname (with isel_dict applied) for each year
+            are written to {store_root}/{casename}/{varname}{isel_str}/
+            {varname}{isel_str}.{YYYY}0101-{YYYY}1231.nc
+        """
+        self.store_root = store_root
+        self.casename = casename
+
+    ############################################################################
+
+    def _get_prefix(self, varname, isel_dict):
+        isel_str = "".join(
+            f".{dim}_{ind}" for dim, ind in sorted((isel_dict or {}).items())
+        )
+        return f"{varname}{isel_str}"
+
+    def get_dir(self, varname, isel_dict=None):
+        return os.path.join(
+            self.store_root, self.casename, self._get_prefix(varname, isel_dict)
+        )
+
+    def get_year_path(self, varname, year, isel_dict=None):
+        prefix = self._get_prefix(varname, isel_dict)
+        return os.path.join(
+            self.get_dir(varname, isel_dict), f"{prefix}.{year:04}0101-{year:04}1231.nc"
+        )
+
+    ############################################################################
+
+    def _get_inputs(self, source_files, regions):
+        """everything a year file depends on, saved in (and compared to) its attrs"""
+        file_stats = []
+        for filename in sorted(source_files):
+            try:
+                mtime = os.path.getmtime(filename)
+            except OSError:
+                mtime = None
+            file_stats.append([filename, mtime])
+        return json.dumps(
+            dict(version=STORE_VERSION, source_files=file_stats, regions=regions),
+            sort_keys=True,
+        )
+
+    def is_year_current(
+        self, varname, year, source_files, isel_dict=None, regions=None
+    ):
+        """
+            True if the year file exists, and was written by this version of the store
+            from the same source files (with the same modification times) and regions
+        """
+        path = self.get_year_path(varname, year, isel_dict)
+        if not os.path.isfile(path):
+            return False
+        with xr.open_dataset(path, decode_times=False) as ds:
+            inputs = ds.attrs.get("reduced_store_inputs")
+        return inputs == self._get_inputs(source_files, regions)
+
+    ############################################################################
+
+    def reduce_year(self, ds, varname, isel_dict=None, regions=None):
+        """
+            Return Dataset with the reduced diagnostics of ds[varname].isel(isel_dict):
+            * mean, integral (time, region): TAREA-weighted over Global and regions
+            * hist_counts, hist_edges (time, log10, bin / edge): HIST_BINS bin histogram
+              of each time level, of the values and of their log10
+            * annual_mean (annual_time, ...): time_bound-weighted mean of the full
+              year (only if ds covers the full year)
+            All values are in the units of the model output (display units are applied
+            when plotting). The variable is read once, and every product is computed
+            from the values in memory.
+        """
+        da = ds[varname].isel(isel_dict or {}).load()
+        time_bound_name = ds["time"].attrs["bounds"]
+        time_bound = ds[time_bound_name].load()
+
+        region_list = ["Global"] + [
+            region for region in (regions or []) if region != "Global"
+        ]
+        if region_list == ["Global"] and any(var not in ds for var in REGION_VARS):
+            # global reductions do not need region masks
+            weights = ds["TAREA"].fillna(0)
+            da_weighted = da.weighted(weights)
+            mean = da_weighted.mean(dim=da.dims[-2:]).expand_dims(
+                region=region_list, axis=-1
+            )
+            integral = da_weighted.sum(dim=da.dims[-2:]).expand_dims(
+                region=region_list, axis=-1
+            )
+            integral.attrs["units"] = f"{da.attrs['units']} {weights.attrs['units']}"
+        else:
+            mean, integral = reduce_regions(da, ds, region_list)
+
+        ds_out = xr.Dataset(coords={"log10": ("log10", [0, 1])})
+        for name, reduced in [("mean", mean), ("integral", integral)]:
+            ds_out[name] = reduced.drop_vars(
+                [coord for coord in reduced.coords if reduced[coord].dims == tuple()]
+            )
+            ds_out[name].attrs = {"units": reduced.attrs.get("units", "")}
+
+        hist = [_histograms(da.values, apply_log10) for apply_log10 in [False, True]]
+        ds_out["hist_counts"] = (
+            ("time", "log10", "bin"),
+            np.stack([counts for counts, _ in hist], axis=1),
+        )
+        ds_out["hist_edges"] = (
+            ("time", "log10", "edge"),
+            np.stack([edges for _, edges in hist], axis=1),
+        )
+        ds_out[time_bound_name] = time_bound.drop_vars(
+            [coord for coord in time_bound.coords if coord != "time"]
+        )
+        ds_out["time"].attrs["bounds"] = time_bound_name
+        # selection coordinates (e.g. z_t), used in plot titles and filenames
+        for coord in da.coords:
+            if da[coord].dims == tuple():
+                ds_out.coords[coord] = da[coord]
+
+        annual = temporal_mean(da, time_bound, "annual")
+        if annual.sizes["time"] > 0:
+            annual = annual.rename(time="annual_time").drop_vars("year")
+            ds_out["annual_mean"] = annual.drop_vars(
+                [coord for coord in annual.coords if annual[coord].dims == tuple()]
+            ).astype(np.float32)
+        return ds_out
+
+    ############################################################################
+
+    def update(
+        self,
+        case,
+        diag_metadata,
+        stream="pop.h",
+        start_year=1,
+        end_year=61,
+        **gen_dataset_kwargs,
+    ):
+        """
+            Write the year files of diag_metadata["varname"] (with
+            diag_metadata["isel_dict"] applied, and regional reductions for
+            diag_metadata["regions"]) from start_year through end_year, skipping years
+            without output and years whose files are already current.
+
+            Returns list of years that were written
+        """
+        varname = diag_metadata["varname"]
+        isel_dict = diag_metadata.get("isel_dict")
+        regions = diag_metadata.get("regions")
+        if regions is not None:
+            regions = list(regions)
+            vars_to_keep = gen_dataset_kwargs.get("vars_to_keep") or []
+            gen_dataset_kwargs["vars_to_keep"] = list(vars_to_keep) + [
+                var for var in REGION_VARS if var not in vars_to_keep
+            ]
+
+        years_written = []
+        for year in range(start_year, end_year + 1):
+            source_files = case.get_dataset_files(varname, stream, year, year)
+            if not source_files:
+                continue
+            if self.is_year_current(varname, year, source_files, isel_dict, regions):
+                continue
+            ds = case.gen_dataset(
+                varname, stream, start_year=year, end_year=year, **gen_dataset_kwargs,
+            )
+            ds_out = self.reduce_year(ds, varname, isel_dict, regions)
+            ds_out.attrs = dict(
+                title=self.casename,
+                varname=varname,
+                isel_dict=json.dumps(isel_dict or {}),
+                reduced_store_version=STORE_VERSION,
+                reduced_store_inputs=self._get_inputs(source_files, regions),
+            )
+            for key in ["units", "long_name"]:
+                if key in ds[varname].attrs:
+                    ds_out.attrs[key] = ds[varname].attrs[key]
+            path = self.get_year_path(varname, year, isel_dict)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write to a temporary file, so readers never see a partial year
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            encoding = {
+                var: {"units": _time_units}
+                for var in ["time", ds["time"].attrs["bounds"], "annual_time"]
+                if var in ds_out.variables
+            }
+            ds_out.to_netcdf(tmp_path, encoding=encoding)
+            os.replace(tmp_path, path)
+            years_written.append(year)
+        return years_written
+
+    ############################################################################
+
+    def open(self, varname, isel_dict=None, start_year=None, end_year=None):
+        """
+            Return Dataset with the reduced diagnostics of varname from start_year
+            through end_year (default: every year in the store), which the
+            summary_plot_global_ts and summary_plot_histogram functions accept in place
+            of the output of gen_dataset() (with get_reduced_da() as da)
+        """
+        prefix = self._get_prefix(varname, isel_dict)
+        paths = sorted(
+            glob.glob(os.path.join(self.get_dir(varname, isel_dict), f"{prefix}.*.nc"))
+        )
+        # year files end with .{YYYY}0101-{YYYY}1231.nc
+        paths = [
+            path
+            for path in paths
+            if (start_year is None or int(path[-20:-16]) >= start_year)
+            and (end_year is None or int(path[-20:-16]) <= end_year)
+        ]
+        if not paths:
+            raise ValueError(f"{prefix} is not in the store for {self.casename}")
+
+        ds_list = []
+        for path in paths:
+            with xr.open_dataset(path, use_cftime=True) as ds_year:
+                if ds_year.attrs.get("reduced_store_version") != STORE_VERSION:
+                    raise ValueError(f"{path} is from another version of the store")
+                ds_list.append(ds_year.load())
+        # regions may differ between years, so only keep those in every year
+        regions = [
+            region
+            for region in ds_list[0]["region"].values
+            if all(region in ds_year["region"].values for ds_year in ds_list)
+        ]
+        ds_list = [ds_year.sel(region=regions) for ds_year in ds_list]
+        ds = xr.concat(
+            [
+                ds_year.drop_vars(["annual_mean", "annual_time"], errors="ignore")
+                for ds_year in ds_list
+            ],
+            dim="time",
+            data_vars="minimal",
+            coords="minimal",
+            compat="override",
+            combine_attrs="override",
+        )
+        annual = [
+            ds_year["annual_mean"] for ds_year in ds_list if "annual_mean" in ds_year
+        ]
+        if annual:
+            ds["annual_mean"] = xr.concat(annual, dim="annual_time")
+        ds.attrs = dict(ds_list[0].attrs)
+        ds.attrs.pop("reduced_store_inputs", None)
+        ds["time"].attrs["bounds"] = ds_list[0]["time"].attrs.get(
+            "bounds", "time_bound"
+        )
+        # fingerprint images by the store files they were rendered from
+        ds.encoding["source_files"] = paths
+        return ds
+
+    ############################################################################
+
+    def get_trend(self, varname, isel_dict=None, start_year=None, end_year=None):
+        """
+            Return the linear trend (per year) of the annual-mean maps of varname from
+            start_year through end_year, computed from the store
+        """
+        ds = self.open(varname, isel_dict, start_year, end_year)
+        if "annual_mean" not in ds or ds.sizes["annual_time"] < 2:
+            raise ValueError(f"{varname} needs at least two full years for a trend")
+        years = [date.year for date in ds["annual_time"].values]
+        annual = ds["annual_mean"].assign_coords(annual_time=years)
+        coeffs = annual.polyfit("annual_time", 1, skipna=True)
+        trend = coeffs["polyfit_coefficients"].sel(degree=1, drop=True)
+        trend.name = f"{varname} Trend"
+        trend.attrs["long_name"] = f"{ds.attrs.get('long_name', varname)} Trend"
+        trend.attrs["units"] = f"{ds.attrs.get('units', '')}/yr"
+        return trend
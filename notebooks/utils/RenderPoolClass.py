@@ -0,0 +1,190 @@
+"""
+    Class to render and save PNGs in a pool of worker processes
+
+    The notebook process reduces the data (e.g. a single 2D map, or histogram counts)
+    and hands small numpy arrays plus the plot type object to the pool; each worker
+    draws with the object-oriented Agg API (see RendererClass.py) and writes the PNG
+    and JSON files itself.
+"""
+
+import multiprocessing
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+# local modules, not available through __init__
+from .RendererClass import MapRendererClass, HistRendererClass
+
+# Renderers are reused across images within each worker process,
+# keyed by (renderer name, renderer kwargs)
+_renderer_classes = {"map": MapRendererClass, "hist": HistRendererClass}
+_worker_renderers = dict()
+
+################################################################################
+
+
+def _render_and_save(
+    renderer_name, renderer_kwargs, method, method_kwargs, plot_obj, root_dir, kwargs
+):
+    """
+        Runs in a worker process: draw an image with a (cached) renderer,
+        then save PNG and JSON files via plot_obj.savefig(); returns the metadata
+        written to the JSON file (plot_obj in the parent process does not get the
+        paths, e.g. filepath, that savefig() adds)
+    """
+    key = (renderer_name, tuple(sorted(renderer_kwargs.items())))
+    if key not in _worker_renderers:
+        _worker_renderers[key] = _renderer_classes[renderer_name](**renderer_kwargs)
+    renderer = _worker_renderers[key]
+    fig = getattr(renderer, method)(**method_kwargs)
+    plot_obj.savefig(fig, root_dir=root_dir, **kwargs)
+    return plot_obj.metadata
+
+
+################################################################################
+
+
+class RenderPoolClass(object):
+    def __init__(self, max_workers=None, max_pending=None, mp_context="spawn"):
+        """
+            max_workers: number of worker processes (default: number of cores)
+            max_pending: maximum number of images submitted but not yet rendered;
+                         submitting more blocks until the oldest one is done
+                         (default: 2 * max_workers)
+            mp_context: multiprocessing start method; "spawn" avoids forking a
+                        process that may have dask / matplotlib threads running
+        """
+        if max_workers is None:
+            max_workers = os.cpu_count()
+        if max_pending is None:
+            max_pending = 2 * max_workers
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context(mp_context),
+        )
+        self._max_pending = max_pending
+        self._pending = []
+        self._results = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    ############################################################################
+
+    def _submit(
+        self,
+        renderer_name,
+        renderer_kwargs,
+        method,
+        method_kwargs,
+        plot_obj,
+        root_dir,
+        savefig_kwargs,
+    ):
+        while len(self._pending) >= self._max_pending:
+            self._collect(self._pending.pop(0))
+        future = self._executor.submit(
+            _render_and_save,
+            renderer_name,
+            renderer_kwargs,
+            method,
+            method_kwargs,
+            plot_obj,
+            root_dir,
+            savefig_kwargs if savefig_kwargs is not None else dict(),
+        )
+        self._pending.append((plot_obj, future))
+
+    def _collect(self, pending):
+        """wait for a single image, and record its result (or error)"""
+        plot_obj, future = pending
+        result = dict(plot_type=plot_obj.metadata["plot_type"], filepath=None)
+        try:
+            result["metadata"] = future.result()
+            result["filepath"] = result["metadata"]["filepath"]
+            result["error"] = None
+        except Exception as err:
+            # nothing was saved, so the metadata is what was submitted
+            result["metadata"] = plot_obj.metadata
+            result["error"] = "".join(
+                traceback.format_exception(type(err), err, err.__traceback__)
+            )
+        self._results.append(result)
+
+    ############################################################################
+
+    def submit_map(
+        self,
+        plot_obj,
+        map_args,
+        root_dir="images",
+        savefig_kwargs=None,
+        cmap="plasma",
+        vmin=None,
+        vmax=None,
+    ):
+        """
+            Render a map in a worker process and save it with plot_obj.savefig()
+            map_args: arguments to MapRendererClass.render(), see get_map_args()
+        """
+        renderer_kwargs = dict(cmap=cmap, vmin=vmin, vmax=vmax)
+        self._submit(
+            "map",
+            renderer_kwargs,
+            "render",
+            map_args,
+            plot_obj,
+            root_dir,
+            savefig_kwargs,
+        )
+
+    def submit_hist(
+        self,
+        plot_obj,
+        list_of_counts,
+        title="",
+        xlabel="",
+        root_dir="images",
+        savefig_kwargs=None,
+        bins=20,
+        log=True,
+    ):
+        """
+            Render a histogram in a worker process and save it with plot_obj.savefig()
+            list_of_counts: list of (counts, edges), see HistRendererClass.compute_histograms()
+        """
+        renderer_kwargs = dict(bins=bins, log=log)
+        method_kwargs = dict(list_of_counts=list_of_counts, title=title, xlabel=xlabel)
+        self._submit(
+            "hist",
+            renderer_kwargs,
+            "render_counts",
+            method_kwargs,
+            plot_obj,
+            root_dir,
+            savefig_kwargs,
+        )
+
+    def wait(self):
+        """
+            Wait for all submitted images to be written; return a list with one dict
+            per image (plot_type, filepath, metadata as saved by the worker, and
+            error, which is None or the traceback from the worker) since the
+            previous call to wait()
+        """
+        while self._pending:
+            self._collect(self._pending.pop(0))
+        results = self._results
+        self._results = []
+        return results
+
+    def close(self):
+        """
+            Wait for all submitted images, shut down the worker processes,
+            and return the same list of results as wait()
+        """
+        results = self.wait()
+        self._executor.shutdown()
+        return results
@@ -0,0 +1,212 @@
+"""
+    Classes that draw many similar images while reusing a single matplotlib figure
+
+    Building axes, colorbars and meshes dominates the cost of drawing a single map,
+    so these classes build them once (for the first image) and then only update the
+    data, color limits and title of the existing artists for subsequent images.
+    Figures are created with the object-oriented API (not pyplot), so they are not
+    affected by plt.show() / plt.close() calls elsewhere.
+"""
+
+import numpy as np
+import xarray as xr
+from IPython.display import display
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+################################################################################
+
+
+def get_map_args(da):
+    """
+        Return a dict with the arguments MapRendererClass.render() needs to draw da,
+        a 2D DataArray, the way da.plot() would label it
+    """
+    ydim, xdim = da.dims
+    map_args = dict()
+    map_args["values"] = da.values
+    map_args["x"] = da[xdim].values if xdim in da.coords else None
+    map_args["y"] = da[ydim].values if ydim in da.coords else None
+    map_args["xlabel"] = xr.plot.utils.label_from_attrs(da[xdim])
+    map_args["ylabel"] = xr.plot.utils.label_from_attrs(da[ydim])
+    map_args["title"] = da._title_for_slice()
+    map_args["cbar_label"] = xr.plot.utils.label_from_attrs(da)
+    return map_args
+
+
+################################################################################
+
+
+def _interval_breaks(coord, n):
+    """
+        Return n+1 cell edges for n cells centered on values of coord
+        (or on 0, 1, ..., n-1 if coord is None)
+    """
+    if coord is None:
+        return np.arange(n + 1) - 0.5
+    coord = np.asarray(coord, dtype=float)
+    if n == 1:
+        return np.array([coord[0] - 0.5, coord[0] + 0.5])
+    deltas = 0.5 * np.diff(coord)
+    first = coord[0] - deltas[0]
+    last = coord[-1] + deltas[-1]
+    return np.concatenate([[first], coord[:-1] + deltas, [last]])
+
+
+def _determine_extend(values, vmin, vmax):
+    """determine colorbar extensions the same way xarray does (values is masked)"""
+    extend_min = vmin is not None and values.min() < vmin
+    extend_max = vmax is not None and values.max() > vmax
+    if extend_min and extend_max:
+        return "both"
+    if extend_min:
+        return "min"
+    if extend_max:
+        return "max"
+    return "neither"
+
+
+################################################################################
+
+
+class _RendererBaseClass(object):
+    def __init__(self, figsize=None):
+        # Figure size and dpi default to rcParams, same as plt.subplots()
+        self.fig = Figure(figsize=figsize)
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot(111)
+
+    def render(self, *args, **kwargs):
+        raise NotImplementedError("This must be implemented in child class")
+
+    def show(self):
+        """display the current state of the figure in a notebook"""
+        display(self.fig)
+
+
+################################################################################
+
+
+class MapRendererClass(_RendererBaseClass):
+    def __init__(self, cmap="plasma", vmin=None, vmax=None, figsize=None):
+        """
+            cmap, vmin, vmax: same as in da.plot(); if vmin or vmax is None, it
+                              is determined separately for each map
+        """
+        super().__init__(figsize)
+        self.cmap = cmap
+        self.vmin = vmin
+        self.vmax = vmax
+        self._mesh = None
+        self._cbar = None
+        self._shape = None
+
+    def _build(self, values, x, y, xlabel, ylabel):
+        """create the axes and QuadMesh (only called for first map)"""
+        self.fig.clf()
+        self.ax = self.fig.add_subplot(111)
+        ny, nx = values.shape
+        self._mesh = self.ax.pcolormesh(
+            _interval_breaks(x, nx),
+            _interval_breaks(y, ny),
+            values,
+            cmap=self.cmap,
+            vmin=self.vmin,
+            vmax=self.vmax,
+        )
+        self._cbar = None
+        self.ax.set_xlabel(xlabel)
+        self.ax.set_ylabel(ylabel)
+        self._shape = values.shape
+
+    def render(
+        self, values, title="", x=None, y=None, xlabel="", ylabel="", cbar_label=""
+    ):
+        """
+            Draw 2D array values (dims are (y, x)) and return the figure;
+            arguments can be generated from a DataArray with get_map_args()
+        """
+        values = np.ma.masked_invalid(values)
+        if self._mesh is None or values.shape != self._shape:
+            self._build(values, x, y, xlabel, ylabel)
+        else:
+            # Older versions of matplotlib store QuadMesh arrays flattened
+            if self._mesh.get_array().ndim == 1:
+                self._mesh.set_array(values.ravel())
+            else:
+                self._mesh.set_array(values)
+        if self.vmin is None or self.vmax is None:
+            self._mesh.set_clim(
+                self.vmin if self.vmin is not None else values.min(),
+                self.vmax if self.vmax is not None else values.max(),
+            )
+        # colorbar extensions depend on the values of each map, and can not be
+        # changed on an existing colorbar, so it is rebuilt when they change
+        extend = _determine_extend(values, self.vmin, self.vmax)
+        if self._cbar is None or self._cbar.extend != extend:
+            if self._cbar is not None:
+                self._cbar.remove()
+            self._cbar = self.fig.colorbar(
+                self._mesh, ax=self.ax, label=cbar_label, extend=extend
+            )
+        self.ax.set_title(title)
+        return self.fig
+
+
+################################################################################
+
+
+class HistRendererClass(_RendererBaseClass):
+    def __init__(self, bins=20, log=True, figsize=None):
+        """
+            bins, log: same as in da.plot.hist(); each line in a plot gets
+                       its own set of bins
+        """
+        super().__init__(figsize)
+        self.bins = bins
+        self.log = log
+        self._lines = []
+        if log:
+            self.ax.set_yscale("log", nonpositive="clip")
+
+    def compute_histograms(self, list_of_values):
+        """
+            Return a list of (counts, edges) tuples, one per array in list_of_values
+            (NaNs are ignored); list_of_values can be a generator, so that only one
+            array is in memory at a time
+        """
+        list_of_counts = []
+        for values in list_of_values:
+            values = np.ravel(values)
+            list_of_counts.append(
+                np.histogram(values[np.isfinite(values)], bins=self.bins)
+            )
+        return list_of_counts
+
+    def render(self, list_of_values, title="", xlabel=""):
+        """
+            Draw one step histogram for each array in list_of_values (NaNs are ignored)
+            and return the figure; step lines from previous calls are reused
+        """
+        return self.render_counts(
+            self.compute_histograms(list_of_values), title=title, xlabel=xlabel
+        )
+
+    def render_counts(self, list_of_counts, title="", xlabel=""):
+        """
+            Same as render(), but for histograms that have already been computed
+            (list_of_counts is a list of (counts, edges) tuples)
+        """
+        for line in self._lines[len(list_of_counts) :]:
+            line.set_visible(False)
+        for n, (counts, edges) in enumerate(list_of_counts):
+            if n < len(self._lines):
+                self._lines[n].set_data(values=counts, edges=edges)
+                self._lines[n].set_visible(True)
+            else:
+                self._lines.append(self.ax.stairs(counts, edges, baseline=0))
+        self.ax.relim(visible_only=True)
+        self.ax.autoscale_view()
+        self.ax.set_xlabel(xlabel)
+        self.ax.set_title(title)
+        return self.fig
@@ -0,0 +1,352 @@
+"""
+    Class to verify that converting from history files to time series worked as expected
+
+    The list of history and time series files is built once (by a single CaseClass
+    object) and indexed by (stream, year), and only the headers of history files
+    are read, so checking every (year, stream) pair of a long run is cheap.
+
+    verify_contents() goes further and compares the values in (a sample of) the
+    history files to the corresponding time levels of the time series files.
+"""
+
+import json
+import multiprocessing
+import os
+import random
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import dask
+import netCDF4
+import pandas as pd
+import xarray as xr
+
+# local modules, not available through __init__
+from . import CaseClass
+
+# {varname}.{start}-{end}.nc, where start and end begin with 4-digit years
+_TS_SUFFIX_PATTERN = re.compile(r"^(?P<varname>.+)\.(\d{4})\d*-(\d{4})\d*\.nc$")
+
+################################################################################
+
+
+def _read_history_varnames(history_filenames, exclude_vars):
+    """
+        Runs in a worker process: return the sorted names of all variables with a
+        time dimension in any of history_filenames (only file headers are read)
+    """
+    varnames = set()
+    for filename in history_filenames:
+        with netCDF4.Dataset(filename) as ds:
+            varnames.update(
+                varname
+                for varname, var in ds.variables.items()
+                if "time" in var.dimensions and varname != "time"
+            )
+    return sorted(varnames - set(exclude_vars))
+
+
+def _write_json_atomic(filename, contents):
+    """write contents to a temporary file, then rename it, so filename is never partial"""
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, "w") as fp:
+        json.dump(contents, fp)
+    os.replace(tmp_filename, filename)
+
+
+################################################################################
+
+
+class TSVerifierClass(object):
+    def __init__(
+        self,
+        casename,
+        output_roots,
+        exclude_vars=["time_bound", "time_bounds"],
+        max_workers=None,
+    ):
+        """
+            casename, output_roots: same as CaseClass
+            exclude_vars: variables that are not expected to have time series
+                          (time_bound in POP and time_bounds in CICE)
+            max_workers: number of processes reading history file headers
+                         (default: number of cores; 1 reads them in this process)
+        """
+        self.casename = casename
+        self.exclude_vars = list(exclude_vars)
+        self.max_workers = max_workers if max_workers else os.cpu_count()
+        self._case = CaseClass.CaseClass(casename, output_roots)
+        self._ts_files = self._index_timeseries_files()
+
+    ############################################################################
+
+    def _index_timeseries_files(self):
+        """
+            Return dict mapping (stream, year) to a dict mapping each varname
+            with time series to the file containing that year
+        """
+        ts_files = dict()
+        for stream, filenames in self._case._timeseries_filenames.items():
+            prefix = f"{self.casename}.{stream}."
+            for filename in filenames:
+                basename = os.path.basename(filename)
+                if not basename.startswith(prefix):
+                    continue
+                match = _TS_SUFFIX_PATTERN.match(basename[len(prefix) :])
+                if match is None:
+                    continue
+                for year in range(int(match.group(2)), int(match.group(3)) + 1):
+                    ts_files.setdefault((stream, year), dict())[
+                        match.group("varname")
+                    ] = filename
+        return ts_files
+
+    def get_streams(self):
+        return list(self._case._stream_metadata)
+
+    def get_timeseries_varnames(self, year, stream):
+        """Return set of variables that have time series for stream in year"""
+        return set(self._ts_files.get((stream, year), dict()))
+
+    def get_history_files(self, year, stream):
+        return self._case.get_history_files(year, stream)
+
+    ############################################################################
+
+    def _gen_record(self, year, stream, history_filenames, hist_varnames):
+        """Return report entry for (year, stream)"""
+        record = dict(
+            year=year,
+            stream=stream,
+            status=None,
+            history_files=len(history_filenames),
+            vars_checked=0,
+            missing_vars=[],
+        )
+        if not self.get_timeseries_varnames(year, stream):
+            record["status"] = "no time series"
+        elif not history_filenames:
+            record["status"] = "no history"
+        else:
+            ts_varnames = self.get_timeseries_varnames(year, stream)
+            record["vars_checked"] = len(hist_varnames)
+            record["missing_vars"] = [
+                varname for varname in hist_varnames if varname not in ts_varnames
+            ]
+            record["status"] = "datasets differ" if record["missing_vars"] else "same"
+        return record
+
+    def verify(self, years, streams=None, skip=[]):
+        """
+            Check that every variable with a time dimension in the history files of
+            each (year, stream) pair also has a time series file covering that year.
+            History file headers for all pairs are read concurrently.
+
+            skip: list of (year, stream) pairs not to check
+
+            Returns a DataFrame with one row per (year, stream) and columns
+            year, stream, status ("same", "datasets differ", "no time series",
+            or "no history"), history_files, vars_checked, and missing_vars
+        """
+        if streams is None:
+            streams = self.get_streams()
+        pairs = [
+            (year, stream)
+            for year in years
+            for stream in streams
+            if (year, stream) not in skip
+        ]
+        history_filenames = {pair: self.get_history_files(*pair) for pair in pairs}
+        to_read = [
+            pair
+            for pair in pairs
+            if history_filenames[pair] and self.get_timeseries_varnames(*pair)
+        ]
+
+        if self.max_workers == 1:
+            hist_varnames = {
+                pair: _read_history_varnames(history_filenames[pair], self.exclude_vars)
+                for pair in to_read
+            }
+        else:
+            with ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as executor:
+                futures = {
+                    pair: executor.submit(
+                        _read_history_varnames,
+                        history_filenames[pair],
+                        self.exclude_vars,
+                    )
+                    for pair in to_read
+                }
+                hist_varnames = {
+                    pair: future.result() for pair, future in futures.items()
+                }
+
+        records = [
+            self._gen_record(
+                *pair, history_filenames[pair], hist_varnames.get(pair, [])
+            )
+            for pair in pairs
+        ]
+        return pd.DataFrame(
+            records,
+            columns=[
+                "year",
+                "stream",
+                "status",
+                "history_files",
+                "vars_checked",
+                "missing_vars",
+            ],
+        )
+
+    ############################################################################
+
+    def sample_history_files(self, year, stream, files_per_year=None, seed=0):
+        """
+            Return files_per_year history files of stream from year, chosen at random
+            (all of them if files_per_year is None); the same seed always picks
+            the same files, so a sampled verification can be resumed
+        """
+        history_filenames = self.get_history_files(year, stream)
+        if files_per_year is None or files_per_year >= len(history_filenames):
+            return history_filenames
+        rng = random.Random(f"{seed}.{stream}.{year:04}")
+        return sorted(rng.sample(history_filenames, files_per_year))
+
+    def compare_history_file(
+        self, year, stream, history_filename, varnames=None, chunk_size=None
+    ):
+        """
+            Compare every variable with a time dimension in history_filename (or just
+            varnames) to the same time levels of its time series file.
+            Arrays are compared chunk by chunk (time=1, other dims chunked by dask
+            to at most chunk_size bytes, default: dask config "array.chunk-size"),
+            and all variables are computed together in parallel by dask.
+
+            Returns a list with one dict per variable: year, stream, history_file,
+            varname, status ("same", "differ", "no time series", "missing time levels"),
+            and mismatches (number of values that differ; NaNs match NaNs)
+        """
+        ts_files = self._ts_files.get((stream, year), dict())
+        records = []
+        lazy_mismatches = []
+        datasets = []
+        try:
+            ds_hist = xr.open_dataset(history_filename)
+            datasets.append(ds_hist)
+            if varnames is None:
+                varnames = [
+                    varname
+                    for varname in ds_hist.data_vars
+                    if "time" in ds_hist[varname].dims
+                    and varname not in self.exclude_vars
+                ]
+            for varname in varnames:
+                record = dict(
+                    year=year,
+                    stream=stream,
+                    history_file=os.path.basename(history_filename),
+                    varname=varname,
+                    status=None,
+                    mismatches=None,
+                )
+                records.append(record)
+                if varname not in ts_files:
+                    record["status"] = "no time series"
+                    continue
+                ds_ts = xr.open_dataset(ts_files[varname])
+                datasets.append(ds_ts)
+                try:
+                    da_ts = ds_ts[varname].sel(time=ds_hist["time"].values)
+                except KeyError:
+                    record["status"] = "missing time levels"
+                    continue
+                da_hist = ds_hist[varname]
+                if da_ts.dims != da_hist.dims or da_ts.shape != da_hist.shape:
+                    record["status"] = "differ"
+                    continue
+                chunks = {dim: 1 if dim == "time" else "auto" for dim in da_hist.dims}
+                with dask.config.set(
+                    {"array.chunk-size": chunk_size} if chunk_size else {}
+                ):
+                    da_hist = da_hist.variable.chunk(chunks)
+                    da_ts = da_ts.variable.chunk(da_hist.chunks)
+                same = (da_hist == da_ts) | (da_hist.isnull() & da_ts.isnull())
+                lazy_mismatches.append((record, (~same).sum().data))
+
+            mismatches = dask.compute(*[lazy for _, lazy in lazy_mismatches])
+            for (record, _), mismatch in zip(lazy_mismatches, mismatches):
+                record["mismatches"] = int(mismatch)
+                record["status"] = "same" if mismatch == 0 else "differ"
+        finally:
+            for ds in datasets:
+                ds.close()
+        return records
+
+    def verify_contents(
+        self,
+        years,
+        streams=None,
+        varnames=None,
+        files_per_year=None,
+        seed=0,
+        state_file=None,
+        chunk_size=None,
+        skip=[],
+    ):
+        """
+            Compare values in history files to time series files, one history file
+            at a time (see compare_history_file()), so memory use is bounded by the
+            dask chunk size rather than the size of the files.
+
+            files_per_year: only check this many randomly chosen history files
+                            per year and stream (e.g. 2 random months per year)
+            state_file: JSON file where results are saved after each history file;
+                        history files already in state_file are not checked again,
+                        so an interrupted verification can be resumed
+            skip: list of (year, stream) pairs not to check
+
+            Returns a DataFrame with one row per (history file, variable), see
+            compare_history_file() for the columns
+        """
+        if streams is None:
+            streams = self.get_streams()
+        state = dict()
+        if state_file is not None and os.path.isfile(state_file):
+            with open(state_file) as fp:
+                state = json.load(fp)
+
+        records = []
+        for year in years:
+            for stream in streams:
+                if (year, stream) in skip:
+                    continue
+                for history_filename in self.sample_history_files(
+                    year, stream, files_per_year, seed
+                ):
+                    key = f"{stream}:{os.path.basename(history_filename)}"
+                    if varnames is not None:
+                        key += ":" + ",".join(varnames)
+                    if key not in state:
+                        state[key] = self.compare_history_file(
+                            year, stream, history_filename, varnames, chunk_size
+                        )
+                        if state_file is not None:
+                            _write_json_atomic(state_file, state)
+                    records.extend(state[key])
+
+        return pd.DataFrame(
+            records,
+            columns=[
+                "year",
+                "stream",
+                "history_file",
+                "varname",
+                "status",
+                "mismatches",
+            ],
+        )
@@ -1,6 +1,12 @@
 # make methods available for usage externally and in notebooks
 
 from .CaseClass import CaseClass
+from .IOPlannerClass import IOPlannerClass
+from .PlotCatalogClass import PlotCatalogClass
+from .PlotSuiteClass import PlotSuiteClass
+from .PlotWriterClass import PlotWriterClass
+from .ReducedStoreClass import ReducedStoreClass, get_reduced_da
+from .RenderPoolClass import RenderPoolClass
 from .Plotting import (
     compare_fields_at_lat_lon,
     plot_dict_with_date_keys,
@@ -14,4 +20,18 @@ from .utils import (
     get_varnames_from_metadata_list,
     timeseries_and_history_comparison,
     generate_plot_catalog,
+    extract_points_from_cases,
+)
+from .utils_grid import find_nearest_cells, format_lat_lon
+from .utils_catalog import read_plot_catalog, write_plot_catalog_parquet
+from .utils_regions import reduce_regions
+from .utils_time import temporal_mean, temporal_means
+from .utils_za import zonal_average, zonal_average_dataset
+from .utils_trace import (
+    enable_tracing,
+    disable_tracing,
+    reset_trace,
+    tracing,
+    write_chrome_trace,
+    get_trace_summary,
 )
@@ -0,0 +1,194 @@
+"""
+functions to fingerprint the inputs of saved images, so unchanged images can be skipped
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import re
+
+import cftime
+import numpy as np
+
+# Source files (relative to this directory) that determine how images look;
+# changing any of them changes every fingerprint
+_PLOT_CODE_FILES = [
+    "Plotting.py",
+    "PlotTypeClass.py",
+    "PlotWriterClass.py",
+    "ReducedStoreClass.py",
+    "RendererClass.py",
+    "fingerprint.py",
+    "utils_lod.py",
+    "utils_regions.py",
+    "utils_time.py",
+    "utils_units.py",
+]
+
+# time series files: {case}.{stream}.{varname}.{start}-{end}.nc, e.g. 000101-000112
+_RANGE_PATTERN = re.compile(r"\.(\d{4})(\d{2})?(\d{2})?-(\d{4})(\d{2})?(\d{2})?\.nc$")
+# history files: {case}.{stream}.{date}.nc, e.g. 0001-01 or 0001-01-01 or 0001-01-01-00000
+_INSTANT_PATTERN = re.compile(r"\.(\d{4})(?:-(\d{2}))?(?:-(\d{2}))?(?:-\d{5})?\.nc$")
+
+_plot_code_version = None
+
+################################################################################
+
+
+def get_plot_code_version():
+    """
+    Return a hash of the plotting source code, computed once per session
+    """
+    global _plot_code_version
+    if _plot_code_version is None:
+        sha = hashlib.sha256()
+        utils_dir = pathlib.Path(__file__).parent
+        for filename in _PLOT_CODE_FILES:
+            sha.update((utils_dir / filename).read_bytes())
+        _plot_code_version = sha.hexdigest()
+    return _plot_code_version
+
+
+################################################################################
+
+
+def get_source_files(ds):
+    """
+    Return list of netCDF files ds was read from (set by CaseClass.gen_dataset),
+    or an empty list if the sources are not known
+    """
+    return list(ds.encoding.get("source_files", []))
+
+
+################################################################################
+
+
+def _date_tuple(date):
+    """convert a cftime / datetime object to a (year, month, day) tuple"""
+    return (date.year, date.month, date.day)
+
+
+def _file_date_range(filename):
+    """
+    Return (start, end, end_inclusive) parsed from filename, where start and end are
+    (year, month, day) tuples; end is None if it can not be inferred from filename
+    """
+    basename = os.path.basename(filename)
+    match = _RANGE_PATTERN.search(basename)
+    if match:
+        yr0, mon0, day0, yr1, mon1, day1 = match.groups()
+        start = (int(yr0), int(mon0 or 1), int(day0 or 1))
+        end = (int(yr1), int(mon1 or 12), int(day1 or 31))
+        return start, end, True
+    match = _INSTANT_PATTERN.search(basename)
+    if match:
+        yr, mon, day = match.groups()
+        return (int(yr), int(mon or 1), int(day or 1)), None, False
+    return None
+
+
+def _stream_prefix(filename):
+    """
+    Return the basename of a history file up to its datestamp, e.g. {case}.{stream}
+    (None if filename is not named like a history file)
+    """
+    basename = os.path.basename(filename)
+    match = _INSTANT_PATTERN.search(basename)
+    return basename[: match.start()] if match else None
+
+
+def files_in_time_window(filenames, time_beg, time_end):
+    """
+    Return the subset of filenames that may contain data between time_beg and time_end
+
+    time_beg and time_end are cftime objects (time_end is exclusive, like the upper
+    time bound of a history file). History files are assumed to cover everything
+    from their own datestamp up to the datestamp of the next history file of the
+    same stream (files are grouped by the part of their name before the datestamp).
+    Files whose names can not be parsed, and windows that are not cftime objects,
+    are treated conservatively: every file is kept.
+    """
+    if not (
+        isinstance(time_beg, cftime.datetime) and isinstance(time_end, cftime.datetime)
+    ):
+        return list(filenames)
+    win_beg = _date_tuple(time_beg)
+    win_end = _date_tuple(time_end)
+
+    date_ranges = {filename: _file_date_range(filename) for filename in filenames}
+
+    # history files end where the next history file (by datestamp) of their stream
+    # begins
+    hist_starts = dict()
+    for filename, date_range in date_ranges.items():
+        if date_range is not None and date_range[1] is None:
+            hist_starts.setdefault(_stream_prefix(filename), set()).add(date_range[0])
+    hist_starts = {prefix: sorted(starts) for prefix, starts in hist_starts.items()}
+
+    files_out = []
+    for filename in filenames:
+        date_range = date_ranges[filename]
+        if date_range is None:
+            files_out.append(filename)
+            continue
+        start, end, end_inclusive = date_range
+        if end is None:
+            later_starts = [
+                hist_start
+                for hist_start in hist_starts[_stream_prefix(filename)]
+                if hist_start > start
+            ]
+            end = later_starts[0] if later_starts else None
+        if start >= win_end:
+            continue
+        if end is not None:
+            if end_inclusive and end < win_beg:
+                continue
+            if not end_inclusive and end <= win_beg:
+                continue
+        files_out.append(filename)
+    return files_out
+
+
+################################################################################
+
+
+def _json_default(obj):
+    """convert objects json does not know about (numpy scalars, cftime) to str"""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
+
+
+def gen_fingerprint(input_files, time_window, metadata, render_opts):
+    """
+    Return a hex digest identifying everything that goes into a single image:
+    * paths and modification times of input_files
+    * time_window (beginning and end of the plotted period)
+    * metadata describing the image (plot type, variable, selection, ...)
+    * render_opts (e.g. the diag_metadata entry, vmin / vmax)
+    * the version of the plotting code
+    """
+    file_stats = []
+    for filename in sorted(input_files):
+        try:
+            mtime = os.path.getmtime(filename)
+        except OSError:
+            mtime = None
+        file_stats.append([filename, mtime])
+
+    inputs = dict()
+    inputs["input_files"] = file_stats
+    inputs["time_window"] = [str(time_window[0]), str(time_window[1])]
+    inputs["metadata"] = {
+        key: value
+        for key, value in metadata.items()
+        # output paths (filepath, preview_filepath, ...) are not inputs
+        if key != "fingerprint" and not key.endswith("filepath")
+    }
+    inputs["render_opts"] = render_opts
+    inputs["plot_code_version"] = get_plot_code_version()
+
+    inputs_str = json.dumps(inputs, sort_keys=True, default=_json_default)
+    return hashlib.sha256(inputs_str.encode()).hexdigest()
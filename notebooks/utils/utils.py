@@ -1,16 +1,20 @@
 """utility functions"""
 
 import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import cftime
 import numpy as np
 import xarray as xr
 import pathlib
 import pandas as pd
-import json
 
 from .compare_ts_and_hist import compare_ts_and_hist
+from .TSVerifierClass import TSVerifierClass
 from .cime import cime_xmlquery
+from .PlotCatalogClass import PlotCatalogClass
+from .utils_trace import traced
 
 ################################################################################
 
@@ -36,6 +40,7 @@ def repl_coord(coordname, ds1, ds2):
 ################################################################################
 
 
+@traced()
 def time_set_mid(ds, time_name, deep=False):
     """
     Return copy of ds with values of ds[time_name] replaced with midpoints of
@@ -145,43 +150,118 @@ def gen_output_roots_from_caseroot(caseroot):
 ################################################################################
 
 
-def timeseries_and_history_comparison(casename, output_roots):
-    for year in range(1, 62):
-        has_ts = True
-        found_all = True
+def timeseries_and_history_comparison(
+    casename,
+    output_roots,
+    max_workers=None,
+    check_values=False,
+    files_per_year=None,
+    state_file=None,
+):
+    """
+    Check that every variable in the history files of each year and stream has
+    time series files (all years and streams are checked concurrently), print a
+    summary for each year, and return the report from TSVerifierClass.verify()
+
+    If check_values is True, also compare the values in the history files (or
+    files_per_year randomly chosen history files per year) to the time series;
+    variables whose values differ are listed in the report's values_differ column.
+    Results are saved to state_file (if provided) so the comparison can be resumed.
+    """
+    streams = ["pop.h.nyear1", "pop.h.nday1", "pop.h", "cice.h1", "cice.h"]
+    verifier = TSVerifierClass(casename, output_roots, max_workers=max_workers)
+    # There is no cice.h1 time series for 0001 so skip check
+    skip = [(1, "cice.h1")]
+    report = verifier.verify(range(1, 62), streams, skip=skip)
+
+    report["values_differ"] = [[] for _ in range(len(report))]
+    if check_values:
+        # Only compare values where every variable has time series
+        skip += [
+            (entry.year, entry.stream)
+            for entry in report.itertuples()
+            if entry.status != "same"
+        ]
+        values_report = verifier.verify_contents(
+            range(1, 62),
+            streams,
+            files_per_year=files_per_year,
+            state_file=state_file,
+            skip=skip,
+        )
+        differ = values_report[values_report["status"] != "same"]
+        for ind, entry in enumerate(report.itertuples()):
+            report.at[ind, "values_differ"] = sorted(
+                differ.loc[
+                    (differ["year"] == entry.year) & (differ["stream"] == entry.stream),
+                    "varname",
+                ].unique()
+            )
+
+    for year, report_year in report.groupby("year", sort=True):
         print(f"Checking year {year:04}...")
-        for stream in ["pop.h.nyear1", "pop.h.nday1", "pop.h", "cice.h1", "cice.h"]:
-            has_hist = True
-            # There is no cice.h1 time series for 0001 so skip check
-            if stream == "cice.h1" and year == 1:
-                continue
-            # Run test
-            print(f"... checking stream {stream} ...")
-            comp_test = compare_ts_and_hist(casename, output_roots, stream, year)
-            # Check ends when there are no history files for comparison
-            if comp_test == "no time series":
-                has_ts = False
-                break
-
+        # Check ends when there are no time series for comparison
+        if (report_year["status"] == "no time series").any():
+            print(f"Could not find time series for year {year:04}")
+            break
+        for entry in report_year.itertuples():
+            for varname in entry.missing_vars:
+                print(f"No time series files for {varname} in year {year:04}")
+            for varname in entry.values_differ:
+                print(
+                    f"Time series values for {varname} differ from {entry.stream} history files in year {year:04}"
+                )
             # Skip years when there are no history files
             # (Assume those years were already checked prior to deleting history files)
-            if comp_test == "no history":
+            if entry.status == "no history":
                 print(
-                    f"Skipping stream {stream} for year {year:04} because there are no history files"
+                    f"Skipping stream {entry.stream} for year {year:04} because there are no history files"
                 )
-                has_hist = False
-                continue
-
-            found_all = found_all and (comp_test == "same")
-
-        if not has_ts:
-            print(f"Could not find time series for year {year:04}")
-            break
-        if has_hist and found_all:
+        if (report_year["status"] == "same").all():
             print(f"All variables available in time series for year {year:04}")
         else:
             print(f"Could not find time series for all variables in year {year:04}")
+        if check_values and (report_year["status"] == "same").all():
+            if report_year["values_differ"].map(len).sum() == 0:
+                print(f"Time series values match history files for year {year:04}")
         print("----")
+    return report
+
+
+################################################################################
+
+
+def extract_points_from_cases(
+    cases, varname, stream, nlat, nlon, max_workers=None, **kwargs
+):
+    """
+    Call extract_points() on every CaseClass object in cases (a dict or list),
+    with the files of all cases read by a single pool of max_workers processes.
+    kwargs (e.g. start_year, end_year) are passed to extract_points().
+
+    Returns a dict (or list) of DataArrays with the same keys as cases
+    """
+    keys = list(cases) if isinstance(cases, dict) else range(len(cases))
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        # each thread only submits reads to executor and waits for them,
+        # so files from every case are read at the same time
+        with ThreadPoolExecutor(max_workers=len(keys)) as case_executor:
+            futures = {
+                key: case_executor.submit(
+                    cases[key].extract_points,
+                    varname,
+                    stream,
+                    nlat,
+                    nlon,
+                    executor=executor,
+                    **kwargs,
+                )
+                for key in keys
+            }
+            points = {key: future.result() for key, future in futures.items()}
+    return points if isinstance(cases, dict) else [points[key] for key in keys]
 
 
 ################################################################################
@@ -221,16 +301,26 @@ def print_key_metadata(ds, msg=None):
 
 
 def generate_plot_catalog(
-    root_dir, image_dir_name="images", extension=".json", use_full_path=True
+    root_dir,
+    image_dir_name="images",
+    extension=".json",
+    use_full_path=True,
+    casename=None,
+    plot_type=None,
 ):
     """
-    Generate a single dataframe from plot attributes saved in json files.
+    Generate a single dataframe from plot attributes saved in the plot catalog
+    ({root_dir}/{image_dir_name}/plot_catalog.sqlite, written by savefig).
+    The first time a catalog is read, attributes saved in json files by earlier
+    versions of savefig are added to it.
     Parameters
     ----------
     root_dir : str, pathlib.Path
           The root directory
     extension : str, default `.json.`
-          file extension to look for.
+          file extension to look for when adding json files to the catalog.
+    casename, plot_type : str, optional
+          only return plots for this case / plot type
 
     Returns
     -------
@@ -238,18 +328,18 @@ def generate_plot_catalog(
     """
     root_dir = pathlib.Path(root_dir)
     image_dir = root_dir / image_dir_name
-    image_dir.exists()
-    files = sorted(image_dir.rglob(f"**/*{extension}"))
-    data = []
-    if files:
-        for file in files:
-            metadata = json.load(file.open())
-            if use_full_path:
-                metadata["filepath"] = (
-                    (root_dir / metadata["filepath"]).absolute().as_posix()
-                )
-            data.append(metadata)
-        return pd.DataFrame(data)
-    else:
-        print(f"Found 0 files with extension={extension} in {image_dir}.")
+    if not image_dir.is_dir():
+        print(f"{image_dir} does not exist.")
+        return pd.DataFrame()
+    catalog = PlotCatalogClass(image_dir)
+    catalog.migrate_json(extension=extension)
+    df = catalog.query(casename=casename, plot_type=plot_type)
+    catalog.close()
+    if len(df) == 0:
+        print(f"Found 0 plots in {catalog.path}.")
         return pd.DataFrame()
+    if use_full_path:
+        df["filepath"] = [
+            (root_dir / filepath).absolute().as_posix() for filepath in df["filepath"]
+        ]
+    return df
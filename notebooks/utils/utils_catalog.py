@@ -0,0 +1,131 @@
+"""
+utility functions to publish the plot catalog as Parquet and read parts of it back
+
+The catalog for each case is written to {root}/{casename}/png_catalog.parquet/,
+with one file per plot type (plot_type={plot_type}/part-0.parquet). Paths can be
+computed from casename and plot_type, so readers never need to list directories
+(which is not possible over https). Rows are sorted by varname and date, so the
+row group statistics let pyarrow skip row groups that do not match a filter.
+"""
+
+import os
+
+import fsspec
+import pandas as pd
+import pyarrow.parquet as pq
+
+PARQUET_DIRNAME = "png_catalog.parquet"
+
+# columns rows are sorted by (if present), so filters on them can skip row groups
+_SORT_COLUMNS = ["varname", "date", "time_period", "filepath"]
+
+# columns every plot type has, returned (with no rows) when nothing matches
+_CATALOG_COLUMNS = ["plot_type", "varname", "casename", "filepath"]
+
+
+def get_parquet_path(root, casename, plot_type):
+    """return path (or URL) of the catalog file for casename and plot_type"""
+    root = str(root).rstrip("/")
+    return f"{root}/{casename}/{PARQUET_DIRNAME}/plot_type={plot_type}/part-0.parquet"
+
+
+def write_plot_catalog_parquet(df, root="images", row_group_size=1024):
+    """
+    write df (e.g. from generate_plot_catalog) to one Parquet file per
+    (casename, plot_type) under root; return list of files written
+    """
+    paths = []
+    for (casename, plot_type), df_part in df.groupby(["casename", "plot_type"]):
+        df_part = df_part.dropna(axis=1, how="all")
+        sort_columns = [col for col in _SORT_COLUMNS if col in df_part]
+        df_part = df_part.sort_values(sort_columns).reset_index(drop=True)
+        # match png_catalog.csv, where sel_dict is written as a string
+        if "sel_dict" in df_part:
+            df_part["sel_dict"] = df_part["sel_dict"].astype(str)
+        if "apply_log10" in df_part:
+            df_part["apply_log10"] = df_part["apply_log10"].astype(bool)
+
+        path = get_parquet_path(root, casename, plot_type)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to temporary file so readers never see a partially written file
+        tmp_path = f"{path}.tmp"
+        df_part.to_parquet(
+            tmp_path, engine="pyarrow", index=False, row_group_size=row_group_size
+        )
+        os.replace(tmp_path, path)
+        paths.append(path)
+    return paths
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+def _get_row_filters(names, varname, date):
+    """
+    return list of pyarrow filters for the varname and date arguments of
+    read_plot_catalog, skipping columns that are not in names
+    """
+    filters = []
+    if varname is not None and "varname" in names:
+        filters.append(("varname", "in", _as_list(varname)))
+    if date is not None and "date" in names:
+        if isinstance(date, tuple):
+            # dates are zero-padded strings, so they sort chronologically
+            date_beg, date_end = date
+            if date_beg is not None:
+                filters.append(("date", ">=", date_beg))
+            if date_end is not None:
+                filters.append(("date", "<=", date_end))
+        else:
+            filters.append(("date", "in", _as_list(date)))
+    return filters
+
+
+def read_plot_catalog(
+    root,
+    casename,
+    plot_type,
+    varname=None,
+    date=None,
+    columns=None,
+    storage_options=None,
+):
+    """
+    return a DataFrame with the catalog rows for casename and plot_type
+    (each can be a string or a list of strings), optionally only for rows
+    matching varname and date (also strings or lists of strings); date can also
+    be a (start, end) tuple, which matches dates from start to end inclusive
+    (either can be None for an open-ended range)
+
+    Only the files for the requested cases and plot types are opened, and varname
+    and date filters are passed to pyarrow so non-matching row groups are not read.
+    Filters on columns a plot type does not have (e.g. date for histograms) are
+    ignored. root can be a local directory or a URL readable by fsspec.
+    If no rows match, the DataFrame is empty but still has the requested columns
+    (or the columns every plot type has).
+    """
+    if storage_options is None:
+        storage_options = dict()
+    df_list = []
+    for casename_i in _as_list(casename):
+        for plot_type_i in _as_list(plot_type):
+            path = get_parquet_path(root, casename_i, plot_type_i)
+            try:
+                with fsspec.open(path, "rb", **storage_options) as fp:
+                    names = pq.read_schema(fp).names
+                    filters = _get_row_filters(names, varname, date)
+                    fp.seek(0)
+                    table = pq.read_table(
+                        fp, columns=columns, filters=filters if filters else None
+                    )
+            except FileNotFoundError:
+                continue
+            df_list.append(table.to_pandas())
+    if not df_list:
+        return pd.DataFrame(columns=columns if columns else _CATALOG_COLUMNS)
+    return pd.concat(df_list, ignore_index=True)
@@ -0,0 +1,140 @@
+"""
+nearest-cell lookups on curvilinear (e.g. POP tripole) grids
+
+A KD-tree of the 3-D unit vectors of every (TLAT, TLONG) cell is built once per grid
+and cached in memory and on disk, keyed by a hash of the grid itself, so every case
+on the same grid shares one tree. Lookups are then vectorized tree queries:
+
+    nlat, nlon, dist_km = utils.find_nearest_cells(ds["TLAT"], ds["TLONG"], lat, lon)
+"""
+
+import hashlib
+import os
+import pickle
+
+import numpy as np
+
+# mean radius of the Earth (km), used to convert chord lengths to distances
+_EARTH_RADIUS_KM = 6371.0
+
+# trees built (or read) this session, keyed by get_grid_key()
+_trees = dict()
+
+_default_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "hires-marbl")
+
+################################################################################
+
+
+def latlon_to_xyz(lat, lon):
+    """Return (..., 3) array of unit vectors for lat and lon (in degrees)"""
+    lat = np.deg2rad(np.asarray(lat, dtype=np.float64))
+    lon = np.deg2rad(np.asarray(lon, dtype=np.float64))
+    return np.stack(
+        (np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)), axis=-1
+    )
+
+
+def format_lat_lon(lat, lon, precision=2):
+    """Return e.g. '25.50 W, 12.00 S' for lat=-12, lon=334.5 (in degrees)"""
+    lon = (float(lon) + 180.0) % 360.0 - 180.0
+    lat = float(lat)
+    lon_str = f"{abs(lon):.{precision}f} {'W' if lon < 0 else 'E'}"
+    lat_str = f"{abs(lat):.{precision}f} {'S' if lat < 0 else 'N'}"
+    return f"{lon_str}, {lat_str}"
+
+
+################################################################################
+
+
+def _grid_array(da):
+    """float64 numpy array of a DataArray / masked array / array (NaN if masked)"""
+    values = getattr(da, "values", da)
+    return np.ma.filled(np.ma.asarray(values, dtype=np.float64), np.nan)
+
+
+def _hash_arrays(arrays, extra=None):
+    """Return a short hash of the shapes and values of arrays (and of str(extra))"""
+    sha = hashlib.sha1()
+    for array in arrays:
+        array = _grid_array(array)
+        sha.update(str(array.shape).encode())
+        sha.update(np.ascontiguousarray(array).tobytes())
+    if extra is not None:
+        sha.update(str(extra).encode())
+    return sha.hexdigest()[:16]
+
+
+def get_grid_key(TLAT, TLONG, mask=None):
+    """
+    Return a hash identifying the grid defined by TLAT and TLONG (and mask, an
+    optional boolean array of the cells to search, e.g. KMT > 0)
+    """
+    arrays = [TLAT, TLONG]
+    if mask is not None:
+        arrays.append(np.asarray(getattr(mask, "values", mask), dtype=bool))
+    return _hash_arrays(arrays)
+
+
+def get_grid_tree(TLAT, TLONG, mask=None, cache_dir=None):
+    """
+    Return (tree, cells) where tree is a scipy cKDTree of the unit vectors of every
+    cell of the grid (or only the cells where mask is True) and cells holds the flat
+    (C-order) index into TLAT of each point in the tree.
+
+    Trees are kept in memory for the session, and pickled to
+    {cache_dir}/grid_tree.{key}.pkl (default cache_dir: ~/.cache/hires-marbl) so
+    they are only built once per grid; set cache_dir=False to skip the disk cache.
+    """
+    key = get_grid_key(TLAT, TLONG, mask)
+    if key in _trees:
+        return _trees[key]
+
+    if cache_dir is None:
+        cache_dir = _default_cache_dir
+    cache_file = None
+    if cache_dir:
+        cache_file = os.path.join(cache_dir, f"grid_tree.{key}.pkl")
+        if os.path.isfile(cache_file):
+            with open(cache_file, "rb") as fp:
+                _trees[key] = pickle.load(fp)
+            return _trees[key]
+
+    from scipy.spatial import cKDTree
+
+    lat = _grid_array(TLAT).ravel()
+    lon = _grid_array(TLONG).ravel()
+    # cells without coordinates (e.g. missing values over land) are never nearest
+    valid = np.isfinite(lat) & np.isfinite(lon)
+    if mask is not None:
+        valid &= np.asarray(getattr(mask, "values", mask), dtype=bool).ravel()
+    cells = np.flatnonzero(valid)
+    if cells.size == 0:
+        raise ValueError("Grid does not have any cells to search")
+    tree = cKDTree(latlon_to_xyz(lat[cells], lon[cells]))
+    _trees[key] = (tree, cells)
+
+    if cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to a temporary file, so other processes never read a partial tree
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as fp:
+            pickle.dump(_trees[key], fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    return _trees[key]
+
+
+def find_nearest_cells(TLAT, TLONG, lat, lon, mask=None, cache_dir=None):
+    """
+    Return (nlat, nlon, dist_km): indices of the grid cell nearest to each (lat, lon)
+    pair (scalars or arrays, in degrees) and the great-circle distance (km) to its
+    center. Outputs have the broadcast shape of lat and lon.
+
+    mask: optional boolean array, True for cells that may be returned (e.g. KMT > 0
+          to only return ocean cells)
+    """
+    tree, cells = get_grid_tree(TLAT, TLONG, mask, cache_dir)
+    lat, lon = np.broadcast_arrays(np.asarray(lat), np.asarray(lon))
+    chord, ind = tree.query(latlon_to_xyz(lat, lon))
+    nlat, nlon = np.unravel_index(cells[ind], np.shape(TLAT))
+    dist_km = 2.0 * _EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2.0, 1.0))
+    return nlat, nlon, dist_km
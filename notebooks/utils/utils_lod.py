@@ -0,0 +1,64 @@
+"""
+utility functions to reduce 2D fields to the resolution they are displayed at
+"""
+
+import matplotlib
+import numpy as np
+import xarray as xr
+
+
+def get_lod_factors(shape, figsize=None, dpi=None):
+    """
+    return (y, x) coarsening factors that reduce an array of size shape to
+    (roughly) the number of pixels in a figure of size figsize at dpi
+    """
+    if figsize is None:
+        figsize = matplotlib.rcParams["figure.figsize"]
+    if dpi is None:
+        dpi = matplotlib.rcParams["figure.dpi"]
+    ny, nx = shape[-2:]
+    npix_x = figsize[0] * dpi
+    npix_y = figsize[1] * dpi
+    return max(1, int(ny // npix_y)), max(1, int(nx // npix_x))
+
+
+def coarsen_for_display(da, weights=None, method="mean", factors=None, **lod_kwargs):
+    """
+    return a lazy copy of da with its last two dims coarsened by factors
+    (default: get_lod_factors(da.shape, **lod_kwargs)), so that it is computed
+    by dask and only the reduced field is transferred and plotted
+
+    method = "mean": NaN-aware block mean, weighted by weights (e.g. TAREA) if provided
+    method = "maxabs": value with the largest magnitude in each block (preserves extremes)
+
+    Dimensions without coordinates are given index coordinates before coarsening,
+    so axes of the coarsened field still span the original index space.
+    """
+    dims = da.dims[-2:]
+    if factors is None:
+        factors = get_lod_factors(da.shape, **lod_kwargs)
+    if all(factor == 1 for factor in factors):
+        return da
+    for dim in dims:
+        if dim not in da.coords:
+            da = da.assign_coords({dim: np.arange(da.sizes[dim])})
+    window = dict(zip(dims, factors))
+
+    if method == "mean":
+        if weights is None:
+            weights = xr.ones_like(da[dims[0]] * da[dims[1]], dtype=float)
+        weights = weights.fillna(0).where(da.notnull(), 0)
+        numer = (da.fillna(0) * weights).coarsen(window, boundary="pad").sum()
+        denom = weights.coarsen(window, boundary="pad").sum()
+        da_out = numer / denom.where(denom > 0)
+    elif method == "maxabs":
+        # value with largest magnitude is either the block max or the block min
+        da_max = da.coarsen(window, boundary="pad").max()
+        da_min = da.coarsen(window, boundary="pad").min()
+        da_out = xr.where(da_max >= -da_min, da_max, da_min)
+    else:
+        raise ValueError(f"Unknown method {method}, must be 'mean' or 'maxabs'")
+
+    da_out.name = da.name
+    da_out.attrs = da.attrs
+    return da_out
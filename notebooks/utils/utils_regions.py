@@ -0,0 +1,202 @@
+"""
+area-weighted means and integrals over many regions in a single pass
+
+Named regions are compiled into one sparse (region, cell) matrix of TAREA weights,
+built once per grid and set of regions. Each time chunk of a field is then reduced
+to the integral and the mean over every region by one sparse matrix product.
+
+A region is a dict of criteria that a cell must meet (all of them); an empty dict
+is every cell:
+    region_mask: list of REGION_MASK values (or None for REGION_MASK > 0)
+    lat_range: [southern edge, northern edge] in degrees
+    polygon: list of [lon, lat] vertices in degrees
+
+Regions can be given by name (keys of DEFAULT_REGIONS), or as a dict with a name key
+and the criteria above, e.g. in diag_metadata.yaml:
+
+    regions:
+    -   Global
+    -   Southern Ocean
+    -   name: Nino 3.4
+        polygon: [[190, -5], [240, -5], [240, 5], [190, 5]]
+"""
+
+import matplotlib.path
+import numpy as np
+import scipy.sparse
+import xarray as xr
+
+# local modules, not available through __init__
+from . import utils_grid
+from .utils_za import DEFAULT_BASINS
+
+DEFAULT_REGIONS = dict()
+DEFAULT_REGIONS["Global"] = dict()
+for _basin, _region_vals in DEFAULT_BASINS.items():
+    if _region_vals is not None:
+        DEFAULT_REGIONS[_basin] = dict(region_mask=_region_vals)
+DEFAULT_REGIONS["Southern Ocean"] = dict(lat_range=[-90.0, -45.0])
+DEFAULT_REGIONS["Tropics"] = dict(lat_range=[-20.0, 20.0])
+DEFAULT_REGIONS["Northern Extratropics"] = dict(lat_range=[20.0, 90.0])
+
+# grid variables needed to build region masks (in addition to TAREA)
+REGION_VARS = ["TLAT", "TLONG", "REGION_MASK"]
+
+# matrices built this session, keyed by hash of grid and regions
+_matrices = dict()
+
+################################################################################
+
+
+def get_regions(regions):
+    """
+    Return dict mapping region name to criteria for regions, a list of names in
+    DEFAULT_REGIONS and / or dicts with a name key (see module docstring)
+    """
+    out = dict()
+    for region in regions:
+        if isinstance(region, str):
+            if region not in DEFAULT_REGIONS:
+                raise ValueError(
+                    f"Unknown region {region}, must be one of {list(DEFAULT_REGIONS)}"
+                )
+            out[region] = DEFAULT_REGIONS[region]
+        else:
+            criteria = dict(region)
+            if "name" not in criteria:
+                raise ValueError(f"Region {region} does not have a name")
+            name = criteria.pop("name")
+            unknown = set(criteria) - {"region_mask", "lat_range", "polygon"}
+            if unknown:
+                raise ValueError(f"Unknown criteria {sorted(unknown)} in region {name}")
+            out[name] = criteria
+    return out
+
+
+def _region_cells(criteria, lat, lon, region_mask):
+    """boolean array: True for the cells (flattened) that meet every criterion"""
+    cells = np.isfinite(lat)
+    if "region_mask" in criteria:
+        if criteria["region_mask"] is None:
+            cells &= region_mask > 0
+        else:
+            cells &= np.isin(region_mask, criteria["region_mask"])
+    if "lat_range" in criteria:
+        lat_beg, lat_end = criteria["lat_range"]
+        cells &= (lat >= lat_beg) & (lat <= lat_end)
+    if "polygon" in criteria:
+        path = matplotlib.path.Path(np.asarray(criteria["polygon"], dtype=np.float64))
+        in_polygon = np.zeros(lat.shape, dtype=bool)
+        # polygon longitudes may be in [-180, 180] or [0, 360] (or beyond)
+        for shift in [-360.0, 0.0, 360.0]:
+            in_polygon |= path.contains_points(np.column_stack((lon + shift, lat)))
+        cells &= in_polygon
+    return cells
+
+
+def get_region_matrix(TLAT, TLONG, TAREA, REGION_MASK, regions):
+    """
+    Return (matrix, names): matrix is a scipy CSR matrix with one row per region and
+    one column per cell of the (nlat, nlon) grid (C order), holding the TAREA of each
+    cell in the region (land, i.e. missing TAREA, is zero).
+    regions: dict returned by get_regions()
+
+    Matrices are kept in memory for the session, so every variable (and every time
+    chunk) reuses the weights.
+    """
+    key = utils_grid._hash_arrays(
+        [TLAT, TLONG, TAREA, REGION_MASK], sorted(regions.items())
+    )
+    if key not in _matrices:
+        lat = utils_grid._grid_array(TLAT).ravel()
+        lon = utils_grid._grid_array(TLONG).ravel()
+        area = np.nan_to_num(utils_grid._grid_array(TAREA).ravel())
+        region_mask = np.nan_to_num(utils_grid._grid_array(REGION_MASK).ravel())
+        rows = []
+        cols = []
+        for region_ind, criteria in enumerate(regions.values()):
+            cells = np.flatnonzero(_region_cells(criteria, lat, lon, region_mask))
+            rows.append(np.full(cells.size, region_ind))
+            cols.append(cells)
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+        matrix = scipy.sparse.csr_matrix(
+            (area[cols], (rows, cols)), shape=(len(regions), lat.size)
+        )
+        matrix.eliminate_zeros()
+        _matrices[key] = matrix
+    return _matrices[key], list(regions)
+
+
+################################################################################
+
+
+def _apply_region_matrix(values, matrix):
+    """
+    Return array with (stat, region) as its last two dims, where stat is the
+    integral and the mean over each region of values (whose last two dims are
+    (nlat, nlon)); missing values are skipped, like xarray's weighted reductions
+    """
+    shape = values.shape[:-2]
+    slabs = values.reshape((-1, matrix.shape[1])).T
+    valid = np.isfinite(slabs)
+    integral = matrix @ np.where(valid, slabs, 0.0)
+    # slabs usually share one mask (e.g. every month of a 2D ocean field), so the
+    # area of each region only needs to be computed once
+    if valid.shape[1] > 0 and (valid == valid[:, :1]).all():
+        area = np.repeat(matrix @ valid[:, :1].astype(matrix.dtype), valid.shape[1], 1)
+    else:
+        area = matrix @ valid.astype(matrix.dtype)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(area > 0, integral / area, np.nan)
+    out = np.stack((integral.T, mean.T), axis=-2)
+    return out.reshape(shape + out.shape[-2:]).astype(values.dtype, copy=False)
+
+
+def reduce_regions(da, ds, regions):
+    """
+    Return (mean, integral): DataArrays with the TAREA-weighted mean and integral of
+    da over each region (a region dim replaces the last two dims of da), computed
+    in one pass over the data. ds must contain TAREA and REGION_VARS.
+    regions: list of region names and / or dicts (see get_regions())
+
+    The integral has the units of da times the units of TAREA.
+    """
+    missing = [varname for varname in ["TAREA"] + REGION_VARS if varname not in ds]
+    if missing:
+        raise ValueError(
+            f"{missing} not in dataset, pass vars_to_keep={REGION_VARS} to gen_dataset()"
+        )
+    matrix, names = get_region_matrix(
+        ds["TLAT"], ds["TLONG"], ds["TAREA"], ds["REGION_MASK"], get_regions(regions)
+    )
+    horiz_dims = list(da.dims[-2:])
+    da_in = da.drop_vars(
+        [
+            coord
+            for coord in da.coords
+            if any(dim in horiz_dims for dim in da[coord].dims)
+        ]
+    )
+    if da_in.chunks is not None:
+        da_in = da_in.chunk({dim: -1 for dim in horiz_dims})
+    dtype = np.result_type(da.dtype, np.float32)
+    reduced = xr.apply_ufunc(
+        _apply_region_matrix,
+        da_in.astype(dtype, copy=False),
+        input_core_dims=[horiz_dims],
+        output_core_dims=[["stat", "region"]],
+        kwargs=dict(matrix=matrix),
+        dask="parallelized",
+        output_dtypes=[dtype],
+        dask_gufunc_kwargs=dict(output_sizes=dict(stat=2, region=len(names))),
+    ).assign_coords(region=names)
+
+    integral = reduced.isel(stat=0)
+    mean = reduced.isel(stat=1)
+    mean.attrs = dict(da.attrs)
+    integral.attrs = dict(da.attrs)
+    if "units" in da.attrs and "units" in ds["TAREA"].attrs:
+        integral.attrs["units"] = f"{da.attrs['units']} {ds['TAREA'].attrs['units']}"
+    mean.name = integral.name = da.name
+    return mean, integral
@@ -0,0 +1,205 @@
+"""
+time averages weighted by the length of each time_bound interval
+
+Annual means, seasonal means, and multi-year monthly climatologies are computed by
+a (group, time) matrix of interval lengths, so every average accounts for month
+lengths, and several frequencies share a single (lazy) pass over the data:
+
+    tb = ds[ds["time"].attrs["bounds"]]
+    means = utils.temporal_means(ds["PO4"], tb, ["annual", "climatology"])
+    means = dict(zip(means, dask.compute(*means.values())))
+"""
+
+import cftime
+import numpy as np
+import xarray as xr
+
+FREQS = ["annual", "seasonal", "climatology"]
+
+_SEASONS = ["DJF", "MAM", "JJA", "SON"]
+# index into _SEASONS of each month (1-12)
+_MONTH_TO_SEASON = np.array([-1, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 0])
+# (year offset, month) of the first day of each season, and of the following season
+_SEASON_BOUNDS = dict()
+_SEASON_BOUNDS["DJF"] = ((-1, 12), (0, 3))
+_SEASON_BOUNDS["MAM"] = ((0, 3), (0, 6))
+_SEASON_BOUNDS["JJA"] = ((0, 6), (0, 9))
+_SEASON_BOUNDS["SON"] = ((0, 9), (0, 12))
+
+_units = "days since 0001-01-01"
+
+################################################################################
+
+
+def _get_attr(time_bound, attr, default):
+    """attribute of time_bound, or of its time coordinate (which CF puts it on)"""
+    time_dim = time_bound.dims[0]
+    if attr in time_bound.attrs:
+        return time_bound.attrs[attr]
+    if time_dim in time_bound.coords:
+        return time_bound[time_dim].attrs.get(attr, default)
+    return default
+
+
+def _get_calendar(time_bound):
+    """calendar of time_bound (decoded cftime objects, or numbers with attrs)"""
+    if time_bound.dtype == np.dtype("O"):
+        return time_bound.values.flat[0].calendar
+    return _get_attr(time_bound, "calendar", "noleap")
+
+
+def _bounds_in_days(time_bound):
+    """(ntime, 2) array of time_bound in days since 0001-01-01"""
+    calendar = _get_calendar(time_bound)
+    values = time_bound.values
+    if values.dtype == np.dtype("O"):
+        return cftime.date2num(values, _units, calendar=calendar)
+    return cftime.date2num(
+        cftime.num2date(
+            values, _get_attr(time_bound, "units", _units), calendar=calendar
+        ),
+        _units,
+        calendar=calendar,
+    )
+
+
+def _days(year, month, calendar):
+    """days since 0001-01-01 of the first day of month in year"""
+    return cftime.date2num(
+        cftime.datetime(year, month, 1, calendar=calendar), _units, calendar=calendar
+    )
+
+
+def get_time_weights(time_bound):
+    """Return DataArray with the length (in days) of each time_bound interval"""
+    bounds = _bounds_in_days(time_bound)
+    return xr.DataArray(bounds[:, 1] - bounds[:, 0], dims=time_bound.dims[:1])
+
+
+################################################################################
+
+
+def _get_groups(time_bound, freq):
+    """
+    Return (labels, group_ind, expected_days): labels of each group, the group of
+    each time level (by the midpoint of its interval), and the length of each group
+    in days (None for climatologies, which are not checked for coverage)
+    """
+    calendar = _get_calendar(time_bound)
+    bounds = _bounds_in_days(time_bound)
+    mid = cftime.num2date(bounds.mean(axis=1), _units, calendar=calendar)
+    years = np.array([date.year for date in mid])
+    months = np.array([date.month for date in mid])
+
+    if freq == "annual":
+        labels, group_ind = np.unique(years, return_inverse=True)
+        expected = [
+            _days(year + 1, 1, calendar) - _days(year, 1, calendar) for year in labels
+        ]
+        return [dict(year=year) for year in labels], group_ind, np.array(expected)
+    if freq == "seasonal":
+        # December is part of DJF of the following year
+        season_years = np.where(months == 12, years + 1, years)
+        keys = 4 * season_years + _MONTH_TO_SEASON[months]
+        keys, group_ind = np.unique(keys, return_inverse=True)
+        labels = [dict(year=key // 4, season=_SEASONS[key % 4]) for key in keys]
+        expected = []
+        for label in labels:
+            (beg_offset, beg_month), (end_offset, end_month) = _SEASON_BOUNDS[
+                label["season"]
+            ]
+            beg = _days(label["year"] + beg_offset, beg_month, calendar)
+            end = _days(label["year"] + end_offset, end_month, calendar)
+            expected.append(end - beg)
+        return labels, group_ind, np.array(expected)
+    if freq == "climatology":
+        labels, group_ind = np.unique(months, return_inverse=True)
+        return [dict(month=month) for month in labels], group_ind, None
+    raise ValueError(f"Unknown freq {freq}, must be one of {FREQS}")
+
+
+def _group_coords(time_bound, freq, labels, group_ind):
+    """coordinates of the groups of freq: time (midpoint) and labels"""
+    if freq == "climatology":
+        return dict(month=("month", [label["month"] for label in labels]))
+    calendar = _get_calendar(time_bound)
+    bounds = _bounds_in_days(time_bound)
+    ngroups = len(labels)
+    start = np.array([bounds[group_ind == ind, 0].min() for ind in range(ngroups)])
+    end = np.array([bounds[group_ind == ind, 1].max() for ind in range(ngroups)])
+    coords = dict(
+        time=("time", cftime.num2date(0.5 * (start + end), _units, calendar=calendar))
+    )
+    for key in labels[0]:
+        coords[key] = ("time", [label[key] for label in labels])
+    return coords
+
+
+################################################################################
+
+
+def temporal_means(da, time_bound, freqs=FREQS, min_coverage=1.0):
+    """
+    Return dict mapping each freq in freqs to the time average of da, weighted by
+    the length of each time_bound interval (missing values are skipped):
+    * "annual": dim time (midpoint of each year), with a year coordinate
+    * "seasonal": DJF, MAM, JJA, SON of each year (December is part of DJF of the
+                  following year), dim time with year and season coordinates
+    * "climatology": multi-year mean of each calendar month, dim month
+
+    Annual and seasonal means covering less than min_coverage of their period (e.g.
+    partial years at the start or end of a run) are dropped.
+
+    Results are lazy if da is a dask array; every freq is computed from the same
+    weighted sums, so computing them together (e.g. with dask.compute) reads da once.
+    """
+    if type(freqs) == str:
+        freqs = [freqs]
+    time_dim = time_bound.dims[0]
+    lengths = get_time_weights(time_bound).values
+
+    # stack the (group, time) weights of every freq into one matrix
+    weights = []
+    groups = dict()
+    for freq in freqs:
+        labels, group_ind, expected = _get_groups(time_bound, freq)
+        freq_weights = np.zeros((len(labels), len(lengths)))
+        freq_weights[group_ind, np.arange(len(lengths))] = lengths
+        groups[freq] = (labels, group_ind, expected)
+        weights.append(freq_weights)
+    weights = xr.DataArray(np.concatenate(weights), dims=("group", time_dim))
+
+    da_dropped = da.drop_vars(
+        [coord for coord in da.coords if time_dim in da[coord].dims]
+    )
+    numer = xr.dot(weights, da_dropped.fillna(0), dims=time_dim)
+    denom = xr.dot(weights, da_dropped.notnull().astype(weights.dtype), dims=time_dim)
+    means_all = (numer / denom.where(denom > 0)).astype(
+        np.result_type(da.dtype, np.float32)
+    )
+
+    means = dict()
+    row = 0
+    for freq in freqs:
+        labels, group_ind, expected = groups[freq]
+        ngroups = len(labels)
+        mean = means_all.isel(group=slice(row, row + ngroups))
+        row += ngroups
+        if freq == "climatology":
+            mean = mean.rename(group="month")
+        else:
+            mean = mean.rename(group="time")
+        mean = mean.assign_coords(_group_coords(time_bound, freq, labels, group_ind))
+        if expected is not None:
+            covered = np.bincount(group_ind, weights=lengths, minlength=ngroups)
+            keep = covered >= min_coverage * expected - 1.0e-6
+            mean = mean.isel(time=np.flatnonzero(keep))
+        mean.attrs = dict(da.attrs)
+        mean.name = da.name
+        means[freq] = mean
+    return means
+
+
+def temporal_mean(da, time_bound, freq="annual", min_coverage=1.0):
+    """Return temporal_means(da, time_bound, [freq], min_coverage)[freq]"""
+    return temporal_means(da, time_bound, [freq], min_coverage)[freq]
@@ -0,0 +1,269 @@
+"""
+opt-in tracing of the analysis pipeline
+
+Functions in CaseClass, Plotting, and PlotTypeClass are wrapped in nested spans that
+record wall time, bytes read, file opens, and dask tasks run. Tracing is off by
+default, and a disabled span is a single check of a module-level flag.
+
+    utils.enable_tracing()
+    ...  # run diagnostics
+    utils.write_chrome_trace("trace.json")  # open in chrome://tracing or ui.perfetto.dev
+    utils.get_trace_summary()
+
+Counters are process-wide: a span running at the same time as spans in other
+threads also counts their bytes, files, and tasks. Dask tasks are only counted for
+the local (threaded / synchronous) schedulers, not for a distributed cluster.
+file_opens counts calls that open a file (open() and netCDF4.Dataset), not the
+files a span reads: reading through a handle that xarray's file cache already
+holds open is not counted.
+"""
+
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+
+_enabled = False
+_events = []
+_counters = dict(file_opens=0, dask_tasks=0)
+_lock = threading.Lock()
+_local = threading.local()
+_t0 = time.perf_counter()
+_audit_hook_installed = False
+_dask_callback = None
+_nc4_dataset = None
+_NULL_SPAN = contextlib.nullcontext()
+
+################################################################################
+
+
+def _read_bytes():
+    """bytes read by this process so far (None if /proc/self/io is not available)"""
+    try:
+        with open("/proc/self/io") as fp:
+            for line in fp:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _count_file_open():
+    with _lock:
+        _counters["file_opens"] += 1
+
+
+def _audit_hook(event, args):
+    if _enabled and event == "open" and isinstance(args[0], (str, bytes)):
+        if not os.fsdecode(args[0]).startswith("/proc/"):
+            _count_file_open()
+
+
+def _snapshot():
+    with _lock:
+        counters = dict(_counters)
+    counters["bytes_read"] = _read_bytes()
+    return counters
+
+
+################################################################################
+
+
+class _Span(object):
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        if not hasattr(_local, "stack"):
+            _local.stack = []
+        _local.stack.append(self)
+        self.child_time = 0.0
+        self.counters_beg = _snapshot()
+        self.time_beg = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.time_beg
+        counters_end = _snapshot()
+        _local.stack.pop()
+        if _local.stack:
+            _local.stack[-1].child_time += duration
+        args = dict(self.args)
+        for key, value in counters_end.items():
+            if value is not None and self.counters_beg[key] is not None:
+                args[key] = value - self.counters_beg[key]
+        args["self_time_us"] = 1.0e6 * (duration - self.child_time)
+        event = dict(
+            name=self.name,
+            cat=self.cat,
+            ph="X",
+            ts=1.0e6 * (self.time_beg - _t0),
+            dur=1.0e6 * duration,
+            pid=os.getpid(),
+            tid=threading.get_ident(),
+            args=args,
+        )
+        with _lock:
+            _events.append(event)
+        return False
+
+
+def span(name, cat="diag", **args):
+    """
+    Context manager recording a span named name (args are saved with it);
+    does nothing unless tracing is enabled
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+
+def traced(name=None, cat="diag"):
+    """Decorator wrapping every call of a function in a span (default name: qualname)"""
+
+    def decorator(func):
+        span_name = func.__qualname__ if name is None else name
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(span_name, cat, dict()):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+################################################################################
+
+
+def enable_tracing():
+    """Start recording spans (and counting file opens and dask tasks)"""
+    global _enabled, _audit_hook_installed, _dask_callback, _nc4_dataset
+    if _enabled:
+        return
+    # audit hooks can not be removed, so the hook checks _enabled
+    if not _audit_hook_installed:
+        sys.addaudithook(_audit_hook)
+        _audit_hook_installed = True
+
+    # netCDF files are opened by the C library, which does not trigger audit events
+    import netCDF4
+
+    _nc4_dataset = netCDF4.Dataset
+
+    class _CountingDataset(_nc4_dataset):
+        def __init__(self, *args, **kwargs):
+            _count_file_open()
+            super().__init__(*args, **kwargs)
+
+    netCDF4.Dataset = _CountingDataset
+
+    from dask.callbacks import Callback
+
+    class _TaskCounter(Callback):
+        def _posttask(self, key, result, dsk, state, worker_id):
+            with _lock:
+                _counters["dask_tasks"] += 1
+
+    _dask_callback = _TaskCounter()
+    _dask_callback.register()
+    _enabled = True
+
+
+def disable_tracing():
+    """Stop recording spans; spans recorded so far are kept"""
+    global _enabled, _dask_callback, _nc4_dataset
+    if not _enabled:
+        return
+    _enabled = False
+    import netCDF4
+
+    netCDF4.Dataset = _nc4_dataset
+    _nc4_dataset = None
+    _dask_callback.unregister()
+    _dask_callback = None
+
+
+def reset_trace():
+    """Discard spans recorded so far"""
+    with _lock:
+        _events.clear()
+
+
+@contextlib.contextmanager
+def tracing(filename=None):
+    """Trace everything in a with block, and write a Chrome trace to filename"""
+    enable_tracing()
+    try:
+        yield
+    finally:
+        disable_tracing()
+        if filename is not None:
+            write_chrome_trace(filename)
+
+
+################################################################################
+
+
+def write_chrome_trace(filename):
+    """Write spans recorded so far in Chrome trace event format"""
+    with _lock:
+        events = list(_events)
+    with open(filename, "w") as fp:
+        json.dump(dict(traceEvents=events, displayTimeUnit="ms"), fp)
+
+
+def get_trace_summary():
+    """
+    Return DataFrame with one row per span name: number of calls, total, self
+    (excluding nested spans), mean, and max wall time in seconds, and total bytes
+    read, file opens, and dask tasks (including nested spans), sorted by total time
+    """
+    columns = [
+        "name",
+        "calls",
+        "total_s",
+        "self_s",
+        "mean_s",
+        "max_s",
+        "bytes_read",
+        "file_opens",
+        "dask_tasks",
+    ]
+    with _lock:
+        events = list(_events)
+    if not events:
+        return pd.DataFrame(columns=columns).set_index("name")
+    df = pd.DataFrame(
+        dict(
+            name=event["name"],
+            dur=event["dur"] * 1.0e-6,
+            self_dur=event["args"]["self_time_us"] * 1.0e-6,
+            bytes_read=event["args"].get("bytes_read"),
+            file_opens=event["args"]["file_opens"],
+            dask_tasks=event["args"]["dask_tasks"],
+        )
+        for event in events
+    )
+    summary = df.groupby("name").agg(
+        calls=("dur", "size"),
+        total_s=("dur", "sum"),
+        self_s=("self_dur", "sum"),
+        mean_s=("dur", "mean"),
+        max_s=("dur", "max"),
+        bytes_read=("bytes_read", "sum"),
+        file_opens=("file_opens", "sum"),
+        dask_tasks=("dask_tasks", "sum"),
+    )
+    return summary.sort_values("total_s", ascending=False)
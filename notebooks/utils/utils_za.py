@@ -0,0 +1,206 @@
+"""
+zonal averages on the POP grid, computed directly from gen_dataset() output
+
+A sparse (basin x latitude bin, cell) matrix of TAREA weights is built once per grid
+(and cached in memory and on disk, like the KD-trees in utils_grid), and applied to
+every horizontal slab of a field in a single sparse matrix product per dask chunk:
+
+    ds = case.gen_dataset(varnames, "pop.h", vars_to_keep=["TLAT", "REGION_MASK"])
+    ds_za = utils.zonal_average_dataset(ds)
+"""
+
+import os
+
+import numpy as np
+import scipy.sparse
+import xarray as xr
+
+# local modules, not available through __init__
+from . import utils_grid
+
+# REGION_MASK values in each basin (None: every cell with REGION_MASK > 0, which
+# excludes the marginal seas); Atlantic includes the Labrador, GIN, and Arctic seas
+# and Hudson Bay, as in the POP region numbering
+DEFAULT_BASINS = dict()
+DEFAULT_BASINS["Global"] = None
+DEFAULT_BASINS["Pacific"] = [2]
+DEFAULT_BASINS["Indian"] = [3]
+DEFAULT_BASINS["Atlantic"] = [6, 8, 9, 10, 11]
+
+# matrices built (or read) this session, keyed by hash of grid, bins, and basins
+_matrices = dict()
+
+################################################################################
+
+
+def get_za_matrix(
+    TLAT, TAREA, REGION_MASK, lat_edges=None, basins=None, cache_dir=None
+):
+    """
+    Return (matrix, lat_edges, basin_names): matrix is a scipy CSR matrix with one
+    row per (basin, latitude bin) pair and one column per cell of the (nlat, nlon)
+    grid (C order), holding the TAREA of each cell in its basin and bin.
+
+    lat_edges: edges of latitude bins (default: nlat equal bins from -90 to 90)
+    basins: dict mapping basin name to list of REGION_MASK values (default:
+            DEFAULT_BASINS)
+
+    Matrices are kept in memory for the session, and saved to
+    {cache_dir}/za_matrix.{key}.npz (default cache_dir: ~/.cache/hires-marbl);
+    set cache_dir=False to skip the disk cache.
+    """
+    if basins is None:
+        basins = DEFAULT_BASINS
+    if lat_edges is None:
+        lat_edges = np.linspace(-90.0, 90.0, np.shape(TLAT)[0] + 1)
+    lat_edges = np.asarray(lat_edges, dtype=np.float64)
+    key = utils_grid._hash_arrays(
+        [TLAT, TAREA, REGION_MASK, lat_edges], sorted(basins.items())
+    )
+    if key in _matrices:
+        return _matrices[key], lat_edges, list(basins)
+
+    if cache_dir is None:
+        cache_dir = utils_grid._default_cache_dir
+    cache_file = None
+    if cache_dir:
+        cache_file = os.path.join(cache_dir, f"za_matrix.{key}.npz")
+        if os.path.isfile(cache_file):
+            _matrices[key] = scipy.sparse.load_npz(cache_file)
+            return _matrices[key], lat_edges, list(basins)
+
+    lat = utils_grid._grid_array(TLAT).ravel()
+    area = utils_grid._grid_array(TAREA).ravel()
+    region_mask = np.nan_to_num(utils_grid._grid_array(REGION_MASK).ravel())
+    nbins = len(lat_edges) - 1
+    # cells outside of lat_edges (or without a latitude) are not in any bin
+    lat_bin = np.digitize(lat, lat_edges) - 1
+    in_bin = (lat_bin >= 0) & (lat_bin < nbins) & np.isfinite(area)
+
+    rows = []
+    cols = []
+    for basin_ind, region_vals in enumerate(basins.values()):
+        if region_vals is None:
+            in_basin = region_mask > 0
+        else:
+            in_basin = np.isin(region_mask, region_vals)
+        cells = np.flatnonzero(in_basin & in_bin)
+        rows.append(basin_ind * nbins + lat_bin[cells])
+        cols.append(cells)
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    matrix = scipy.sparse.csr_matrix(
+        (area[cols], (rows, cols)), shape=(len(basins) * nbins, lat.size)
+    )
+    _matrices[key] = matrix
+
+    if cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to a temporary file, so other processes never read a partial matrix
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp.npz"
+        scipy.sparse.save_npz(tmp_file, matrix)
+        os.replace(tmp_file, cache_file)
+    return matrix, lat_edges, list(basins)
+
+
+################################################################################
+
+
+def _apply_za_matrix(values, matrix, nbasins):
+    """
+    Zonal average of numpy array values with (nlat, nlon) as its last two dims;
+    returns array with (basins, lat_t) as its last two dims. Missing values are
+    skipped, and bins without any valid cells are NaN.
+    """
+    shape = values.shape[:-2]
+    # one column per horizontal slab, so every slab is averaged by one product
+    slabs = values.reshape((-1, matrix.shape[1])).T
+    valid = np.isfinite(slabs)
+    numer = matrix @ np.where(valid, slabs, 0.0)
+    denom = matrix @ valid.astype(matrix.dtype)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        za = np.where(denom > 0, numer / denom, np.nan)
+    return za.T.reshape(shape + (nbasins, -1)).astype(values.dtype, copy=False)
+
+
+def zonal_average(
+    da, TLAT, TAREA, REGION_MASK, lat_edges=None, basins=None, cache_dir=None
+):
+    """
+    Return area-weighted zonal average of da, a DataArray whose last two dims are
+    (nlat, nlon), in each basin and latitude bin (see get_za_matrix() for lat_edges,
+    basins, and cache_dir). The result has dims (..., basins, lat_t), where lat_t is
+    the center of each bin; dask arrays stay lazy, and are averaged chunk by chunk.
+    """
+    matrix, lat_edges, basin_names = get_za_matrix(
+        TLAT, TAREA, REGION_MASK, lat_edges, basins, cache_dir
+    )
+    horiz_dims = list(da.dims[-2:])
+    # only non-horizontal coordinates can be kept
+    da = da.drop_vars(
+        [
+            coord
+            for coord in da.coords
+            if any(dim in horiz_dims for dim in da[coord].dims)
+        ]
+    )
+    if da.chunks is not None:
+        da = da.chunk({dim: -1 for dim in horiz_dims})
+    dtype = np.result_type(da.dtype, np.float32)
+    da_za = xr.apply_ufunc(
+        _apply_za_matrix,
+        da.astype(dtype, copy=False),
+        input_core_dims=[horiz_dims],
+        output_core_dims=[["basins", "lat_t"]],
+        kwargs=dict(matrix=matrix, nbasins=len(basin_names)),
+        dask="parallelized",
+        output_dtypes=[dtype],
+        dask_gufunc_kwargs=dict(
+            output_sizes=dict(basins=len(basin_names), lat_t=len(lat_edges) - 1)
+        ),
+        keep_attrs=True,
+    )
+    return da_za.assign_coords(
+        basins=basin_names,
+        lat_t=(
+            "lat_t",
+            0.5 * (lat_edges[:-1] + lat_edges[1:]),
+            {"long_name": "latitude", "units": "degrees_north"},
+        ),
+    )
+
+
+def zonal_average_dataset(ds, varnames=None, **kwargs):
+    """
+    Return Dataset with the zonal average of every variable in ds with (nlat, nlon)
+    dims (or only varnames), along with time_bound and the attributes of ds, so it
+    can be passed to the plotting functions like the output of gen_dataset().
+    TLAT, TAREA, and REGION_MASK are read from ds; kwargs are passed to
+    zonal_average().
+    """
+    for varname in ["TLAT", "TAREA", "REGION_MASK"]:
+        if varname not in ds.variables:
+            raise ValueError(
+                f"{varname} is not in dataset, pass vars_to_keep=['TLAT', "
+                "'REGION_MASK'] to gen_dataset()"
+            )
+    if varnames is None:
+        varnames = [
+            varname
+            for varname in ds.data_vars
+            if ds[varname].dims[-2:] == ("nlat", "nlon") and "time" in ds[varname].dims
+        ]
+    if type(varnames) == str:
+        varnames = [varnames]
+    ds_za = xr.Dataset(
+        {
+            varname: zonal_average(
+                ds[varname], ds["TLAT"], ds["TAREA"], ds["REGION_MASK"], **kwargs
+            )
+            for varname in varnames
+        },
+        attrs=ds.attrs,
+    )
+    if "time" in ds_za.dims and "bounds" in ds["time"].attrs:
+        ds_za[ds["time"].attrs["bounds"]] = ds[ds["time"].attrs["bounds"]]
+    return ds_za
@@ -0,0 +1,252 @@
+"""functions to write a synthetic CESM case (history, time series, and log files)"""
+
+import gzip
+import os
+
+import numpy as np
+import xarray as xr
+
+from xr_ds_ex import days_1yr
+
+# (nlat, nlon, nz) of POP-like grids
+grid_sizes = dict()
+grid_sizes["tiny"] = (6, 8, 3)
+grid_sizes["g17"] = (384, 320, 60)
+grid_sizes["t13"] = (2400, 3600, 62)
+
+# component, frequency of time series, and whether history files contain daily values
+stream_info = dict()
+stream_info["pop.h"] = dict(comp="ocn", freq="month_1", daily=False)
+stream_info["pop.h.nday1"] = dict(comp="ocn", freq="day_1", daily=True)
+stream_info["pop.h.nyear1"] = dict(comp="ocn", freq="year_1", daily=False)
+stream_info["cice.h"] = dict(comp="ice", freq="month_1", daily=False)
+stream_info["cice.h1"] = dict(comp="ice", freq="day_1", daily=True)
+
+# names of the first few variables; the rest are VAR{n:02}
+_varnames = ["PO4", "NO3", "SiO3", "O2", "DIC", "ALK", "Fe", "photoC_TOT_zint"]
+
+_time_attrs = {"units": "days since 0001-01-01 00:00:00", "calendar": "noleap"}
+_fill_value = np.float32(9.96921e36)
+
+_co2calc_warning = (
+    "MARBL WARNING (marbl_co2calc_mod:drtsafe): (marbl_co2calc_mod:drtsafe) it = {it}"
+)
+
+
+def gen_grid_ds(grid="tiny", seed=0):
+    """return POP-like grid: TLAT, TLONG, TAREA, KMT, REGION_MASK, z_t, dz"""
+    nlat, nlon, nz = grid_sizes[grid] if isinstance(grid, str) else grid
+    rng = np.random.default_rng(seed)
+    lat = np.linspace(-78.0, 89.0, nlat)
+    lon = np.linspace(0.0, 360.0, nlon, endpoint=False)
+    tlong, tlat = np.meshgrid(lon, lat)
+    dlat = np.deg2rad(167.0 / nlat)
+    dlon = np.deg2rad(360.0 / nlon)
+    tarea = (6.37122e8) ** 2 * np.cos(np.deg2rad(tlat)) * dlat * dlon
+    kmt = rng.integers(0, nz + 1, size=(nlat, nlon), dtype=np.int32)
+    # 6 basins as longitude bands, land is 0
+    region_mask = np.where(kmt > 0, 1 + (6 * tlong // 360).astype(np.int32), 0)
+    dz = np.full(nz, 1000.0)
+    z_t = np.cumsum(dz) - 0.5 * dz
+    return xr.Dataset(
+        {
+            "TLAT": (("nlat", "nlon"), tlat, {"units": "degrees_north"}),
+            "TLONG": (("nlat", "nlon"), tlong, {"units": "degrees_east"}),
+            "TAREA": (("nlat", "nlon"), tarea, {"units": "cm^2"}),
+            "KMT": (("nlat", "nlon"), kmt),
+            "REGION_MASK": (("nlat", "nlon"), region_mask),
+            "dz": (("z_t",), dz, {"units": "cm"}),
+        },
+        coords={"z_t": ("z_t", z_t, {"units": "centimeters"})},
+    )
+
+
+def gen_varnames(nvars):
+    return [_varnames[n] if n < len(_varnames) else f"VAR{n:02}" for n in range(nvars)]
+
+
+def _time_bounds(year, stream, file_ind):
+    """return (nt, 2) array of time bounds (in days) in one history file"""
+    year_beg = 365.0 * (year - 1)
+    month_edges = year_beg + np.insert(np.cumsum(days_1yr), 0, 0.0)
+    if stream_info[stream]["daily"]:
+        if stream == "cice.h1":
+            day_beg = year_beg + file_ind
+            return np.array([[day_beg, day_beg + 1.0]])
+        days = np.arange(month_edges[file_ind], month_edges[file_ind + 1])
+        return np.stack((days, days + 1.0), axis=1)
+    if stream == "pop.h.nyear1":
+        return np.array([[year_beg, year_beg + 365.0]])
+    return month_edges[file_ind : file_ind + 2].reshape(1, 2)
+
+
+def get_history_datestamps(year, stream):
+    """return datestamps in the names of one year of history files from stream"""
+    if stream == "pop.h.nyear1":
+        return [f"{year:04}"]
+    if stream == "cice.h1":
+        month_days = [
+            (month, day)
+            for month, ndays in enumerate(days_1yr.astype(int), 1)
+            for day in range(1, ndays + 1)
+        ]
+        return [f"{year:04}-{month:02}-{day:02}" for month, day in month_days]
+    if stream == "pop.h.nday1":
+        return [f"{year:04}-{month:02}-01" for month in range(1, 13)]
+    return [f"{year:04}-{month:02}" for month in range(1, 13)]
+
+
+def gen_hist_ds(grid_ds, casename, stream, year, file_ind, varnames, nvars_3d, seed=0):
+    """
+    return dataset with the contents of one history file: the first nvars_3d
+    variables have a z_t dimension, values are random (and _FillValue over land)
+    """
+    time_bound = _time_bounds(year, stream, file_ind)
+    nt = time_bound.shape[0]
+    nz = grid_ds.sizes["z_t"]
+    rng = np.random.default_rng([seed, year, file_ind])
+    kmt = grid_ds["KMT"].values
+    data_vars = dict()
+    for n, varname in enumerate(varnames):
+        if n < nvars_3d:
+            dims = ("time", "z_t", "nlat", "nlon")
+            shape = (nt,) + (nz,) + kmt.shape
+            land = np.arange(nz).reshape(nz, 1, 1) >= kmt
+        else:
+            dims = ("time", "nlat", "nlon")
+            shape = (nt,) + kmt.shape
+            land = kmt == 0
+        values = rng.random(shape, dtype=np.float32) + np.float32(n + 1)
+        values[:, land] = np.nan
+        data_vars[varname] = (dims, values, {"units": "mmol/m^3", "long_name": varname})
+    data_vars["time_bound"] = (("time", "d2"), time_bound)
+    ds = xr.Dataset(
+        data_vars,
+        coords={
+            "time": (
+                "time",
+                time_bound[:, 1],
+                dict(bounds="time_bound", long_name="time", **_time_attrs),
+            )
+        },
+        attrs={"title": casename},
+    )
+    return xr.merge([ds, grid_ds], combine_attrs="override")
+
+
+def _encoding(ds):
+    """_FillValue on float32 fields (like CESM), and no _FillValue on anything else"""
+    return {
+        varname: {
+            "_FillValue": _fill_value if ds[varname].dtype == np.float32 else None
+        }
+        for varname in ds.variables
+    }
+
+
+def _write_log(filename, year, rng, warnings_per_day):
+    """write cesm.log with a model date for each day of year, and MARBL warnings"""
+    lines = []
+    for day in range(1, 366):
+        for _ in range(rng.poisson(warnings_per_day)):
+            it = rng.integers(1, 5)
+            lines.append(f"0: {_co2calc_warning.format(it=it)}\n")
+        month = np.searchsorted(np.cumsum(days_1yr), day) + 1
+        mday = day - int(np.sum(days_1yr[: month - 1]))
+        # model date is the end of the day just completed
+        if day == 365:
+            date = f"{year+1:04}0101"
+        else:
+            date = f"{year:04}{month:02}{mday+1:02}"
+        lines.append(f" memory_write: model date = {date}       0. memory =  1.0 MB\n")
+    with gzip.open(filename, "wt") as fp:
+        fp.writelines(lines)
+
+
+def write_case_tree(
+    root,
+    casename="test_case",
+    grid="tiny",
+    nyears=2,
+    nvars=4,
+    nvars_3d=1,
+    streams=["pop.h"],
+    ts_years=0,
+    layout="DOUT_S",
+    warnings_per_day=0.5,
+    seed=0,
+):
+    """
+    Write a synthetic case to root: nyears of history files for each stream, with nvars
+    variables (the first nvars_3d on z_t levels) on a POP-like grid (a key of
+    grid_sizes, or a (nlat, nlon, nz) tuple), and cesm.log files with model dates
+    and MARBL warnings. Everything is reproducible for a given seed.
+
+    layout: "DOUT_S" puts history files in {root}/{comp}/hist and logs in {root}/logs;
+            "RUNDIR" puts history files and logs in root itself
+    ts_years: the first ts_years years are also written as time series files in
+              {root}/{comp}/proc/tseries/{freq} (their history files are kept too)
+
+    Returns dict with lists of history, timeseries, and log files
+    """
+    if layout not in ["DOUT_S", "RUNDIR"]:
+        raise ValueError(f"layout must be DOUT_S or RUNDIR, not {layout}")
+    root = str(root)
+    grid_ds = gen_grid_ds(grid, seed)
+    varnames = gen_varnames(nvars)
+    files = dict(history=[], timeseries=[], logs=[])
+
+    for stream in streams:
+        comp = stream_info[stream]["comp"]
+        hist_dir = os.path.join(root, comp, "hist") if layout == "DOUT_S" else root
+        os.makedirs(hist_dir, exist_ok=True)
+        for year in range(1, nyears + 1):
+            ds_year = []
+            for file_ind, datestamp in enumerate(get_history_datestamps(year, stream)):
+                ds = gen_hist_ds(
+                    grid_ds, casename, stream, year, file_ind, varnames, nvars_3d, seed
+                )
+                filename = os.path.join(hist_dir, f"{casename}.{stream}.{datestamp}.nc")
+                ds.to_netcdf(filename, encoding=_encoding(ds), unlimited_dims="time")
+                files["history"].append(filename)
+                if year <= ts_years:
+                    ds_year.append(ds)
+            if year > ts_years:
+                continue
+            ts_dir = os.path.join(
+                root, comp, "proc", "tseries", stream_info[stream]["freq"]
+            )
+            os.makedirs(ts_dir, exist_ok=True)
+            ds_year = xr.concat(
+                ds_year,
+                dim="time",
+                data_vars="minimal",
+                coords="minimal",
+                compat="override",
+            )
+            if stream_info[stream]["daily"]:
+                dates = f"{year:04}0101-{year:04}1231"
+            elif stream == "pop.h.nyear1":
+                dates = f"{year:04}-{year:04}"
+            else:
+                dates = f"{year:04}01-{year:04}12"
+            for varname in varnames:
+                ds_ts = ds_year.drop_vars(
+                    [other for other in varnames if other != varname]
+                )
+                filename = os.path.join(
+                    ts_dir, f"{casename}.{stream}.{varname}.{dates}.nc"
+                )
+                ds_ts.to_netcdf(
+                    filename, encoding=_encoding(ds_ts), unlimited_dims="time"
+                )
+                files["timeseries"].append(filename)
+
+    log_dir = os.path.join(root, "logs") if layout == "DOUT_S" else root
+    os.makedirs(log_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    for year in range(1, nyears + 1):
+        filename = os.path.join(log_dir, f"cesm.log.{year:04}0101-000000.gz")
+        _write_log(filename, year, rng, warnings_per_day)
+        files["logs"].append(filename)
+    return files
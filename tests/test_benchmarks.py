@@ -0,0 +1,29 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+
+sys.path.append(os.path.abspath("benchmarks"))
+from run_benchmarks import compare_results
+
+
+def test_compare_results():
+    baseline = dict(
+        tiny_1yr=dict(
+            open=dict(wall_time=1.0, peak_rss_mb=100.0, files_opened=26),
+            render=dict(wall_time=0.01, peak_rss_mb=100.0, files_opened=30),
+        )
+    )
+    results = dict(
+        tiny_1yr=dict(
+            open=dict(wall_time=1.5, peak_rss_mb=110.0, files_opened=27),
+            # small differences in wall time are ignored
+            render=dict(wall_time=0.02, peak_rss_mb=100.0, files_opened=30),
+            # stages missing from baseline are not compared
+            logs=dict(wall_time=1.0, peak_rss_mb=100.0, files_opened=1),
+        )
+    )
+    assert compare_results(results, baseline) == [
+        ("tiny_1yr", "open", "wall_time", 1.0, 1.5),
+        ("tiny_1yr", "open", "files_opened", 26, 27),
+    ]
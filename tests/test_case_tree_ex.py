@@ -0,0 +1,51 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join("notebooks")))
+from utils.CaseClass import CaseClass
+from case_tree_ex import write_case_tree
+
+casename = "test_case"
+
+
+@pytest.mark.parametrize("layout", ["DOUT_S", "RUNDIR"])
+def test_write_case_tree(tmp_path, layout):
+    files = write_case_tree(
+        tmp_path,
+        casename,
+        nyears=2,
+        streams=["pop.h", "pop.h.nyear1"],
+        ts_years=1,
+        layout=layout,
+    )
+    assert len(files["history"]) == 2 * (12 + 1)
+    assert len(files["timeseries"]) == 2 * 4
+    assert len(files["logs"]) == 2
+
+    case = CaseClass(casename, str(tmp_path))
+    assert len(case.get_history_files(2, "pop.h")) == 12
+    assert len(case.get_timeseries_files(1, "pop.h", "PO4")) == 1
+
+    ds = case.gen_dataset(["PO4", "SiO3"], "pop.h", start_year=1, end_year=2)
+    assert ds.sizes["time"] == 24
+    assert ds["PO4"].dims == ("time", "z_t", "nlat", "nlon")
+    assert ds["time_bound"].values[-1, 1].strftime("%Y-%m-%d") == "0003-01-01"
+
+    warning_count = case.get_co2calc_warning_cnt()
+    assert list(warning_count)[0] == "0001-01-01"
+    assert list(warning_count)[-1] == "0002-12-31"
+    assert len(warning_count) == 2 * 365
+    assert sum(sum(counts) for counts in warning_count.values()) > 0
+
+
+def test_write_case_tree_reproducible(tmp_path):
+    kwargs = dict(nyears=1, streams=["pop.h.nday1"], nvars=2, seed=3)
+    files1 = write_case_tree(tmp_path / "run1", **kwargs)
+    files2 = write_case_tree(tmp_path / "run2", **kwargs)
+    assert len(files1["history"]) == 12
+    for file1, file2 in zip(files1["history"][:3], files2["history"][:3]):
+        with open(file1, "rb") as fp1, open(file2, "rb") as fp2:
+            assert fp1.read() == fp2.read()
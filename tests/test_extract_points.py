@@ -0,0 +1,67 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join("notebooks")))
+from utils import extract_points_from_cases
+from utils.CaseClass import CaseClass
+from case_tree_ex import gen_grid_ds, write_case_tree
+
+casename = "test_case"
+
+
+@pytest.fixture(scope="module")
+def case(tmp_path_factory):
+    root = tmp_path_factory.mktemp("case")
+    write_case_tree(root, casename, nyears=2, ts_years=1)
+    return CaseClass(casename, str(root))
+
+
+@pytest.mark.parametrize(
+    "nlat, nlon",
+    [(2, 3), ([0, 5, 3], [7, 0, 3]), ([1, 2], [4, 4])],
+    ids=["single", "spread", "box"],
+)
+@pytest.mark.parametrize("varname", ["PO4", "SiO3"])
+def test_extract_points(case, varname, nlat, nlon):
+    points = case.extract_points(
+        varname, "pop.h", nlat, nlon, start_year=1, end_year=2, max_workers=1
+    )
+    ds = case.gen_dataset(varname, "pop.h", start_year=1, end_year=2)
+    grid_ds = gen_grid_ds()
+    nlat = np.atleast_1d(nlat)
+    nlon = np.atleast_1d(nlon)
+    assert points.dims[0] == "time" and points.dims[-1] == "point"
+    assert points.sizes["time"] == 24
+    assert points.sizes["point"] == len(nlat)
+    assert (points["time"].values == ds["time"].values).all()
+    for n, (j, i) in enumerate(zip(nlat, nlon)):
+        expected = ds[varname].isel(nlat=j, nlon=i).values
+        np.testing.assert_allclose(
+            points.isel(point=n).values, expected, rtol=1e-6, equal_nan=True
+        )
+        assert points["TLAT"].values[n] == grid_ds["TLAT"].values[j, i]
+        assert points["TLONG"].values[n] == grid_ds["TLONG"].values[j, i]
+
+
+def test_extract_points_from_cases(case):
+    kwargs = dict(start_year=1, end_year=2)
+    serial = case.extract_points(
+        "PO4", "pop.h", [1, 4], [2, 6], max_workers=1, **kwargs
+    )
+    points = extract_points_from_cases(
+        dict(a=case, b=case), "PO4", "pop.h", [1, 4], [2, 6], max_workers=2, **kwargs
+    )
+    assert list(points) == ["a", "b"]
+    for da in points.values():
+        assert da.identical(serial)
+
+
+def test_extract_points_errors(case):
+    with pytest.raises(ValueError):
+        case.extract_points("PO4", "pop.h", [1, 2], [3], max_workers=1)
+    with pytest.raises(ValueError):
+        case.extract_points("PO4", "pop.h", 1, 2, start_year=5, end_year=6)
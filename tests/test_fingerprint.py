@@ -0,0 +1,137 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import pytest
+import cftime
+import matplotlib.pyplot as plt
+
+sys.path.append(os.path.abspath(os.path.join("notebooks")))
+sys.path.append(os.path.abspath("tests"))
+from utils.fingerprint import files_in_time_window, gen_fingerprint
+from utils.Plotting import _is_up_to_date
+from utils.PlotTypeClass import SummaryTSClass
+from xr_ds_ex import xr_ds_ex
+
+casename = "g.e22.G1850ECO_JRA_HR.TL319_t13.004"
+hist_files = [f"{casename}.pop.h.0002-{month:02}.nc" for month in range(1, 13)]
+ts_files = [f"{casename}.pop.h.PO4.{year:04}01-{year:04}12.nc" for year in [1, 2]]
+
+
+@pytest.mark.parametrize(
+    "time_beg, time_end, expected",
+    [
+        # January of year 1 is only in the first time series file
+        ((1, 1, 1), (1, 2, 1), ts_files[:1]),
+        # all of year 2 is in the second time series file and all history files
+        ((2, 1, 1), (3, 1, 1), ts_files[1:] + hist_files),
+        # a single month only overlaps a single history file
+        ((2, 3, 1), (2, 4, 1), ts_files[1:] + hist_files[2:3]),
+        # last history file is assumed to extend indefinitely
+        ((2, 12, 1), (4, 1, 1), ts_files[1:] + hist_files[11:]),
+        # nothing after the end of the run
+        ((5, 1, 1), (6, 1, 1), hist_files[11:]),
+    ],
+)
+def test_files_in_time_window(time_beg, time_end, expected):
+    files = files_in_time_window(
+        ts_files + hist_files,
+        cftime.DatetimeNoLeap(*time_beg),
+        cftime.DatetimeNoLeap(*time_end),
+    )
+    assert files == expected
+
+
+def test_files_in_time_window_streams():
+    # annual files of another stream do not end the monthly files, nor the other way
+    annual_files = [f"{casename}.pop.h.nyear1.{year:04}.nc" for year in [2, 3]]
+    files = files_in_time_window(
+        hist_files + annual_files,
+        cftime.DatetimeNoLeap(2, 12, 1),
+        cftime.DatetimeNoLeap(3, 2, 1),
+    )
+    assert files == hist_files[11:] + annual_files
+    files = files_in_time_window(
+        hist_files + annual_files,
+        cftime.DatetimeNoLeap(2, 3, 1),
+        cftime.DatetimeNoLeap(2, 4, 1),
+    )
+    assert files == hist_files[2:3] + annual_files[:1]
+
+
+def test_files_in_time_window_undecoded():
+    # without decoded times, every file must be kept
+    assert files_in_time_window(ts_files, 0.0, 31.0) == ts_files
+
+
+def test_gen_fingerprint(tmp_path):
+    filename = tmp_path / "file.nc"
+    filename.write_text("")
+    metadata = {"plot_type": "time_series", "varname": "PO4"}
+    args = ([str(filename)], ("0001-01-01", "0002-01-01"), metadata)
+
+    fingerprint = gen_fingerprint(*args, {"vmin": 0.0})
+    assert gen_fingerprint(*args, {"vmin": 0.0}) == fingerprint
+    # filepath is an output, not an input
+    assert (
+        gen_fingerprint(*args[:2], {**metadata, "filepath": "x"}, {"vmin": 0.0})
+        == fingerprint
+    )
+    assert gen_fingerprint(*args, {"vmin": 1.0}) != fingerprint
+
+    # modifying an input file changes the fingerprint
+    os.utime(filename, (0, 0))
+    assert gen_fingerprint(*args, {"vmin": 0.0}) != fingerprint
+
+
+def test_is_up_to_date(tmp_path):
+    da = xr_ds_ex()["var_ex"]
+    summary_ts = SummaryTSClass(da, casename, "0001-01-01", "0003-12-31", {})
+    root_dir = str(tmp_path)
+
+    # no fingerprint => never up to date
+    assert not summary_ts.is_up_to_date(root_dir)
+
+    summary_ts.set_fingerprint([], ("0001-01-01", "0004-01-01"), time_coarsen_len=12)
+    assert not summary_ts.is_up_to_date(root_dir)
+
+    fig, ax = plt.subplots()
+    summary_ts.savefig(fig, root_dir=root_dir)
+    plt.close(fig)
+    assert summary_ts.is_up_to_date(root_dir)
+
+    summary_ts.set_fingerprint([], ("0001-01-01", "0004-01-01"), time_coarsen_len=6)
+    assert not summary_ts.is_up_to_date(root_dir)
+
+
+class _RecordFingerprint(object):
+    """stands in for a PlotType object, keeps the arguments of set_fingerprint()"""
+
+    def set_fingerprint(self, input_files, time_window, **render_opts):
+        self.args = (input_files, time_window, render_opts)
+
+
+def test_is_up_to_date_time_slice():
+    ds = xr_ds_ex(nyrs=3)
+    ds.encoding["source_files"] = ts_files
+    tb_name = ds["time"].attrs["bounds"]
+    plot_obj = _RecordFingerprint()
+    # the time window is that of the time levels of da, not of ds
+    da = ds["var_ex"].isel(time=slice(-12, None))
+    _is_up_to_date(plot_obj, ds, da, 0, -1, dict(incremental=False))
+    _, time_window, _ = plot_obj.args
+    assert time_window == (ds[tb_name].values[-12, 0], ds[tb_name].values[-1, -1],)
+
+
+def test_is_up_to_date_savefig_kwargs():
+    ds = xr_ds_ex()
+    ds.encoding["source_files"] = ts_files
+    da = ds["var_ex"]
+    summary_ts = SummaryTSClass(da, casename, "0001-01-01", "0001-12-31", {})
+    fingerprints = []
+    for dpi in [100, 100, 50]:
+        plot_options = dict(incremental=False, savefig_kwargs=dict(dpi=dpi))
+        _is_up_to_date(summary_ts, ds, da, 0, -1, plot_options)
+        fingerprints.append(summary_ts.fingerprint)
+    assert fingerprints[0] == fingerprints[1]
+    assert fingerprints[0] != fingerprints[2]
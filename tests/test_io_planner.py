@@ -0,0 +1,99 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join("notebooks")))
+from utils.CaseClass import CaseClass
+from utils.IOPlannerClass import IOPlannerClass
+from utils.PlotSuiteClass import PlotSuiteClass
+from utils.utils_regions import REGION_VARS
+from case_tree_ex import write_case_tree
+
+casename = "test_case"
+diag_metadata_list = [
+    dict(varname="PO4", isel_dict={"z_t": 0}),
+    dict(varname="NO3"),
+    dict(varname="PO4", isel_dict={"z_t": 1}),
+    dict(varname="SiO3", regions=["Global"]),
+]
+
+
+def _plot_func(ds, diag_metadata, calls):
+    da = ds[diag_metadata["varname"]].isel(diag_metadata.get("isel_dict", {}))
+    calls.append((diag_metadata["varname"], float(da.mean())))
+
+
+def test_history_files(tmp_path):
+    files = write_case_tree(tmp_path / "case", casename, nyears=1)
+    case = CaseClass(casename, str(tmp_path / "case"))
+    planner = IOPlannerClass(case, diag_metadata_list, start_year=1, end_year=1)
+
+    # history files hold every variable, so there is one read
+    assert len(planner.groups) == 1
+    group = planner.groups[0]
+    assert group["varnames"] == ["PO4", "NO3", "SiO3"]
+    assert group["cached"] == ["PO4"]
+    assert all(var in group["vars_to_keep"] for var in REGION_VARS)
+
+    report = planner.get_report()
+    nfiles = len(files["history"])
+    assert report["opens_planned"].to_list() == [nfiles]
+    assert report["opens_naive"].to_list() == [4 * nfiles]
+    # PO4 is read once instead of twice, and the coordinates once instead of 4 times
+    assert report["bytes_planned"][0] < report["bytes_naive"][0]
+
+    ds = planner.get_dataset(0)
+    assert all(planner.get_dataset(index) is ds for index in range(1, 4))
+    # released after the last entry
+    assert planner._datasets == dict()
+
+
+def test_timeseries_files(tmp_path):
+    write_case_tree(tmp_path / "case", casename, nyears=2, ts_years=1)
+    case = CaseClass(casename, str(tmp_path / "case"))
+    planner = IOPlannerClass(
+        case, diag_metadata_list, start_year=1, end_year=2, max_cache_bytes=0
+    )
+    # time series files hold one variable each
+    assert [group["varnames"] for group in planner.groups] == [
+        ["PO4"],
+        ["NO3"],
+        ["SiO3"],
+    ]
+    report = planner.get_report()
+    assert (report["bytes_planned"] <= report["bytes_naive"]).all()
+    # nothing is cached, so only the coordinates of the second PO4 read are saved
+    po4 = planner.groups[0]
+    assert report["bytes_naive"][0] - report["bytes_planned"][0] == (
+        planner._overhead_bytes(po4)
+    )
+
+
+def test_suite_combine_reads(tmp_path):
+    write_case_tree(tmp_path / "case", casename, nyears=1)
+    case = CaseClass(casename, str(tmp_path / "case"))
+    calls_naive = []
+    suite = PlotSuiteClass(
+        case, diag_metadata_list, _plot_func, start_year=1, end_year=1
+    )
+    suite.run(sample_memory=False, calls=calls_naive)
+
+    suite = PlotSuiteClass(
+        case,
+        diag_metadata_list,
+        _plot_func,
+        combine_reads=True,
+        start_year=1,
+        end_year=1,
+    )
+    for lookahead in [0, 1]:
+        calls = []
+        suite.run(sample_memory=False, lookahead=lookahead, calls=calls)
+        assert [call[0] for call in calls] == [call[0] for call in calls_naive]
+        np.testing.assert_allclose(
+            [call[1] for call in calls], [call[1] for call in calls_naive]
+        )
+    assert len(suite.planner.get_report()) == 1
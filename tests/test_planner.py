@@ -0,0 +1,108 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+
+sys.path.append(os.path.abspath("data_reshaping"))
+from planner import plan, plan_year
+from SchedulerClass import PBSSchedulerClass
+from reshaper import reshape_year
+from test_reshaper import _write_history, casename
+from test_scheduler import _fake_qsub
+
+
+def test_plan_year(tmp_path):
+    hist_files = _write_history(tmp_path)
+    output_root = tmp_path / "output"
+    args = (casename, tmp_path, output_root, "pop.h", 1)
+
+    record = plan_year(*args)
+    assert record["status"] == "not started"
+    assert record["missing_vars"] == ["PO4", "SST"]
+    assert "varnames" not in record["job"]
+
+    reshape_year(*args, varnames=["SST"], nprocs=1)
+    record = plan_year(*args)
+    assert record["status"] == "missing variables"
+    assert record["job"]["varnames"] == ["PO4"]
+    assert "varnames" not in plan_year(*args, allow_subsets=False)["job"]
+
+    reshape_year(*args, varnames=["PO4"], nprocs=1)
+    record = plan_year(*args)
+    assert record["status"] == "complete"
+    assert record["job"] is None
+
+    os.remove(hist_files[-1])
+    record = plan_year(casename, tmp_path, tmp_path / "output2", "pop.h", 1)
+    assert record["status"] == "partial year"
+    assert (record["history_files"], record["expected_files"]) == (11, 12)
+
+
+def test_plan(tmp_path):
+    _write_history(tmp_path)
+    output_root = tmp_path / "output"
+    jobs, records = plan(casename, tmp_path, output_root, [1, 2], ["pop.h"])
+    assert [record["status"] for record in records] == ["not started", "no history"]
+    assert len(jobs) == 1
+
+    reshape_year(casename, tmp_path, output_root, "pop.h", 1, nprocs=1)
+    jobs, records = plan(casename, tmp_path, output_root, [1], ["pop.h"])
+    assert jobs == []
+    assert records[0]["status"] == "done"
+
+
+def test_plan_with_proc_done(tmp_path, monkeypatch):
+    # the *_t13.sh scripts marked the year done, but a time series file is missing
+    _write_history(tmp_path)
+    args_file = _fake_qsub(tmp_path, monkeypatch)
+    scheduler = PBSSchedulerClass(proc_base=tmp_path / "proc", script_dir="scripts")
+    job = dict(case=casename, stream="pop.h", year=1, output_root="unused")
+    completed_dir = tmp_path / "proc" / casename / "pop.h" / "proc" / "COMPLETED"
+    completed_dir.mkdir(parents=True)
+    (completed_dir / f"{casename}.pop.h.SST.000101-000112.nc").touch()
+    done_path = (
+        tmp_path / "proc" / casename / "pop.h" / "proc" / f".DONE.{casename}.pop.h.0001"
+    )
+    done_path.touch()
+    assert scheduler.get_done_path(job) == str(done_path)
+
+    # time series and markers are looked for where the scripts write them,
+    # and batch schedulers convert entire years
+    jobs, records = plan(
+        casename,
+        str(tmp_path),
+        str(tmp_path / "output"),
+        [1],
+        ["pop.h"],
+        allow_subsets=False,
+        scheduler=scheduler,
+    )
+    assert records[0]["status"] == "missing variables"
+    assert records[0]["marked_done"]
+    assert records[0]["missing_vars"] == ["PO4"]
+    assert scheduler.is_done(jobs[0])
+
+    # a dry run leaves the marker in place
+    dryrun = PBSSchedulerClass(proc_base=tmp_path / "proc", dryrun=True)
+    dryrun.submit(jobs[0], force=True)
+    assert done_path.exists()
+
+    # the stale marker is removed, so the script converts the year again
+    name = scheduler.submit(jobs[0], force=True)
+    assert scheduler.wait()[name]["status"] == "submitted"
+    assert not done_path.exists()
+    assert args_file.read_text().split()[-4:] == [
+        os.path.join("scripts", "pop.h_t13.sh"),
+        casename,
+        str(tmp_path),
+        "0001",
+    ]
+
+    # once every time series exists, the year is done
+    (completed_dir / f"{casename}.pop.h.PO4.000101-000112.nc").touch()
+    done_path.touch()
+    jobs, records = plan(
+        casename, str(tmp_path), "unused", [1], ["pop.h"], scheduler=scheduler
+    )
+    assert jobs == []
+    assert records[0]["status"] == "done"
@@ -0,0 +1,132 @@
+#! /usr/bin/env python3
+
+import json
+import os
+import sys
+import pathlib
+import pytest
+import matplotlib.pyplot as plt
+from PIL import Image
+
+sys.path.append(os.path.abspath(os.path.join("notebooks")))
+sys.path.append(os.path.abspath("tests"))
+from utils.PlotCatalogClass import PlotCatalogClass
+from utils.PlotTypeClass import SummaryHistClass, SummaryTSClass
+from utils.PlotWriterClass import PlotWriterClass
+from utils import generate_plot_catalog
+from xr_ds_ex import xr_ds_ex
+
+casename = "g.e22.G1850ECO_JRA_HR.TL319_t13.004"
+
+
+def test_savefig_adds_to_catalog(tmp_path):
+    da = xr_ds_ex()["var_ex"]
+    root_dir = str(tmp_path)
+    fig, ax = plt.subplots()
+    for apply_log10 in [False, True]:
+        summary_hist = SummaryHistClass(
+            da, casename, apply_log10, "0001-01-01", "0003-12-31", {}
+        )
+        summary_hist.savefig(fig, root_dir=root_dir)
+    SummaryTSClass(da, casename, "0001-01-01", "0003-12-31", {}).savefig(
+        fig, root_dir=root_dir
+    )
+    # saving an image a second time replaces its record
+    summary_hist.savefig(fig, root_dir=root_dir)
+    plt.close(fig)
+
+    df = PlotCatalogClass(root_dir).query(casename=casename, plot_type="histogram")
+    assert list(df.columns) == [
+        "plot_type",
+        "varname",
+        "casename",
+        "apply_log10",
+        "time_period",
+        "sel_dict",
+        "filepath",
+    ]
+    # sorted by filepath
+    assert df["apply_log10"].to_list() == [True, False]
+    assert df["sel_dict"].to_list() == [{}, {}]
+    assert df["filepath"].to_list() == [
+        "histogram/var_ex.0001-01-01_0003-12-31.log10.png",
+        "histogram/var_ex.0001-01-01_0003-12-31.png",
+    ]
+    assert len(PlotCatalogClass(root_dir).query(casename=casename)) == 3
+
+
+def test_migrate_json(tmp_path):
+    # catalog from an earlier version of savefig: JSON files only
+    metadata_dir = tmp_path / "images" / casename / "time_series" / "metadata"
+    metadata_dir.mkdir(parents=True)
+    for varname in ["PO4", "NO3"]:
+        metadata = dict(
+            plot_type="time_series",
+            varname=varname,
+            casename=casename,
+            time_period="0001-01-01_0003-12-31",
+            sel_dict={"z_t": "500.00"},
+            filepath=f"time_series/{varname}.0001-01-01_0003-12-31.png",
+        )
+        with open(metadata_dir / f"{varname}.json", "w") as fp:
+            json.dump(metadata, fp)
+
+    df = generate_plot_catalog(tmp_path, use_full_path=False)
+    assert df["varname"].to_list() == ["NO3", "PO4"]
+    assert df["sel_dict"].to_list() == [{"z_t": "500.00"}] * 2
+
+    # JSON files are only read the first time
+    (metadata_dir / "PO4.json").unlink()
+    df = generate_plot_catalog(tmp_path, casename=casename)
+    assert len(df) == 2
+    assert df["filepath"][0] == (
+        (tmp_path / "time_series/NO3.0001-01-01_0003-12-31.png").as_posix()
+    )
+    assert len(generate_plot_catalog(tmp_path, plot_type="histogram")) == 0
+
+
+@pytest.mark.parametrize("use_writer", [True, False])
+def test_savefig_previews(tmp_path, use_writer):
+    da = xr_ds_ex()["var_ex"]
+    root_dir = str(tmp_path)
+    summary_ts = SummaryTSClass(da, casename, "0001-01-01", "0003-12-31", {})
+    summary_ts.set_fingerprint([], ("0001-01-01", "0004-01-01"))
+    writer = PlotWriterClass() if use_writer else None
+
+    fig, ax = plt.subplots(figsize=(8.0, 4.0))
+    summary_ts.savefig(fig, root_dir=root_dir, writer=writer, previews=True, dpi=100)
+    plt.close(fig)
+    if use_writer:
+        writer.close()
+
+    assert not summary_ts.is_up_to_date(root_dir, previews={"small": 50})
+    assert summary_ts.is_up_to_date(root_dir, previews=True)
+    df = PlotCatalogClass(root_dir).query(casename=casename)
+    case_dir = tmp_path / casename
+    assert Image.open(case_dir / df["filepath"][0]).size == (800, 400)
+    assert df["thumbnail_filepath"][0] == (
+        "time_series/thumbnail/var_ex.0001-01-01_0003-12-31.png"
+    )
+    assert Image.open(case_dir / df["thumbnail_filepath"][0]).size == (160, 80)
+    assert Image.open(case_dir / df["preview_filepath"][0]).size == (480, 240)
+
+
+@pytest.mark.parametrize("use_writer", [True, False])
+def test_savefig_failure_not_cataloged(tmp_path, use_writer):
+    da = xr_ds_ex()["var_ex"]
+    root_dir = str(tmp_path)
+    summary_ts = SummaryTSClass(da, casename, "0001-01-01", "0003-12-31", {})
+    # a directory where the PNG should go, so writing it fails
+    _, filepath, _ = summary_ts.get_output_paths(root_dir)
+    os.makedirs(filepath)
+    fig, ax = plt.subplots()
+    if use_writer:
+        writer = PlotWriterClass()
+        summary_ts.savefig(fig, root_dir=root_dir, writer=writer)
+        with pytest.raises(RuntimeError):
+            writer.close()
+    else:
+        with pytest.raises(OSError):
+            summary_ts.savefig(fig, root_dir=root_dir)
+    plt.close(fig)
+    assert len(PlotCatalogClass(root_dir).query(casename=casename)) == 0
@@ -0,0 +1,125 @@
+#! /usr/bin/env python3
+
+import json
+import os
+import sys
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join("notebooks")))
+from utils.CaseClass import CaseClass
+from utils.PlotSuiteClass import PlotSuiteClass
+from case_tree_ex import write_case_tree
+
+casename = "test_case"
+diag_metadata_list = [dict(varname="PO4", isel_dict={"z_t": 0}), dict(varname="NO3")]
+
+
+def _plot_func(ds, diag_metadata, calls):
+    da = ds[diag_metadata["varname"]].isel(diag_metadata.get("isel_dict", {}))
+    calls.append((diag_metadata["varname"], float(da.mean())))
+
+
+@pytest.mark.parametrize("use_client", [False, True])
+def test_plot_suite(tmp_path, use_client):
+    write_case_tree(tmp_path / "case", casename, nyears=1)
+    case = CaseClass(casename, str(tmp_path / "case"))
+    suite = PlotSuiteClass(
+        case, diag_metadata_list, _plot_func, start_year=1, end_year=1
+    )
+    report_file = tmp_path / "report.json"
+    calls = []
+    if use_client:
+        distributed = pytest.importorskip("dask.distributed")
+        with distributed.Client(processes=False, n_workers=1) as client:
+            report = suite.run(
+                client,
+                report_file=report_file,
+                performance_report_dir=tmp_path / "reports",
+                sample_interval=0.01,
+                calls=calls,
+            )
+        assert (report["nworkers"] == 1).all()
+        assert (report["worker_peak_mb"] > 0).all()
+        assert os.path.isfile(report["performance_report"][0])
+    else:
+        report = suite.run(report_file=report_file, calls=calls)
+        assert report["worker_peak_mb"].isnull().all()
+
+    assert [call[0] for call in calls] == ["PO4", "NO3"]
+    assert report["varname"].to_list() == ["PO4", "NO3"]
+    assert (report["client_peak_mb"] > 0).all()
+    with open(report_file) as fp:
+        assert json.load(fp)[0]["isel_dict"] == {"z_t": 0}
+
+
+@pytest.mark.parametrize("max_prefetch_bytes", [0, 2 ** 30], ids=["guarded", "all"])
+def test_plot_suite_prefetch(tmp_path, max_prefetch_bytes):
+    write_case_tree(tmp_path / "case", casename, nyears=1)
+    case = CaseClass(casename, str(tmp_path / "case"))
+    suite = PlotSuiteClass(
+        case, 2 * diag_metadata_list, _plot_func, start_year=1, end_year=1
+    )
+    calls_seq = []
+    suite.run(sample_memory=False, calls=calls_seq)
+
+    distributed = pytest.importorskip("dask.distributed")
+    calls = []
+    with distributed.Client(processes=False, n_workers=1) as client:
+        report = suite.run(
+            client,
+            sample_memory=False,
+            lookahead=2,
+            max_prefetch_bytes=max_prefetch_bytes,
+            calls=calls,
+        )
+    # same results, in the same order
+    assert calls == calls_seq
+    assert report["prefetched"].to_list() == 4 * [max_prefetch_bytes > 0]
+
+
+def test_plot_suite_prefetch_budget(tmp_path):
+    write_case_tree(tmp_path / "case", casename, nyears=1)
+    case = CaseClass(casename, str(tmp_path / "case"))
+    diag_metadata = diag_metadata_list[0]
+    distributed = pytest.importorskip("dask.distributed")
+    plotted = []
+
+    def plot_func(ds, diag_metadata):
+        da = ds[diag_metadata["varname"]].isel(diag_metadata["isel_dict"])
+        with distributed.get_task_stream() as task_stream:
+            mean = float(da.mean())
+        # tasks that read the file are fused into the tasks of the mean, while
+        # the persisted selection may still be loading in other tasks
+        keys = [str(task["key"]) for task in task_stream.data]
+        reads = any("open_dataset" in key for key in keys if "mean_chunk" in key)
+        plotted.append((suite._prefetch_bytes, reads, mean))
+
+    suite = PlotSuiteClass(
+        case, 4 * [diag_metadata], plot_func, start_year=1, end_year=1
+    )
+    ds = suite.get_dataset(diag_metadata)
+    # only the selection that is plotted is persisted, not the whole variable
+    nbytes = ds["PO4"].isel(z_t=[0]).nbytes
+    assert ds["PO4"].nbytes > nbytes
+
+    with distributed.Client(processes=False, n_workers=1) as client:
+        for max_prefetch_bytes in [0, nbytes]:
+            plotted.clear()
+            report = suite.run(
+                client,
+                sample_memory=False,
+                lookahead=2,
+                max_prefetch_bytes=max_prefetch_bytes,
+            )
+            assert report["prefetched"][0] == (max_prefetch_bytes > 0)
+            for prefetched, (prefetch_bytes, reads, mean) in zip(
+                report["prefetched"], plotted
+            ):
+                # a persisted selection counts against the budget until its plot
+                # returns, and the plot does not read it from the file again
+                assert prefetch_bytes <= max_prefetch_bytes
+                if prefetched:
+                    assert prefetch_bytes == nbytes
+                assert reads != prefetched
+                assert mean == plotted[0][2]
+            assert suite._prefetch_bytes == 0
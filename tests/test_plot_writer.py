@@ -0,0 +1,128 @@
+#! /usr/bin/env python3
+
+import io
+import json
+import os
+import sys
+import numpy as np
+import pytest
+from PIL import Image
+from matplotlib.figure import Figure
+
+sys.path.append(os.path.abspath(os.path.join("notebooks")))
+from utils.PlotWriterClass import PlotWriterClass
+
+
+def _fig():
+    fig = Figure(figsize=(4.0, 3.0))
+    fig.add_subplot(111).plot([0, 1, 2], [1, 0, 2])
+    return fig
+
+
+def test_writer_flush(tmp_path):
+    fig = _fig()
+    written = []
+    writer = PlotWriterClass(nthreads=2, maxsize=2)
+    for n in range(4):
+        writer.write_figure(
+            fig,
+            str(tmp_path / "png" / f"{n}.png"),
+            str(tmp_path / "json" / f"{n}.json"),
+            dict(n=n),
+            previews={str(tmp_path / "small" / f"{n}.png"): 40},
+            on_written=lambda n=n: written.append(n),
+            dpi=50,
+        )
+        # fig can be modified as soon as write_figure() returns
+        fig.axes[0].set_title(f"{n}")
+    report = writer.flush()
+
+    assert report["files_written"] == 12
+    assert report["queued"] == 0
+    assert report["errors"] == []
+    assert sorted(written) == [0, 1, 2, 3]
+    assert Image.open(tmp_path / "png" / "3.png").size == (200, 150)
+    assert Image.open(tmp_path / "small" / "3.png").size == (40, 30)
+    with open(tmp_path / "json" / "2.json") as fp:
+        assert json.load(fp) == dict(n=2)
+    writer.close()
+
+
+def test_writer_matches_savefig(tmp_path):
+    fig = _fig()
+    with PlotWriterClass() as writer:
+        writer.write_figure(
+            fig, str(tmp_path / "fig.png"), str(tmp_path / "fig.json"), {}, dpi=60
+        )
+    with io.BytesIO() as buf:
+        fig.savefig(buf, format="png", dpi=60)
+        expected = np.asarray(Image.open(buf).convert("RGBA"))
+    assert np.array_equal(np.asarray(Image.open(tmp_path / "fig.png")), expected)
+
+
+def test_writer_errors(tmp_path):
+    fig = _fig()
+    written = []
+    writer = PlotWriterClass(nthreads=1)
+    # a directory where the PNG should go, so writing it fails
+    os.makedirs(tmp_path / "bad.png")
+    writer.write_figure(
+        fig,
+        str(tmp_path / "bad.png"),
+        str(tmp_path / "bad.json"),
+        {},
+        on_written=lambda: written.append("bad"),
+    )
+    writer.write_figure(
+        fig,
+        str(tmp_path / "good.png"),
+        str(tmp_path / "good.json"),
+        {},
+        on_written=lambda: written.append("good"),
+    )
+    with pytest.raises(RuntimeError, match="1 error") as excinfo:
+        writer.flush()
+    assert isinstance(excinfo.value.__cause__, OSError)
+
+    # the other figure is still written, and the failed one is not reported done
+    assert writer.report()["errors"] == []
+    assert written == ["good"]
+    assert (tmp_path / "good.json").is_file()
+    assert not (tmp_path / "bad.json").exists()
+    # the temporary file of the failed write is removed
+    assert [path.name for path in tmp_path.glob("*.tmp")] == []
+
+    # errors are only raised once, later writes and flushes succeed
+    assert writer.flush()["errors"] == []
+    writer.write_figure(
+        fig, str(tmp_path / "next.png"), str(tmp_path / "next.json"), {}
+    )
+    assert writer.flush()["errors"] == []
+    assert (tmp_path / "next.json").is_file()
+    writer.close()
+
+
+def test_writer_atomic_rename(tmp_path, monkeypatch):
+    path = tmp_path / "fig.png"
+    path.write_bytes(b"previous contents")
+    writer = PlotWriterClass(nthreads=1)
+
+    def replace_fails(src, dst):
+        # the new contents are complete in a temporary file in the same directory
+        assert os.path.dirname(src) == str(tmp_path)
+        with open(src, "rb") as fp:
+            assert fp.read() == b"new contents"
+        raise OSError("rename failed")
+
+    monkeypatch.setattr(os, "replace", replace_fails)
+    with pytest.raises(OSError, match="rename failed"):
+        writer._write_atomic(str(path), b"new contents")
+    # the file under its final name is never partially written
+    assert path.read_bytes() == b"previous contents"
+    assert [path.name for path in tmp_path.iterdir()] == ["fig.png"]
+
+    monkeypatch.undo()
+    assert writer._write_atomic(str(path), b"new contents") == 12
+    assert path.read_bytes() == b"new contents"
+    assert [path.name for path in tmp_path.iterdir()] == ["fig.png"]
+    assert writer.close()["files_written"] == 1
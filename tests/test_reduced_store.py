@@ -0,0 +1,111 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join("notebooks")))
+from utils.CaseClass import CaseClass
+from utils.Plotting import summary_plot_global_ts, summary_plot_histogram
+from utils.ReducedStoreClass import ReducedStoreClass, get_reduced_da
+from utils.utils_regions import REGION_VARS, reduce_regions
+from utils.utils_time import temporal_mean
+from case_tree_ex import write_case_tree
+
+casename = "test_case"
+diag_metadata_list = [
+    dict(varname="NO3", regions=["Global", "Tropics"], display_units="mol/m^3"),
+    dict(varname="PO4", isel_dict={"z_t": 1}, apply_log10=[False, True]),
+]
+
+
+@pytest.fixture
+def case(tmp_path):
+    files = write_case_tree(tmp_path / "case", casename, nyears=2)
+    return CaseClass(casename, str(tmp_path / "case")), files
+
+
+@pytest.mark.parametrize("diag_metadata", diag_metadata_list, ids=["NO3", "PO4"])
+def test_reduced_values(case, tmp_path, diag_metadata):
+    case, _ = case
+    varname = diag_metadata["varname"]
+    isel_dict = diag_metadata.get("isel_dict", {})
+    store = ReducedStoreClass(str(tmp_path / "store"), casename)
+    assert store.update(case, diag_metadata, start_year=1, end_year=2) == [1, 2]
+    ds_red = store.open(varname, isel_dict)
+
+    ds = case.gen_dataset(
+        varname, "pop.h", start_year=1, end_year=2, vars_to_keep=REGION_VARS
+    )
+    da = ds[varname].isel(isel_dict)
+    mean, integral = reduce_regions(da, ds, diag_metadata.get("regions", ["Global"]))
+    np.testing.assert_allclose(ds_red["mean"], mean, rtol=1e-5)
+    np.testing.assert_allclose(ds_red["integral"], integral, rtol=1e-5)
+    assert ds_red["integral"].attrs["units"] == "mmol/m^3 cm^2"
+
+    values = da.isel(time=13).values
+    counts, edges = np.histogram(values[np.isfinite(values)], bins=20)
+    np.testing.assert_array_equal(ds_red["hist_counts"].isel(time=13, log10=0), counts)
+    np.testing.assert_allclose(ds_red["hist_edges"].isel(time=13, log10=0), edges)
+
+    annual = temporal_mean(da, ds[ds["time"].attrs["bounds"]], "annual")
+    np.testing.assert_allclose(ds_red["annual_mean"], annual, rtol=1e-5)
+    assert store.get_trend(varname, isel_dict).dims == da.dims[-2:]
+
+
+def test_incremental_update(case, tmp_path):
+    case, files = case
+    diag_metadata = diag_metadata_list[0]
+    store = ReducedStoreClass(str(tmp_path / "store"), casename)
+    assert store.update(case, diag_metadata, start_year=1, end_year=1) == [1]
+    assert store.update(case, diag_metadata, start_year=1, end_year=2) == [2]
+    assert store.update(case, diag_metadata, start_year=1, end_year=2) == []
+
+    # newer output for a year only rewrites that year
+    year2_file = [f for f in files["history"] if ".0002-" in f][0]
+    mtime = os.path.getmtime(year2_file) + 10.0
+    os.utime(year2_file, (mtime, mtime))
+    assert store.update(case, diag_metadata, start_year=1, end_year=2) == [2]
+    # so do different regions
+    diag_metadata = dict(diag_metadata, regions=["Atlantic"])
+    assert store.update(case, diag_metadata, start_year=1, end_year=2) == [1, 2]
+    assert list(store.open("NO3")["region"].values) == ["Global", "Atlantic"]
+
+    with pytest.raises(ValueError):
+        store.open("SiO3")
+
+
+def test_plots_from_store(case, tmp_path):
+    case, _ = case
+    store = ReducedStoreClass(str(tmp_path / "store"), casename)
+    for diag_metadata in diag_metadata_list:
+        store.update(case, diag_metadata, start_year=1, end_year=2)
+        ds_red = store.open(
+            diag_metadata["varname"], diag_metadata.get("isel_dict", {})
+        )
+        da = get_reduced_da(ds_red)
+        for plot_func in [summary_plot_global_ts, summary_plot_histogram]:
+            plot_func(
+                ds_red,
+                da,
+                diag_metadata,
+                save_pngs=True,
+                root_dir=str(tmp_path / "images"),
+            )
+    pngs = sorted(
+        filename
+        for _, _, filenames in os.walk(tmp_path / "images")
+        for filename in filenames
+        if filename.endswith(".png")
+    )
+    # NO3: 1 time series, 2 histograms; PO4: 1 time series, 2 x 2 histograms
+    assert len(pngs) == 8
+    assert any("z_t" in filename for filename in pngs)
+
+    # regions not in the store can not be plotted
+    ds_red = store.open("NO3")
+    with pytest.raises(ValueError):
+        summary_plot_global_ts(
+            ds_red, get_reduced_da(ds_red), dict(varname="NO3", regions=["Arctic"])
+        )
@@ -0,0 +1,69 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join("notebooks")))
+sys.path.append(os.path.abspath("tests"))
+from utils.PlotCatalogClass import PlotCatalogClass
+from utils.PlotTypeClass import SummaryHistClass, SummaryMapClass
+from utils.RenderPoolClass import RenderPoolClass
+from utils.RendererClass import HistRendererClass
+from xr_ds_ex import xr_ds_ex
+
+casename = "g.e22.G1850ECO_JRA_HR.TL319_t13.004"
+
+
+def test_render_pool(tmp_path):
+    da = xr_ds_ex()["var_ex"]
+    root_dir = str(tmp_path)
+    values = np.linspace(0.0, 1.0, 20).reshape(4, 5)
+    with RenderPoolClass(max_workers=2, max_pending=2) as pool:
+        for year in range(1, 5):
+            plot_obj = SummaryMapClass(da, casename, f"{year:04}", False, {})
+            pool.submit_map(plot_obj, dict(values=year * values), root_dir=root_dir)
+            # submitting blocks until at most max_pending images are not done
+            assert len(pool._pending) <= 2
+        list_of_counts = HistRendererClass().compute_histograms([values])
+        plot_obj = SummaryHistClass(da, casename, False, "0001", "0004", {})
+        pool.submit_hist(plot_obj, list_of_counts, root_dir=root_dir)
+        results = pool.wait()
+
+    # results are returned in the order the images were submitted
+    assert [result["error"] for result in results] == [None] * 5
+    assert [result["plot_type"] for result in results] == ["summary_map"] * 4 + [
+        "histogram"
+    ]
+    for result in results:
+        assert os.path.isfile(os.path.join(root_dir, casename, result["filepath"]))
+        # metadata includes what savefig() added in the worker
+        assert result["metadata"]["filepath"] == result["filepath"]
+    assert len(PlotCatalogClass(root_dir).query(casename=casename)) == 5
+
+
+def test_render_pool_errors(tmp_path):
+    da = xr_ds_ex()["var_ex"]
+    root_dir = str(tmp_path)
+    values = np.zeros((4, 5))
+    pool = RenderPoolClass(max_workers=1, max_pending=1)
+    # a map without values, which fails in the worker
+    pool.submit_map(SummaryMapClass(da, casename, "0001", False, {}), dict())
+    pool.submit_map(
+        SummaryMapClass(da, casename, "0002", False, {}),
+        dict(values=values),
+        root_dir=root_dir,
+    )
+    # the first image was collected when the second was submitted
+    assert len(pool._pending) == 1
+    results = pool.close()
+
+    # an error in one image does not stop the others
+    assert results[0]["filepath"] is None
+    assert "TypeError" in results[0]["error"]
+    assert "values" in results[0]["error"]
+    assert results[1]["error"] is None
+    assert results[1]["metadata"]["date"] == "0002"
+    assert results[1]["metadata"]["filepath"] == results[1]["filepath"]
+    assert "filepath" not in results[0]["metadata"]
+    assert len(PlotCatalogClass(root_dir).query(casename=casename)) == 1
@@ -0,0 +1,91 @@
+#! /usr/bin/env python3
+
+import io
+import os
+import sys
+import numpy as np
+import pytest
+import xarray as xr
+
+sys.path.append(os.path.abspath(os.path.join("notebooks")))
+from utils.RendererClass import HistRendererClass, MapRendererClass, get_map_args
+
+
+def _png(fig):
+    with io.BytesIO() as buf:
+        fig.savefig(buf, format="png")
+        return buf.getvalue()
+
+
+def _maps():
+    values = np.linspace(0.0, 1.0, 20).reshape(4, 5)
+    values_nan = values.copy()
+    values_nan[1, 2] = np.nan
+    # above vmax, below vmin, both, then back within the limits
+    return [values, 2.0 * values, values - 0.5, 3.0 * values - 1.0, values_nan]
+
+
+@pytest.mark.parametrize("vmin, vmax", [(0.0, 1.2), (None, None)])
+def test_map_renderer_reuse(vmin, vmax):
+    renderer = MapRendererClass(vmin=vmin, vmax=vmax)
+    for n, values in enumerate(_maps()):
+        fig = renderer.render(values, title=f"map {n}", cbar_label="units")
+        fresh = MapRendererClass(vmin=vmin, vmax=vmax).render(
+            values, title=f"map {n}", cbar_label="units"
+        )
+        assert _png(fig) == _png(fresh)
+    # colorbars are replaced, not added
+    assert len(renderer.fig.axes) == 2
+
+
+def test_map_renderer_extend():
+    renderer = MapRendererClass(vmin=0.0, vmax=1.2)
+    extends = []
+    for values in _maps():
+        renderer.render(values)
+        extends.append(renderer._cbar.extend)
+    assert extends == ["neither", "max", "min", "both", "neither"]
+
+
+def test_map_renderer_da():
+    da = xr.DataArray(
+        np.arange(12.0).reshape(3, 4),
+        dims=("nlat", "nlon"),
+        coords={"nlat": [-10.0, 0.0, 10.0]},
+        attrs={"long_name": "Sea Surface Temperature", "units": "degC"},
+        name="SST",
+    )
+    renderer = MapRendererClass()
+    # a map with a different shape rebuilds the mesh
+    renderer.render(np.zeros((2, 3)))
+    fig = renderer.render(**get_map_args(da))
+    fresh = MapRendererClass().render(**get_map_args(da))
+    assert _png(fig) == _png(fresh)
+    assert fig.axes[0].get_ylabel() == "nlat"
+    assert fig.axes[1].get_ylabel() == "Sea Surface Temperature [degC]"
+
+
+def test_hist_renderer_reuse():
+    rng = np.random.default_rng(0)
+    list_of_values = [rng.normal(size=100), rng.normal(size=50)]
+    renderer = HistRendererClass()
+    renderer.render(list_of_values, title="first")
+    # fewer lines than the previous call hides the extra line
+    fig = renderer.render(list_of_values[1:], title="second", xlabel="x")
+    fresh = HistRendererClass().render(list_of_values[1:], title="second", xlabel="x")
+    assert _png(fig) == _png(fresh)
+
+
+def test_hist_renderer_generator():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(3, 100))
+    values[1, :10] = np.nan
+    renderer = HistRendererClass()
+    # one array at a time, as summary_plot_histogram loads time levels
+    from_generator = renderer.compute_histograms(values[n] for n in range(3))
+    for (counts, edges), (expected_counts, expected_edges) in zip(
+        from_generator, renderer.compute_histograms(list(values))
+    ):
+        assert np.array_equal(counts, expected_counts)
+        assert np.array_equal(edges, expected_edges)
+    assert len(from_generator) == 3
@@ -0,0 +1,107 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import pytest
+import netCDF4
+import numpy as np
+import xarray as xr
+
+sys.path.append(os.path.abspath("data_reshaping"))
+from reshaper import reshape_year
+
+casename = "test_case"
+
+
+def _write_history(archive_root, year=1):
+    hist_dir = archive_root / casename / "ocn" / "hist"
+    hist_dir.mkdir(parents=True)
+    for month in range(1, 13):
+        time_attrs = {"units": "days since 0001-01-01", "calendar": "noleap"}
+        time = 365.0 * (year - 1) + 30.0 * month
+        values = np.arange(24, dtype="float32").reshape(1, 2, 3, 4) + month
+        values[0, 1, 0, 0] = 9.96921e36
+        ds = xr.Dataset(
+            {
+                "PO4": (("time", "z_t", "nlat", "nlon"), values, {"units": "mmol/m^3"}),
+                "SST": (("time", "nlat", "nlon"), values[:, 0, :, :]),
+                "time_bound": (("time", "d2"), [[time - 30.0, time]], time_attrs),
+                "TAREA": (("nlat", "nlon"), np.ones((3, 4)), {"units": "cm^2"}),
+            },
+            coords={
+                "time": ("time", [time], dict(bounds="time_bound", **time_attrs)),
+                "z_t": ("z_t", [500.0, 1500.0]),
+            },
+            attrs={"title": casename},
+        )
+        encoding = {"PO4": {"_FillValue": np.float32(9.96921e36)}}
+        ds.to_netcdf(
+            hist_dir / f"{casename}.pop.h.{year:04}-{month:02}.nc",
+            encoding=encoding,
+            format="NETCDF3_64BIT",
+        )
+    return sorted(hist_dir.iterdir())
+
+
+@pytest.mark.parametrize("nprocs", [1, 2])
+def test_reshape_year(tmp_path, nprocs):
+    hist_files = _write_history(tmp_path)
+    output_root = tmp_path / "output"
+
+    files_written = reshape_year(
+        casename, tmp_path, output_root, "pop.h", 1, nprocs=nprocs
+    )
+
+    ts_dir = output_root / "ocn" / "proc" / "tseries" / "month_1"
+    assert sorted(files_written) == [
+        str(ts_dir / f"{casename}.pop.h.{varname}.000101-000112.nc")
+        for varname in ["PO4", "SST"]
+    ]
+    assert (ts_dir / f".DONE.{casename}.pop.h.0001").is_file()
+    ds_hist = xr.open_mfdataset(
+        hist_files,
+        decode_times=False,
+        data_vars="minimal",
+        coords="minimal",
+        compat="override",
+    )
+    for varname, filename in zip(["PO4", "SST"], sorted(files_written)):
+        with netCDF4.Dataset(filename) as ds_nc:
+            assert ds_nc.data_model == "NETCDF4_CLASSIC"
+            assert ds_nc.variables[varname].filters()["zlib"]
+        with xr.open_dataset(filename, decode_times=False) as ds_ts:
+            assert ds_ts[varname].identical(ds_hist[varname].load())
+            assert ds_ts["time_bound"].identical(ds_hist["time_bound"].load())
+            assert ds_ts["TAREA"].identical(ds_hist["TAREA"])
+            assert ds_ts.attrs["title"] == casename
+    ds_hist.close()
+
+    # year is marked as done, so it is not converted again
+    assert reshape_year(casename, tmp_path, output_root, "pop.h", 1) == []
+
+
+def test_reshape_year_varnames(tmp_path):
+    _write_history(tmp_path)
+    output_root = tmp_path / "output"
+
+    files_written = reshape_year(
+        casename, tmp_path, output_root, "pop.h", 1, varnames=["SST"], nprocs=1
+    )
+    assert [os.path.basename(filename) for filename in files_written] == [
+        f"{casename}.pop.h.SST.000101-000112.nc"
+    ]
+    # converting a subset of variables does not mark the year as done
+    assert not (
+        output_root
+        / "ocn"
+        / "proc"
+        / "tseries"
+        / "month_1"
+        / f".DONE.{casename}.pop.h.0001"
+    ).exists()
+
+    with pytest.raises(ValueError):
+        reshape_year(casename, tmp_path, output_root, "pop.h", 1, varnames=["TAREA"])
+
+    # wrong number of history files
+    assert reshape_year(casename, tmp_path, output_root, "pop.h.nyear1", 1) == []
@@ -0,0 +1,101 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+
+sys.path.append(os.path.abspath("data_reshaping"))
+from SchedulerClass import LocalSchedulerClass, PBSSchedulerClass, SlurmSchedulerClass
+from test_reshaper import _write_history, casename
+
+
+def _job(tmp_path, **kwargs):
+    return dict(
+        case=casename,
+        archive_root=str(tmp_path),
+        output_root=str(tmp_path / "output"),
+        stream="pop.h",
+        year=1,
+        **kwargs,
+    )
+
+
+def test_local_scheduler(tmp_path):
+    _write_history(tmp_path)
+    scheduler = LocalSchedulerClass(tmp_path / "scratch", max_jobs=2, retries=1)
+    scheduler.submit(_job(tmp_path))
+    # TAREA does not have a time dimension, so this job always fails
+    scheduler.submit(_job(tmp_path, varnames=["TAREA"]))
+    status = scheduler.wait()
+    assert status["pop.h.0001"] == dict(status="done", attempts=1, error=None)
+    failed = [value for name, value in status.items() if name != "pop.h.0001"][0]
+    assert failed["status"] == "failed"
+    assert failed["attempts"] == 2
+    assert "ValueError" in failed["error"]
+    # scratch directory of the successful job is removed
+    assert not (tmp_path / "scratch" / "pop.h.0001.1").exists()
+
+    # year is marked as done, so it is not run again
+    scheduler = LocalSchedulerClass(tmp_path / "scratch", max_jobs=1)
+    scheduler.submit(_job(tmp_path))
+    assert scheduler.wait()["pop.h.0001"]["attempts"] == 0
+
+
+def test_slurm_command(tmp_path):
+    scheduler = SlurmSchedulerClass(
+        send_mail=False, proc_base=tmp_path, script_dir="scripts", dryrun=True
+    )
+    job = _job(tmp_path)
+    assert scheduler.get_command("pop.h.0001", job) == [
+        "sbatch",
+        "--mail-type=NONE",
+        "--dependency=singleton",
+        os.path.join("scripts", "pop.h_t13.sh"),
+        casename,
+        str(tmp_path),
+        "0001",
+    ]
+    scheduler.submit(job)
+    assert scheduler.wait()["pop.h.0001"]["status"] == "dry-run"
+    (tmp_path / casename / "pop.h" / "proc").mkdir(parents=True)
+    (tmp_path / casename / "pop.h" / "proc" / f".DONE.{casename}.pop.h.0001").touch()
+    assert scheduler.is_done(job)
+
+
+def _fake_qsub(tmp_path, monkeypatch):
+    """
+        Put a qsub on PATH that prints a job id, and appends its arguments to the
+        file it returns (one line per call)
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    args_file = bin_dir / "qsub.args"
+    qsub = bin_dir / "qsub"
+    qsub.write_text(f'#!/bin/sh\necho "$@" >> {args_file}\necho "$$.pbs"\n')
+    qsub.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return args_file
+
+
+def test_pbs_command(tmp_path, monkeypatch):
+    _fake_qsub(tmp_path, monkeypatch)
+    scheduler = PBSSchedulerClass(proc_base=tmp_path, script_dir="scripts")
+    job1 = _job(tmp_path)
+    job2 = dict(job1, year=2)
+    cmd = scheduler.get_command("pop.h.0001", job1)
+    assert "-W" not in cmd
+    scheduler.submit(job1)
+    assert scheduler.wait()["pop.h.0001"]["status"] == "submitted"
+
+    # the second year of the stream waits for the first
+    job_id = scheduler._last_job_id[(casename, "pop.h")]
+    assert job_id.endswith(".pbs")
+    cmd = scheduler.get_command("pop.h.0002", job2)
+    assert cmd[cmd.index("-W") + 1] == f"depend=afterany:{job_id}"
+    assert cmd[-4:] == [
+        os.path.join("scripts", "pop.h_t13.sh"),
+        casename,
+        str(tmp_path),
+        "0002",
+    ]
+    # other streams do not wait
+    assert "-W" not in scheduler.get_command("cice.h.0002", dict(job2, stream="cice.h"))
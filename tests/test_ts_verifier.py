@@ -0,0 +1,108 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import pytest
+import numpy as np
+import xarray as xr
+
+sys.path.append(os.path.abspath(os.path.join("notebooks")))
+from utils.TSVerifierClass import TSVerifierClass
+
+casename = "test_case"
+
+
+def _hist_ds(year, month):
+    time = xr.DataArray(
+        [365.0 * (year - 1) + 31.0 * month],
+        dims="time",
+        attrs={"units": "days since 0001-01-01", "calendar": "noleap"},
+    )
+    values = np.arange(6.0).reshape(1, 2, 3) + 100 * year + month
+    values[0, 0, 0] = np.nan
+    return xr.Dataset(
+        {
+            "PO4": (("time", "nlat", "nlon"), values),
+            "NO3": (("time", "nlat", "nlon"), -values),
+            "time_bound": (("time", "d2"), np.zeros((1, 2))),
+            "TAREA": (("nlat", "nlon"), np.ones((2, 3))),
+        },
+        coords={"time": time},
+    )
+
+
+def _write_case(root, corrupt=False):
+    hist_dir = root / "ocn" / "hist"
+    ts_dir = root / "ocn" / "proc" / "tseries" / "month_1"
+    hist_dir.mkdir(parents=True)
+    ts_dir.mkdir(parents=True)
+    for year in [1, 2]:
+        for month in [1, 2]:
+            _hist_ds(year, month).to_netcdf(
+                hist_dir / f"{casename}.pop.h.{year:04}-{month:02}.nc"
+            )
+    # only PO4 was converted to time series, and only for year 1
+    ds_ts = xr.concat([_hist_ds(1, month)[["PO4"]] for month in [1, 2]], dim="time")
+    if corrupt:
+        ds_ts["PO4"][1, 1, 1] = 0.0
+    ds_ts.to_netcdf(ts_dir / f"{casename}.pop.h.PO4.000101-000112.nc")
+
+
+def test_verify(tmp_path):
+    _write_case(tmp_path)
+    verifier = TSVerifierClass(casename, str(tmp_path), max_workers=1)
+    report = verifier.verify([1, 2], ["pop.h", "cice.h"])
+
+    assert report["status"].to_list() == [
+        "datasets differ",
+        "no time series",
+        "no time series",
+        "no time series",
+    ]
+    entry = report.iloc[0]
+    assert entry["history_files"] == 2
+    # time_bound is excluded, TAREA does not have a time dimension
+    assert entry["vars_checked"] == 2
+    assert entry["missing_vars"] == ["NO3"]
+
+    report = verifier.verify([1], ["pop.h", "cice.h"], skip=[(1, "cice.h")])
+    assert len(report) == 1
+
+
+@pytest.mark.parametrize("corrupt", [True, False])
+def test_verify_contents(tmp_path, corrupt):
+    case_dir = tmp_path / "case"
+    _write_case(case_dir, corrupt)
+    verifier = TSVerifierClass(casename, str(case_dir), max_workers=1)
+    state_file = str(tmp_path / "state.json")
+
+    report = verifier.verify_contents(
+        [1], ["pop.h"], varnames=["PO4"], state_file=state_file, chunk_size=8
+    )
+    assert report["history_file"].to_list() == [
+        f"{casename}.pop.h.0001-01.nc",
+        f"{casename}.pop.h.0001-02.nc",
+    ]
+    if corrupt:
+        assert report["status"].to_list() == ["same", "differ"]
+        assert report["mismatches"].to_list() == [0, 1]
+    else:
+        assert report["status"].to_list() == ["same", "same"]
+
+    # results are read from state_file instead of being computed again
+    os.remove(verifier.get_history_files(1, "pop.h")[0])
+    report_resumed = verifier.verify_contents(
+        [1], ["pop.h"], varnames=["PO4"], state_file=state_file
+    )
+    assert report_resumed.equals(report)
+
+
+def test_verify_contents_sampled(tmp_path):
+    _write_case(tmp_path)
+    verifier = TSVerifierClass(casename, str(tmp_path), max_workers=1)
+
+    report = verifier.verify_contents([1, 2], ["pop.h"], files_per_year=1)
+    assert len(set(report["history_file"])) == 2
+    # NO3 does not have time series, and there are no time series for year 2
+    assert set(report.loc[report["year"] == 1, "status"]) == {"same", "no time series"}
+    assert set(report.loc[report["year"] == 2, "status"]) == {"no time series"}
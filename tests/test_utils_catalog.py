@@ -0,0 +1,87 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import pytest
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join("notebooks", "utils")))
+from utils_catalog import read_plot_catalog, write_plot_catalog_parquet
+
+
+def _df_ex():
+    rows = []
+    for casename in ["case1", "case2"]:
+        for varname in ["NO3", "PO4", "SiO3"]:
+            for date in ["0001-01-16", "0001-02-15"]:
+                rows.append(
+                    dict(
+                        plot_type="summary_map",
+                        varname=varname,
+                        casename=casename,
+                        apply_log10=False,
+                        sel_dict={},
+                        filepath=f"summary_map/{varname}.{date}.png",
+                        date=date,
+                    )
+                )
+            rows.append(
+                dict(
+                    plot_type="time_series",
+                    varname=varname,
+                    casename=casename,
+                    time_period="0001-01-01_0001-12-31",
+                    sel_dict={},
+                    filepath=f"time_series/{varname}.0001-01-01_0001-12-31.png",
+                )
+            )
+    return pd.DataFrame(rows)
+
+
+def test_write_plot_catalog_parquet(tmp_path):
+    paths = write_plot_catalog_parquet(_df_ex(), tmp_path, row_group_size=2)
+    assert len(paths) == 4
+    assert paths[0] == (
+        f"{tmp_path}/case1/png_catalog.parquet/plot_type=summary_map/part-0.parquet"
+    )
+
+
+@pytest.mark.parametrize(
+    "casename, plot_type, filters, nrows",
+    [
+        ("case1", "summary_map", dict(), 6),
+        (["case1", "case2"], "summary_map", dict(varname="PO4"), 4),
+        ("case2", "summary_map", dict(varname=["NO3", "PO4"], date="0001-02-15"), 2),
+        # date ranges include both ends, and can be open-ended
+        ("case1", "summary_map", dict(date=("0001-01-01", "0001-01-31")), 3),
+        ("case1", "summary_map", dict(date=("0001-01-16", "0001-02-15")), 6),
+        ("case1", "summary_map", dict(varname="NO3", date=("0001-02-01", None)), 1),
+        ("case1", "summary_map", dict(date=(None, "0001-01-15")), 0),
+        # time series do not have a date column, so date filter is ignored
+        ("case1", ["summary_map", "time_series"], dict(date="0001-01-16"), 6),
+        # missing cases / plot types are skipped
+        ("case3", "summary_map", dict(), 0),
+    ],
+)
+def test_read_plot_catalog(tmp_path, casename, plot_type, filters, nrows):
+    write_plot_catalog_parquet(_df_ex(), tmp_path, row_group_size=2)
+    df = read_plot_catalog(tmp_path, casename, plot_type, **filters)
+    assert len(df) == nrows
+    if nrows:
+        assert df["sel_dict"].to_list() == ["{}"] * nrows
+        if "varname" in filters:
+            assert df["varname"].isin(pd.Series(filters["varname"])).all()
+        if isinstance(filters.get("date"), tuple):
+            date_beg, date_end = filters["date"]
+            assert (df["date"] >= (date_beg or "")).all()
+            assert (df["date"] <= (date_end or "9999")).all()
+
+
+def test_read_plot_catalog_empty(tmp_path):
+    write_plot_catalog_parquet(_df_ex(), tmp_path)
+    # an empty catalog still has the columns callers use
+    df = read_plot_catalog(tmp_path, "case3", "summary_map")
+    assert len(df) == 0
+    assert {"casename", "filepath"} <= set(df.columns)
+    df = read_plot_catalog(tmp_path, "case3", "summary_map", columns=["varname"])
+    assert list(df.columns) == ["varname"]
@@ -0,0 +1,104 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join("notebooks")))
+from utils import utils_grid
+from utils.CaseClass import CaseClass
+from utils.utils_grid import find_nearest_cells, format_lat_lon, get_grid_key
+from case_tree_ex import gen_grid_ds, write_case_tree
+
+
+def _brute_force(TLAT, TLONG, lat, lon):
+    """index of the cell with the largest dot product with (lat, lon)"""
+    xyz = utils_grid.latlon_to_xyz(TLAT, TLONG)
+    dot = xyz @ utils_grid.latlon_to_xyz(lat, lon)
+    return np.unravel_index(np.argmax(dot), TLAT.shape)
+
+
+def test_find_nearest_cells(tmp_path):
+    grid_ds = gen_grid_ds((30, 40, 1))
+    # distort the grid, so it is curvilinear
+    TLAT = grid_ds["TLAT"].values + 2.0 * np.sin(np.deg2rad(grid_ds["TLONG"].values))
+    TLONG = grid_ds["TLONG"].values
+    rng = np.random.default_rng(1)
+    lat = rng.uniform(-80.0, 89.0, 50)
+    lon = rng.uniform(-180.0, 360.0, 50)
+
+    nlat, nlon, dist_km = find_nearest_cells(TLAT, TLONG, lat, lon, cache_dir=tmp_path)
+    assert nlat.shape == nlon.shape == dist_km.shape == (50,)
+    for n in range(50):
+        assert (nlat[n], nlon[n]) == _brute_force(TLAT, TLONG, lat[n], lon[n])
+    assert (dist_km >= 0).all()
+
+    # a cell center is 0 km from itself
+    nlat, nlon, dist_km = find_nearest_cells(
+        TLAT, TLONG, TLAT[12, 7], TLONG[12, 7], cache_dir=tmp_path
+    )
+    assert (int(nlat), int(nlon)) == (12, 7)
+    assert dist_km < 1e-3
+
+
+def test_grid_tree_cache(tmp_path):
+    grid_ds = gen_grid_ds((10, 12, 1))
+    TLAT, TLONG = grid_ds["TLAT"], grid_ds["TLONG"]
+    key = get_grid_key(TLAT, TLONG)
+    utils_grid._trees.pop(key, None)
+    tree, cells = utils_grid.get_grid_tree(TLAT, TLONG, cache_dir=tmp_path)
+    assert os.path.isfile(tmp_path / f"grid_tree.{key}.pkl")
+
+    # a new session reads the tree from disk instead of building it
+    utils_grid._trees.pop(key)
+    tree_from_disk, cells_from_disk = utils_grid.get_grid_tree(
+        TLAT, TLONG, cache_dir=tmp_path
+    )
+    assert (tree_from_disk.data == tree.data).all()
+    assert (cells_from_disk == cells).all()
+    assert utils_grid.get_grid_tree(TLAT, TLONG, cache_dir=tmp_path)[0] is (
+        tree_from_disk
+    )
+
+    # a different grid (or mask) has a different key
+    assert get_grid_key(TLAT + 1.0, TLONG) != key
+    assert get_grid_key(TLAT, TLONG, grid_ds["KMT"] > 0) != key
+
+
+def test_find_nearest_cells_mask(tmp_path):
+    grid_ds = gen_grid_ds((10, 12, 3))
+    ocean = grid_ds["KMT"].values > 0
+    land_nlat, land_nlon = np.argwhere(~ocean)[0]
+    lat = grid_ds["TLAT"].values[land_nlat, land_nlon]
+    lon = grid_ds["TLONG"].values[land_nlat, land_nlon]
+    nlat, nlon, dist_km = find_nearest_cells(
+        grid_ds["TLAT"], grid_ds["TLONG"], lat, lon, mask=ocean, cache_dir=tmp_path
+    )
+    assert ocean[nlat, nlon]
+    assert dist_km > 0
+
+
+def test_case_find_nearest_cells(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils_grid, "_default_cache_dir", str(tmp_path / "cache"))
+    write_case_tree(tmp_path / "case", "test_case", nyears=1)
+    case = CaseClass("test_case", str(tmp_path / "case"))
+    grid_ds = gen_grid_ds()
+    ocean = grid_ds["KMT"].values > 0
+    lat = grid_ds["TLAT"].values[ocean]
+    lon = grid_ds["TLONG"].values[ocean]
+    nlat, nlon, _ = case.find_nearest_cells(lat, lon)
+    assert (nlat == np.nonzero(ocean)[0]).all()
+    assert (nlon == np.nonzero(ocean)[1]).all()
+
+
+@pytest.mark.parametrize(
+    "lat, lon, expected",
+    [
+        (-12.0, 334.5, "25.50 W, 12.00 S"),
+        (30.25, 20.0, "20.00 E, 30.25 N"),
+        (0.0, -90.0, "90.00 W, 0.00 N"),
+    ],
+)
+def test_format_lat_lon(lat, lon, expected):
+    assert format_lat_lon(lat, lon) == expected
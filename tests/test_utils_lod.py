@@ -0,0 +1,57 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import pytest
+import numpy as np
+import xarray as xr
+
+sys.path.append(os.path.abspath(os.path.join("notebooks")))
+from utils.utils_lod import coarsen_for_display, get_lod_factors
+
+
+def _da_ex(apply_chunk):
+    values = np.arange(35.0).reshape(5, 7)
+    values[0, 0] = np.nan
+    values[1, 0] = -100.0
+    values[3:, 3:] = np.nan
+    da = xr.DataArray(values, dims=("nlat", "nlon"), name="var_ex")
+    da.attrs["units"] = "kg"
+    if apply_chunk:
+        da = da.chunk({"nlat": 2})
+    return da
+
+
+def test_get_lod_factors():
+    assert get_lod_factors((2400, 3600), figsize=(6.0, 4.0), dpi=72) == (8, 8)
+    assert get_lod_factors((10, 10), figsize=(6.0, 4.0), dpi=72) == (1, 1)
+
+
+@pytest.mark.parametrize("apply_chunk", [True, False])
+def test_coarsen_mean(apply_chunk):
+    da = _da_ex(apply_chunk)
+    weights = xr.DataArray(np.ones((5, 7)), dims=("nlat", "nlon"))
+    weights[1, 1] = 3.0
+
+    da_out = coarsen_for_display(da, weights, factors=(2, 3))
+
+    assert da_out.attrs == da.attrs
+    assert da_out.name == da.name
+    assert da_out.shape == (3, 3)
+    # index coordinates are at center of each block
+    assert np.all(da_out["nlat"].values == [0.5, 2.5, 4.0])
+    # NaNs are not included in mean, weights are applied
+    assert da_out.values[0, 0] == (1.0 + 2.0 - 100.0 + 3.0 * 8.0 + 9.0) / 7.0
+    # all-NaN blocks stay NaN
+    assert np.isnan(da_out.values[2, 2])
+
+
+@pytest.mark.parametrize("apply_chunk", [True, False])
+def test_coarsen_maxabs(apply_chunk):
+    da = _da_ex(apply_chunk)
+
+    da_out = coarsen_for_display(da, method="maxabs", factors=(2, 3))
+
+    assert da_out.values[0, 0] == -100.0
+    assert da_out.values[0, 1] == 12.0
+    assert np.isnan(da_out.values[2, 2])
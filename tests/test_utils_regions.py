@@ -0,0 +1,118 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join("notebooks")))
+from utils.CaseClass import CaseClass
+from utils.Plotting import summary_plot_global_ts
+from utils.PlotSuiteClass import PlotSuiteClass
+from utils.utils_regions import REGION_VARS, get_regions, reduce_regions
+from case_tree_ex import write_case_tree
+
+casename = "test_case"
+regions = [
+    "Global",
+    "Tropics",
+    dict(name="Bands 1-3", region_mask=[1, 2, 3]),
+    # crosses the dateline, with longitudes in [-180, 180]
+    dict(name="Box", polygon=[[-100, -60], [100, -60], [100, 60], [-100, 60]]),
+]
+
+
+@pytest.fixture(scope="module")
+def ds(tmp_path_factory):
+    root = tmp_path_factory.mktemp("case")
+    write_case_tree(root, casename, grid=(20, 24, 3), nyears=1)
+    case = CaseClass(casename, str(root))
+    return case.gen_dataset(
+        ["PO4", "NO3"], "pop.h", start_year=1, end_year=1, vars_to_keep=REGION_VARS
+    )
+
+
+def _region_masks(ds):
+    lat = ds["TLAT"]
+    lon = ds["TLONG"]
+    return [
+        ds["TAREA"].notnull(),
+        (lat >= -20) & (lat <= 20),
+        ds["REGION_MASK"].isin([1, 2, 3]),
+        (abs(lat) < 60) & ((lon < 100) | (lon > 260)),
+    ]
+
+
+@pytest.mark.parametrize("varname", ["PO4", "NO3"])
+def test_reduce_regions(ds, varname):
+    da = ds[varname]
+    mean, integral = reduce_regions(da, ds, regions)
+    assert mean.dims == da.dims[:-2] + ("region",)
+    assert list(mean["region"].values) == ["Global", "Tropics", "Bands 1-3", "Box"]
+    assert integral.attrs["units"] == f"{da.attrs['units']} cm^2"
+    mean = mean.compute()
+    integral = integral.compute()
+
+    for region_ind, mask in enumerate(_region_masks(ds)):
+        weights = ds["TAREA"].where(mask).fillna(0)
+        da_weighted = da.weighted(weights)
+        np.testing.assert_allclose(
+            mean.isel(region=region_ind), da_weighted.mean(dim=da.dims[-2:]), rtol=1e-5
+        )
+        np.testing.assert_allclose(
+            integral.isel(region=region_ind),
+            da_weighted.sum(dim=da.dims[-2:]),
+            rtol=1e-5,
+        )
+
+
+def test_reduce_regions_changing_mask(ds):
+    # e.g. sea ice: missing values differ between time levels
+    da = ds["NO3"].load()
+    da[0, :10, :] = np.nan
+    mean, _ = reduce_regions(da, ds, ["Global"])
+    weights = ds["TAREA"].fillna(0)
+    expected = da.weighted(weights).mean(dim=da.dims[-2:])
+    np.testing.assert_allclose(mean.isel(region=0), expected, rtol=1e-5)
+
+
+def test_get_regions_errors(ds):
+    with pytest.raises(ValueError):
+        get_regions(["Atlantis"])
+    with pytest.raises(ValueError):
+        get_regions([dict(lat_range=[0, 10])])
+    with pytest.raises(ValueError):
+        get_regions([dict(name="bad", lon_range=[0, 10])])
+    with pytest.raises(ValueError):
+        reduce_regions(ds["NO3"], ds.drop_vars("REGION_MASK"), ["Global"])
+
+
+def test_summary_plot_regions(tmp_path):
+    write_case_tree(tmp_path / "case", casename, nyears=1)
+    case = CaseClass(casename, str(tmp_path / "case"))
+    diag_metadata_list = [
+        dict(varname="NO3", spatial_op="integrate", regions=["Global", "Pacific"]),
+    ]
+
+    def plot_func(ds, diag_metadata):
+        summary_plot_global_ts(
+            ds,
+            ds[diag_metadata["varname"]],
+            diag_metadata,
+            time_coarsen_len=6,
+            save_pngs=True,
+            root_dir=str(tmp_path / "images"),
+        )
+
+    # PlotSuiteClass keeps the grid variables needed for regions
+    suite = PlotSuiteClass(
+        case, diag_metadata_list, plot_func, start_year=1, end_year=1
+    )
+    suite.run(sample_memory=False)
+    pngs = [
+        filename
+        for _, _, filenames in os.walk(tmp_path / "images")
+        for filename in filenames
+        if filename.endswith(".png")
+    ]
+    assert len(pngs) == 1
@@ -0,0 +1,114 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import dask
+import numpy as np
+import pytest
+import xarray as xr
+
+sys.path.append(os.path.abspath(os.path.join("notebooks")))
+from utils.Plotting import _coarsen_time
+from utils.utils_time import get_time_weights, temporal_mean, temporal_means
+from xr_ds_ex import days_1yr, xr_ds_ex
+
+
+def _ds(nyrs=3, decode_times=True):
+    ds = xr_ds_ex(decode_times=decode_times, nyrs=nyrs, var_const=False)
+    # add a spatial dim, to check fields are averaged point by point
+    ds["var_2d"] = ds["var_ex"] * xr.DataArray([1.0, 2.0, 3.0], dims="x")
+    return ds
+
+
+@pytest.mark.parametrize("decode_times", [True, False])
+def test_annual(decode_times):
+    ds = _ds(decode_times=decode_times)
+    np.testing.assert_allclose(get_time_weights(ds["time_bounds"]), ds["days_in_month"])
+    annual = temporal_mean(ds["var_2d"], ds["time_bounds"], "annual")
+    assert annual.dims == ("time", "x")
+    assert list(annual["year"].values) == [1, 2, 3]
+    values = ds["var_2d"].values.reshape(3, 12, 3)
+    expected = np.einsum("ymx,m->yx", values, days_1yr) / 365.0
+    np.testing.assert_allclose(annual, expected, rtol=1e-6)
+    # time is the middle of each year
+    assert annual["time"].values[0].strftime("%m-%d") == "07-02"
+
+
+def test_partial_years():
+    ds = _ds().isel(time=slice(6, 30))
+    annual = temporal_mean(ds["var_ex"], ds["time_bounds"], "annual")
+    assert list(annual["year"].values) == [2]
+    annual = temporal_mean(ds["var_ex"], ds["time_bounds"], "annual", min_coverage=0)
+    assert list(annual["year"].values) == [1, 2, 3]
+    values = ds["var_ex"].values[:6]
+    np.testing.assert_allclose(
+        annual.values[0], np.sum(values * days_1yr[6:]) / np.sum(days_1yr[6:])
+    )
+
+
+def test_seasonal_and_climatology():
+    ds = _ds()
+    values = ds["var_ex"].values
+    means = temporal_means(ds["var_ex"], ds["time_bounds"], ["seasonal", "climatology"])
+
+    seasonal = means["seasonal"]
+    # DJF of year 1 is missing December of year 0, DJF of year 4 is only December
+    assert seasonal["season"].values[0] == "MAM"
+    assert seasonal["season"].values[-1] == "SON"
+    assert len(seasonal["time"]) == 4 * 3 - 1
+    djf = seasonal.where(seasonal["season"] == "DJF", drop=True)
+    assert list(djf["year"].values) == [2, 3]
+    expected = (31 * values[11] + 31 * values[12] + 28 * values[13]) / 90.0
+    np.testing.assert_allclose(djf.values[0], expected, rtol=1e-6)
+
+    climatology = means["climatology"]
+    assert list(climatology["month"].values) == list(range(1, 13))
+    np.testing.assert_allclose(
+        climatology.values, values.reshape(3, 12).mean(axis=0), rtol=1e-6
+    )
+
+
+def test_missing_values():
+    ds = _ds()
+    da = ds["var_ex"].copy()
+    da[1] = np.nan
+    annual = temporal_mean(da, ds["time_bounds"], "annual")
+    weights = days_1yr.copy()
+    weights[1] = 0.0
+    expected = np.sum(np.nan_to_num(da.values[:12]) * weights) / np.sum(weights)
+    np.testing.assert_allclose(annual.values[0], expected, rtol=1e-6)
+
+
+def test_lazy_single_pass():
+    ds = _ds()
+    da = ds["var_2d"].chunk({"time": 12, "x": 1})
+    means = temporal_means(da, ds["time_bounds"])
+    assert all(isinstance(mean.data, dask.array.Array) for mean in means.values())
+    computed = dask.compute(*means.values())
+    expected = temporal_means(ds["var_2d"], ds["time_bounds"])
+    for mean, freq in zip(computed, means):
+        xr.testing.assert_allclose(mean, expected[freq])
+
+
+def test_bad_freq():
+    ds = _ds()
+    with pytest.raises(ValueError):
+        temporal_mean(ds["var_ex"], ds["time_bounds"], "decadal")
+
+
+def test_coarsen_time():
+    ds = _ds()
+    da = ds["var_ex"]
+    # 12 monthly levels: annual means weighted by month length
+    annual = _coarsen_time(ds, da, 12)
+    xr.testing.assert_allclose(annual, temporal_mean(da, ds["time_bounds"], "annual"))
+    # other lengths average blocks of time levels
+    coarse = _coarsen_time(ds, da, 6)
+    assert coarse.sizes["time"] == 6
+    np.testing.assert_allclose(coarse.values, da.values.reshape(6, 6).mean(axis=1))
+    # time bounds of a time slice of ds are used
+    da_slice = da.isel(time=slice(12, None))
+    annual = _coarsen_time(ds, da_slice, 12)
+    np.testing.assert_allclose(
+        annual.values, temporal_mean(da, ds["time_bounds"]).values[1:]
+    )
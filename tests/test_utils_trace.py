@@ -0,0 +1,56 @@
+#! /usr/bin/env python3
+
+import json
+import os
+import sys
+import dask.array
+
+sys.path.append(os.path.abspath(os.path.join("notebooks")))
+from utils import utils_trace
+from utils.utils_trace import span, traced
+
+
+@traced()
+def _read_file(filename):
+    with open(filename) as fp:
+        return fp.read()
+
+
+def test_tracing(tmp_path):
+    filename = tmp_path / "file.txt"
+    filename.write_text("x" * 1000)
+    trace_file = tmp_path / "trace.json"
+
+    utils_trace.reset_trace()
+    # nothing is recorded while tracing is disabled; the first dask compute
+    # imports modules lazily, and those files would be counted below
+    assert _read_file(filename) == "x" * 1000
+    dask.array.ones(4, chunks=1).sum().compute(scheduler="sync")
+    with span("outer"):
+        pass
+    assert utils_trace.get_trace_summary().empty
+
+    with utils_trace.tracing(trace_file):
+        with span("outer", step=1):
+            _read_file(filename)
+            _read_file(filename)
+            with span("compute"):
+                dask.array.ones(4, chunks=1).sum().compute(scheduler="sync")
+
+    summary = utils_trace.get_trace_summary()
+    assert summary.index.to_list()[0] == "outer"
+    assert summary.loc["_read_file", "calls"] == 2
+    assert summary.loc["_read_file", "file_opens"] == 2
+    assert summary.loc["outer", "file_opens"] == 2
+    assert summary.loc["compute", "dask_tasks"] > 0
+    assert summary.loc["outer", "self_s"] < summary.loc["outer", "total_s"]
+
+    with open(trace_file) as fp:
+        events = json.load(fp)["traceEvents"]
+    assert len(events) == 4
+    outer = [event for event in events if event["name"] == "outer"][0]
+    assert outer["ph"] == "X"
+    assert outer["args"]["step"] == 1
+    # spans end before the spans they are nested in
+    assert events[-1]["name"] == "outer"
+    utils_trace.reset_trace()
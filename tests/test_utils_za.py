@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join("notebooks")))
+from utils import utils_za
+from utils.CaseClass import CaseClass
+from utils.utils_za import get_za_matrix, zonal_average, zonal_average_dataset
+from case_tree_ex import gen_grid_ds, write_case_tree
+
+casename = "test_case"
+basins = dict(Global=None, West=[1, 2, 3], East=[4, 5, 6])
+lat_edges = np.linspace(-90.0, 90.0, 7)
+
+
+def _brute_force(values, grid_ds, region_vals, lat_beg, lat_end):
+    """area-weighted mean of values (nlat, nlon) over one basin and latitude bin"""
+    lat = grid_ds["TLAT"].values
+    region_mask = grid_ds["REGION_MASK"].values
+    in_basin = (
+        region_mask > 0 if region_vals is None else np.isin(region_mask, region_vals)
+    )
+    cells = in_basin & (lat >= lat_beg) & (lat < lat_end) & np.isfinite(values)
+    if not cells.any():
+        return np.nan
+    area = grid_ds["TAREA"].values[cells]
+    return np.sum(area * values[cells]) / np.sum(area)
+
+
+@pytest.fixture(scope="module")
+def ds(tmp_path_factory):
+    root = tmp_path_factory.mktemp("case")
+    write_case_tree(root, casename, grid=(20, 24, 3), nyears=1)
+    case = CaseClass(casename, str(root))
+    return case.gen_dataset(
+        ["PO4", "NO3"],
+        "pop.h",
+        start_year=1,
+        end_year=1,
+        vars_to_keep=["TLAT", "REGION_MASK"],
+    )
+
+
+@pytest.mark.parametrize("varname", ["PO4", "NO3"])
+def test_zonal_average(ds, varname):
+    grid_ds = gen_grid_ds((20, 24, 3))
+    da_za = zonal_average(
+        ds[varname],
+        ds["TLAT"],
+        ds["TAREA"],
+        ds["REGION_MASK"],
+        lat_edges=lat_edges,
+        basins=basins,
+        cache_dir=False,
+    )
+    assert da_za.dims == ds[varname].dims[:-2] + ("basins", "lat_t")
+    assert list(da_za["basins"].values) == list(basins)
+    np.testing.assert_allclose(da_za["lat_t"], [-75, -45, -15, 15, 45, 75])
+    assert da_za.attrs["units"] == ds[varname].attrs["units"]
+    da_za = da_za.compute()
+
+    values = ds[varname].isel(time=3).values
+    if values.ndim == 2:
+        values = values[np.newaxis]
+    for z_ind, slab in enumerate(values):
+        for basin_ind, region_vals in enumerate(basins.values()):
+            for lat_ind in range(len(lat_edges) - 1):
+                expected = _brute_force(
+                    slab, grid_ds, region_vals, *lat_edges[lat_ind : lat_ind + 2]
+                )
+                isel_dict = dict(time=3, basins=basin_ind, lat_t=lat_ind)
+                if "z_t" in da_za.dims:
+                    isel_dict["z_t"] = z_ind
+                np.testing.assert_allclose(
+                    da_za.isel(isel_dict).values, expected, rtol=1e-5
+                )
+
+
+def test_za_matrix_cache(ds, tmp_path):
+    args = (ds["TLAT"], ds["TAREA"], ds["REGION_MASK"], lat_edges, basins)
+    utils_za._matrices.clear()
+    matrix, _, basin_names = get_za_matrix(*args, cache_dir=tmp_path)
+    assert basin_names == list(basins)
+    assert matrix.shape == (3 * 6, 20 * 24)
+    cache_files = list(tmp_path.glob("za_matrix.*.npz"))
+    assert len(cache_files) == 1
+
+    # a new session reads the matrix from disk instead of building it
+    utils_za._matrices.clear()
+    matrix_from_disk, _, _ = get_za_matrix(*args, cache_dir=tmp_path)
+    assert (matrix_from_disk != matrix).nnz == 0
+    assert get_za_matrix(*args, cache_dir=tmp_path)[0] is matrix_from_disk
+
+    # different bins are a different matrix
+    matrix_4bins, _, _ = get_za_matrix(
+        *args[:3], np.linspace(-90.0, 90.0, 5), basins, cache_dir=tmp_path
+    )
+    assert matrix_4bins.shape == (3 * 4, 20 * 24)
+
+
+def test_zonal_average_dataset(ds):
+    ds_za = zonal_average_dataset(ds, basins=basins, cache_dir=False)
+    assert sorted(ds_za.data_vars) == ["NO3", "PO4", "time_bound"]
+    assert ds_za.attrs["title"] == casename
+    assert ds_za["PO4"].dims == ("time", "z_t", "basins", "lat_t")
+    assert ds_za.sizes["lat_t"] == 20
+
+    with pytest.raises(ValueError):
+        zonal_average_dataset(ds.drop_vars("REGION_MASK"))